@@ -0,0 +1,4 @@
+from bench.runner import compare, run
+from bench.slates import sizes, write_slate
+
+__all__ = ["compare", "run", "sizes", "write_slate"]
@@ -0,0 +1,349 @@
+import glob
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import profiler
+from bench.slates import sizes, write_slate
+
+src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+baseline_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+# the processes a bench runs, in order, and whether they need a showdown slate
+processes = {"opto": False, "sd_opto": True, "sim": False, "sd_sim": True}
+
+# the module each process imports on top of main.py
+engines = {
+    "opto": "nfl_optimizer",
+    "sd_opto": "nfl_showdown_optimizer",
+    "sim": "nfl_gpp_simulator",
+    "sd_sim": "nfl_showdown_simulator",
+}
+
+# seconds a process may spend importing main.py and its engine, see --import-budget.
+# scheduled jobs run many short processes and pay it on every one
+import_budget = 1.0
+import_repeats = 5
+
+# how far a stage's throughput may drop and a process's peak memory grow against the
+# baseline, unless the baseline or --max-slowdown and --max-memory-growth set their own.
+# the baselines kept in the repository come from another machine and save looser ones
+tolerances = {"max_slowdown": 0.25, "max_memory_growth": 0.25}
+
+# stages quicker than this in the baseline are left out of the comparison, and a slower
+# stage only regresses once it takes at least this much longer, below that it's noise
+min_stage_seconds = 0.1
+
+
+def default_processes(baseline_path, save_baseline):
+    # the processes the baseline covers, so a plain bench compares all of them, or every
+    # process when there's no baseline yet or a new one is being saved
+    if save_baseline or not os.path.exists(baseline_path):
+        return list(processes)
+    with open(baseline_path) as f:
+        covered = json.load(f)["processes"]
+    return [name for name in processes if name in covered]
+
+
+def slate_params(size, options):
+    # a named size with any of its numbers overridden by options, e.g. --field-size 2000
+    if size not in sizes:
+        sys.exit("Unknown bench size {}, use one of {}".format(size, ", ".join(sizes)))
+    params = dict(sizes[size])
+    for name in params:
+        if name in options:
+            params[name] = int(options[name])
+    return params
+
+
+def process_arguments(process, params):
+    # positional arguments main.py gets for each process
+    if process in ("opto", "sd_opto"):
+        return [str(params["lineups"]), "3"]
+    # the contest structure of the made-up slate has the field size and payouts
+    return ["cid", str(params["iterations"])]
+
+
+def make_workspace(directory, site, params, showdown, seed):
+    # a copy of src/ next to its own config, data and output folders, so a run reads the
+    # made-up slate and writes its output there instead of over the real ones
+    os.makedirs(os.path.join(directory, "src"), exist_ok=True)
+    os.makedirs(os.path.join(directory, "output"), exist_ok=True)
+    for path in glob.glob(os.path.join(src_dir, "*.py")):
+        shutil.copy(path, os.path.join(directory, "src"))
+    write_slate(directory, site, showdown=showdown, seed=seed, **params)
+    return directory
+
+
+def run_process(workspace, site, process, params, seed):
+    # one run of main.py in its own python process, so each starts cold and has its own
+    # peak memory (and isn't profiled along with a profiled bench), returns its timings
+    # report or None when it failed
+    command = [sys.executable, "main.py", site, process]
+    command += process_arguments(process, params) + ["--seed", str(seed)]
+    log_path = os.path.join(workspace, "{}.log".format(process))
+    with open(log_path, "a") as log:
+        result = subprocess.run(
+            command,
+            cwd=os.path.join(workspace, "src"),
+            env=profiler.child_environment(),
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+    if result.returncode != 0:
+        print("{} failed, its output is in {}".format(process, log_path))
+        return None
+    path = os.path.join(workspace, "output", "{}_{}_timings.json".format(site, process))
+    with open(path) as f:
+        return json.load(f)
+
+
+def import_seconds(workspace, process):
+    # best of a few fresh interpreters importing main.py and the process's engine, the time
+    # a run spends before it starts on the slate. None when the imports fail
+    code = (
+        "import time; start = time.perf_counter(); import main, {}; "
+        "print(time.perf_counter() - start)"
+    ).format(engines[process])
+    times = []
+    for _ in range(import_repeats):
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=os.path.join(workspace, "src"),
+            env=profiler.child_environment(),
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            print("importing {} failed:\n{}".format(engines[process], result.stderr))
+            return None
+        times.append(float(result.stdout.split()[-1]))
+    return min(times)
+
+
+def best_of(reports):
+    # fastest of repeated runs of a process, stage by stage
+    best = {"total": None, "stages": {}}
+    for report in reports:
+        if best["total"] is None or (
+            report["total"]["wall_seconds"] < best["total"]["wall_seconds"]
+        ):
+            best["total"] = report["total"]
+        for stage in report["stages"]:
+            name = stage.pop("stage")
+            kept = best["stages"].get(name)
+            if kept is None or stage["wall_seconds"] < kept["wall_seconds"]:
+                best["stages"][name] = stage
+    return best
+
+
+def machine():
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+    }
+
+
+def compare(report, baseline, max_slowdown, max_memory_growth):
+    """Rows of (process, stage, metric, baseline, current, change, regressed).
+
+    Throughput is items per second where a stage counts its items and one over wall time
+    where it doesn't, change is the relative gain, so a stage that got 30% slower has a
+    change of about -0.3 and regresses with max_slowdown below that (if it's also at least
+    min_stage_seconds slower). Peak memory of each process and of its workers regresses
+    when it grew by more than max_memory_growth."""
+    rows = []
+    for process, base in baseline["processes"].items():
+        current = report["processes"].get(process)
+        if current is None:
+            continue
+        before, after = base.get("import_seconds"), current.get("import_seconds")
+        if before and after:
+            change = before / after - 1
+            regressed = change < -max_slowdown and after - before >= min_stage_seconds
+            rows.append(
+                (process, "import", "seconds", before, after, change, regressed)
+            )
+        for name, stage in base["stages"].items():
+            now = current["stages"].get(name)
+            if now is None or stage["wall_seconds"] < min_stage_seconds:
+                continue
+            if stage.get("items_per_second") and now.get("items_per_second"):
+                metric = "items/s"
+                before, after = stage["items_per_second"], now["items_per_second"]
+                change = after / before - 1
+            else:
+                metric = "seconds"
+                before, after = stage["wall_seconds"], now["wall_seconds"]
+                change = before / max(after, 1e-9) - 1
+            regressed = (
+                change < -max_slowdown
+                and now["wall_seconds"] - stage["wall_seconds"] >= min_stage_seconds
+            )
+            rows.append((process, name, metric, before, after, change, regressed))
+        for metric in ("peak_rss_mb", "peak_worker_rss_mb"):
+            before = base["total"].get(metric)
+            after = current["total"].get(metric)
+            if not before or after is None:
+                continue
+            change = after / before - 1
+            regressed = change > max_memory_growth
+            rows.append((process, "total", metric, before, after, change, regressed))
+    return rows
+
+
+def print_comparison(rows):
+    print(
+        "{:<8} {:<20} {:<18} {:>12} {:>12} {:>8}".format(
+            "process", "stage", "metric", "baseline", "current", "change"
+        )
+    )
+    for process, name, metric, before, after, change, regressed in rows:
+        print(
+            "{:<8} {:<20} {:<18} {:>12.3f} {:>12.3f} {:>+7.1%}{}".format(
+                process,
+                name,
+                metric,
+                before,
+                after,
+                change,
+                "  REGRESSION" if regressed else "",
+            )
+        )
+
+
+def run(site, size="small", options=None):
+    """Benchmarks the optimizers and simulators on a made-up slate of the given size.
+
+    Every process runs from a throwaway copy of src/ on the same seed, so repeated benches
+    do the same work, the best of `--repeats` runs of each is kept. The report is written
+    to output/, compared to the saved baseline for that site and size when there is one
+    (or saved as it with `--save-baseline`, along with the tolerances given). The time
+    each process takes to import what it needs is measured too and has to stay within
+    `--import-budget` seconds. Returns whether every process ran without regressing or
+    going over the budget. Without `--processes` it runs the processes the baseline
+    covers, or all of them when there's no baseline or a new one is being saved."""
+    options = options or {}
+    params = slate_params(size, options)
+    seed = int(options.get("seed", 1))
+    # the first run of a process compiles the numba kernels into the workspace's cache,
+    # the best of two is with them cached like any run after the first
+    repeats = int(options.get("repeats", 2))
+    baseline_path = os.path.join(baseline_dir, "{}_{}.json".format(site, size))
+    if "processes" in options:
+        names = options["processes"].split(",")
+    else:
+        names = default_processes(baseline_path, options.get("save_baseline"))
+    budget = float(options.get("import_budget", import_budget))
+
+    workspace = options.get("workspace") or tempfile.mkdtemp(prefix="nfl_bench_")
+    report = {
+        "site": site,
+        "size": size,
+        "params": params,
+        "seed": seed,
+        "repeats": repeats,
+        "import_budget": budget,
+        "machine": machine(),
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "processes": {},
+    }
+    failed = False
+    for process in names:
+        if process not in processes:
+            sys.exit(
+                "Unknown bench process {}, use any of {}".format(
+                    process, ", ".join(processes)
+                )
+            )
+        showdown = processes[process]
+        directory = make_workspace(
+            os.path.join(workspace, "showdown" if showdown else "classic"),
+            site,
+            params,
+            showdown,
+            seed,
+        )
+        print("benchmarking {} {} ({})".format(site, process, size))
+        startup = import_seconds(directory, process)
+        if startup is None:
+            failed = True
+            continue
+        reports = []
+        for _ in range(repeats):
+            timings = run_process(directory, site, process, params, seed)
+            if timings is None:
+                failed = True
+                break
+            reports.append(timings)
+        if reports:
+            report["processes"][process] = best_of(reports)
+            report["processes"][process]["import_seconds"] = startup
+    if failed:
+        print("bench workspace kept in " + workspace)
+    elif not options.get("workspace"):
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    path = os.path.join(src_dir, "../output/{}_bench_{}.json".format(site, size))
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print("bench report written to " + path)
+
+    # a process that failed is left out of the comparison rather than stopping it, the
+    # bench still fails, but the others are checked too. a baseline is never saved from one
+    if failed and options.get("save_baseline"):
+        print("not saving a baseline with failed processes")
+        return False
+    within_budget = True
+    for process, result in report["processes"].items():
+        print("{} imports in {:.2f}s".format(process, result["import_seconds"]))
+        if result["import_seconds"] > budget:
+            print("  over the {:.2f}s import budget".format(budget))
+            within_budget = False
+    if options.get("save_baseline"):
+        report["tolerances"] = {
+            name: float(options.get(name, default))
+            for name, default in tolerances.items()
+        }
+        os.makedirs(baseline_dir, exist_ok=True)
+        with open(baseline_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print("saved as the baseline in " + baseline_path)
+        return within_budget
+    if not os.path.exists(baseline_path):
+        print("no baseline for {} {}, save one with --save-baseline".format(site, size))
+        return within_budget and not failed
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    if (baseline["params"], baseline["seed"], baseline["repeats"]) != (
+        params,
+        seed,
+        repeats,
+    ):
+        print(
+            "the baseline was run on a different slate, seed or repeats, not comparing"
+        )
+        return within_budget and not failed
+    if baseline["machine"] != report["machine"]:
+        print("the baseline was run on a different machine, expect differences")
+    # the tolerances saved with the baseline, loose for one that was run elsewhere
+    saved = baseline.get("tolerances", {})
+    limits = {
+        name: float(options.get(name, saved.get(name, default)))
+        for name, default in tolerances.items()
+    }
+    rows = compare(
+        report, baseline, limits["max_slowdown"], limits["max_memory_growth"]
+    )
+    print_comparison(rows)
+    regressions = sum(1 for row in rows if row[-1])
+    if regressions:
+        print("{} regressions against the baseline".format(regressions))
+    return within_budget and regressions == 0 and not failed
@@ -0,0 +1,256 @@
+import csv
+import json
+import os
+
+import numpy as np
+
+# slate sizes `main.py <site> bench <size>` knows by name. players is per team, lineups is
+# how many the optimizers build, field_size and iterations are for the simulators
+sizes = {
+    "small": {
+        "games": 4,
+        "players": 13,
+        "field_size": 1000,
+        "iterations": 1000,
+        "lineups": 20,
+    },
+    "medium": {
+        "games": 8,
+        "players": 16,
+        "field_size": 5000,
+        "iterations": 5000,
+        "lineups": 100,
+    },
+    "large": {
+        "games": 14,
+        "players": 20,
+        "field_size": 20000,
+        "iterations": 10000,
+        "lineups": 150,
+    },
+}
+
+# every team gets one of each of the first positions, then depth in the order after
+starters = ["QB", "RB", "WR", "TE", "DST"]
+depth = ["WR", "RB", "WR", "TE", "WR", "QB", "RB"]
+
+# projection and salary of each position's starter, backups get less of both
+position_points = {"QB": 18, "RB": 12, "WR": 11, "TE": 8, "DST": 7, "K": 8}
+position_salary = {
+    "QB": 6500,
+    "RB": 6000,
+    "WR": 6000,
+    "TE": 4500,
+    "DST": 3000,
+    "K": 4000,
+}
+
+# salaries relative to a draftkings classic slate, by site and showdown or not
+salary_scales = {
+    ("dk", False): 1,
+    ("fd", False): 1.2,
+    ("dk", True): 1.25,
+    ("fd", True): 1.75,
+}
+
+config = {
+    "projection_path": "projections.csv",
+    "player_path": "player_ids.csv",
+    "contest_structure_path": "contest_structure.csv",
+    "use_double_te": True,
+    "global_team_limit": 4,
+    "projection_minimum": 1,
+    "randomness": 25,
+    "min_lineup_salary": 45000,
+    "max_pct_off_optimal": 0.4,
+    "num_players_vs_def": 0,
+    "pct_field_using_stacks": 0.65,
+    "pct_field_double_stacks": 0.4,
+    "default_qb_var": 0.4,
+    "default_skillpos_var": 0.5,
+    "default_def_var": 0.5,
+    "at_most": {},
+    "at_least": {},
+    "stack_rules": {},
+    "team_limits": {},
+    "matchup_limits": {},
+    "matchup_at_least": {},
+    "custom_correlations": {},
+    "allow_def_vs_qb_cpt": False,
+}
+
+
+def team_positions(players, showdown=False, site="dk"):
+    # positions of one team's players, starters first
+    positions = list(starters)
+    if showdown and site == "dk":
+        positions.append("K")
+    while len(positions) < players:
+        positions.append(depth[(len(positions) - len(starters)) % len(depth)])
+    return positions[:players]
+
+
+def slate_players(games, players, showdown=False, site="dk", seed=0):
+    rng = np.random.default_rng(seed)
+    salary_scale = salary_scales[(site, showdown)]
+    slate = []
+    for g in range(games):
+        home, away = "T{:02d}".format(2 * g), "T{:02d}".format(2 * g + 1)
+        for team, opp in ((home, away), (away, home)):
+            seen = {}
+            for position in team_positions(players, showdown, site):
+                k = seen[position] = seen.get(position, -1) + 1
+                points = position_points[position] * rng.uniform(0.4, 1.4) - 2 * k
+                points = max(1.0, points)
+                salary = position_salary[position] * points / position_points[position]
+                salary += rng.integers(-800, 800)
+                salary = int(max(3000, salary) * salary_scale) // 100 * 100
+                slate.append(
+                    {
+                        "team": team,
+                        "opp": opp,
+                        "position": position,
+                        "last": "{}{}".format(position, k),
+                        "name": "{} {}{}".format(team, position, k),
+                        "game": "{}@{}".format(away, home),
+                        "fpts": round(points, 2),
+                        "salary": salary,
+                        "own": round(rng.uniform(0.5, 30), 1),
+                        "stddev": round(points * 0.5, 2),
+                    }
+                )
+    return slate
+
+
+def write_slate(
+    directory,
+    site,
+    games=4,
+    players=13,
+    field_size=1000,
+    showdown=False,
+    seed=0,
+    **unused,
+):
+    """Writes a made-up slate and a config for it into directory, laid out like the repo.
+
+    Projections, player ids and the contest structure go in `<site>_data/` and
+    `config.json` next to it, so a copy of `src/` placed in the same directory runs on it
+    exactly as it would on a real slate. Showdown slates are a single game."""
+    if showdown:
+        games = 1
+    slate = slate_players(games, players, showdown, site, seed)
+    data = os.path.join(directory, "{}_data".format(site))
+    os.makedirs(data, exist_ok=True)
+
+    with open(os.path.join(data, "projections.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(
+            ["Name", "Position", "Team", "Salary", "Fpts", "Own%", "CptOwn%", "StdDev"]
+        )
+        for p in slate:
+            writer.writerow(
+                [
+                    p["name"],
+                    "D" if site == "fd" and p["position"] == "DST" else p["position"],
+                    p["team"],
+                    p["salary"],
+                    p["fpts"],
+                    p["own"],
+                    round(p["own"] / 3, 1),
+                    p["stddev"],
+                ]
+            )
+
+    with open(os.path.join(data, "player_ids.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        if site == "dk":
+            writer.writerow(
+                [
+                    "Position",
+                    "Name + ID",
+                    "Name",
+                    "ID",
+                    "Roster Position",
+                    "Salary",
+                    "Game Info",
+                    "TeamAbbrev",
+                    "AvgPointsPerGame",
+                ]
+            )
+            player_id = 10000000
+            for p in slate:
+                if showdown:
+                    roster = [("CPT", 1.5), ("FLEX", 1)]
+                elif p["position"] in ("QB", "DST"):
+                    roster = [(p["position"], 1)]
+                else:
+                    roster = [(p["position"] + "/FLEX", 1)]
+                for roster_position, multiplier in roster:
+                    player_id += 1
+                    writer.writerow(
+                        [
+                            p["position"],
+                            "{} ({})".format(p["name"], player_id),
+                            p["name"],
+                            player_id,
+                            roster_position,
+                            int(p["salary"] * multiplier),
+                            p["game"] + " 11/26/2023 01:00PM ET",
+                            p["team"],
+                            p["fpts"],
+                        ]
+                    )
+        else:
+            writer.writerow(
+                [
+                    "Id",
+                    "Position",
+                    "First Name",
+                    "Nickname",
+                    "Last Name",
+                    "FPPG",
+                    "Salary",
+                    "Game",
+                    "Team",
+                    "Opponent",
+                ]
+            )
+            for i, p in enumerate(slate):
+                # defenses go by their last name in the showdown simulator, so it's the
+                # whole name here
+                dst = p["position"] == "DST"
+                writer.writerow(
+                    [
+                        "90000-{}".format(10000 + i),
+                        "D" if dst else p["position"],
+                        "" if dst else p["team"],
+                        p["name"],
+                        p["name"] if dst else p["last"],
+                        p["fpts"],
+                        p["salary"],
+                        p["game"],
+                        p["team"],
+                        p["opp"],
+                    ]
+                )
+
+    # a top heavy payout paying the top fifth of the field
+    fee = 20 if site == "dk" else 25
+    paid = max(11, field_size // 5)
+    with open(os.path.join(data, "contest_structure.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Place", "Payout", "Field Size", "Entry Fee"])
+        writer.writerow([1, "{:,.2f}".format(field_size * fee * 0.1), field_size, fee])
+        writer.writerow([2, field_size * fee * 0.05, field_size, fee])
+        writer.writerow(["3-10", fee * 5, field_size, fee])
+        writer.writerow(["11-{}".format(paid), fee * 1.5, field_size, fee])
+
+    slate_config = dict(config)
+    if showdown:
+        slate_config["min_lineup_salary"] = 44000 if site == "dk" else 54000
+    elif site == "fd":
+        slate_config["min_lineup_salary"] = 55000
+    with open(os.path.join(directory, "config.json"), "w") as f:
+        json.dump(slate_config, f, indent=4)
+    return len(slate)
@@ -0,0 +1,143 @@
+import numpy as np
+from numba import config
+
+from sim_kernels import gather_scores
+
+
+class FieldLineups:
+    """Columnar store for a simulated contest field.
+
+    Each row of `lineups` holds the player indices (rows of the simulator's player
+    arrays) of one lineup, with per-lineup results kept in parallel NumPy columns."""
+
+    lineup_types = ["generated", "input"]
+    # per-lineup counts of finishing in the top 1, 10 and 1% of the field's lineups
+    finish_columns = ("wins", "top10", "top1pct")
+
+    def __init__(self, roster_size):
+        self.roster_size = roster_size
+        self.lineups = np.empty((0, roster_size), dtype=np.uint16)
+        self.types = np.empty(0, dtype=np.uint8)
+        # number of entries in the contest using this exact lineup
+        self.counts = np.empty(0, dtype=np.uint32)
+        self.wins = np.empty(0)
+        self.top10 = np.empty(0)
+        self.top1pct = np.empty(0)
+        self.cashes = np.empty(0)
+        self.roi = np.empty(0)
+        # sum over sims of each entry's prize squared, for the standard error of its return
+        self.prize_squares = np.empty(0)
+        # and of its share of the win squared, for the standard error of its win %
+        self.win_squares = np.empty(0)
+        self._incidence = None
+
+    def __len__(self):
+        return self.lineups.shape[0]
+
+    def append(self, lineups, lineup_type, counts=None):
+        lineups = np.asarray(lineups).reshape(-1, self.roster_size)
+        n = lineups.shape[0]
+        if counts is None:
+            counts = np.ones(n, dtype=np.uint32)
+        self.lineups = np.concatenate((self.lineups, lineups.astype(np.uint16)))
+        self.types = np.concatenate(
+            (
+                self.types,
+                np.full(n, self.lineup_types.index(lineup_type), dtype=np.uint8),
+            )
+        )
+        self.counts = np.concatenate((self.counts, np.asarray(counts, np.uint32)))
+        for col in self.finish_columns + (
+            "cashes",
+            "roi",
+            "prize_squares",
+            "win_squares",
+        ):
+            setattr(self, col, np.concatenate((getattr(self, col), np.zeros(n))))
+        self._incidence = None
+        return range(len(self) - n, len(self))
+
+    def append_unique(self, lineups, lineup_type):
+        # collapse duplicate lineups (same players in any order) into one row with a count,
+        # keeping the rows in the order they were first seen
+        lineups = np.asarray(lineups).reshape(-1, self.roster_size)
+        if lineups.shape[0] == 0:
+            return self.append(lineups, lineup_type)
+        _, first, counts = np.unique(
+            np.sort(lineups, axis=1), axis=0, return_index=True, return_counts=True
+        )
+        order = np.argsort(first)
+        return self.append(lineups[first[order]], lineup_type, counts[order])
+
+    def type_of(self, index):
+        return self.lineup_types[self.types[index]]
+
+    def rows_of_type(self, lineup_type):
+        return np.flatnonzero(self.types == self.lineup_types.index(lineup_type))
+
+    def results(self):
+        # the per-lineup result columns as a DataFrame, one row per field lineup
+        import pandas as pd
+
+        return pd.DataFrame(
+            {
+                "Type": np.array(self.lineup_types)[self.types],
+                "Count": self.counts,
+                "Wins": self.wins,
+                "Top10": self.top10,
+                "Top1Pct": self.top1pct,
+                "Cashes": self.cashes,
+                "ROI": self.roi,
+            }
+        )
+
+    def finish_cutoffs(self):
+        # how many of the best lineups each finish_columns entry counts
+        return np.array([1, 10, max(1, len(self) // 100)])
+
+    def add_finishes(self, finishes):
+        # adds rank_sims' finish counts onto the finish columns
+        for col, counts in zip(self.finish_columns, finishes):
+            setattr(self, col, getattr(self, col) + counts)
+
+    def incidence(self, num_players):
+        # sparse (lineups x players) matrix with a one for every player in a lineup, so the
+        # whole field is scored by a single product with the outcome matrix
+        from scipy import sparse
+
+        if self._incidence is None or self._incidence.shape[1] != num_players:
+            n = len(self)
+            self._incidence = sparse.csr_matrix(
+                (
+                    np.ones(self.lineups.size, dtype=np.float32),
+                    self.lineups.ravel().astype(np.int32),
+                    np.arange(0, self.lineups.size + 1, self.roster_size),
+                ),
+                shape=(n, num_players),
+            )
+        return self._incidence
+
+    def player_totals(self, num_players, rows=None):
+        # per-player sums of the result columns over the lineups each player is in (of those
+        # in rows, if given), as a single product of the transposed incidence matrix with the
+        # (lineups x 4) results. "In" is weighted by each lineup's entry count so duplicates
+        # count every entry
+        results = np.column_stack(
+            (self.wins, self.top10, self.counts.astype(np.float64), self.roi)
+        )
+        incidence = self.incidence(num_players)
+        if rows is not None:
+            incidence, results = incidence[rows], results[rows]
+        totals = incidence.T @ results
+        return dict(zip(("Wins", "Top10", "In", "ROI"), totals.T))
+
+    def score(self, player_outcomes, parallel=True):
+        # float32 (lineups x sims) fantasy points for a block of sims. the sparse product runs
+        # on one core, so with numba threads to spare the compiled gather is used instead.
+        # callers that fork a pool afterwards pass parallel=False, forking once numba's
+        # threading layer is up can hang or kill the children
+        if parallel and config.NUMBA_NUM_THREADS > 1:
+            out = np.empty((len(self), player_outcomes.shape[1]), dtype=np.float32)
+            return gather_scores(self.lineups, player_outcomes, out)
+        player_outcomes = player_outcomes.astype(np.float32, copy=False)
+        return self.incidence(player_outcomes.shape[0]) @ player_outcomes
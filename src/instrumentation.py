@@ -0,0 +1,122 @@
+import contextlib
+import functools
+import json
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    # not available on windows, peak memory is left out of the report there
+    resource = None
+
+# when the process started, for the totals in the report
+started = time.time()
+
+
+class StageTimings:
+    """Wall time, CPU time, peak memory and throughput of the stages of a run.
+
+    Stages are timed with `stage()` (or the `timed` decorator) and add up by name, so a
+    stage run many times, like each optimizer solve, is one entry with a call count. Time
+    spent in a stage nested inside another only counts towards the inner one. CPU time
+    includes pool workers once they have exited, peak memory is the largest resident size
+    of this process (and of any worker) by the end of the stage."""
+
+    def __init__(self):
+        self.stages = {}
+        # wall and cpu time of the stages nested in each one that's running
+        self.nested = []
+
+    def entry(self, name):
+        return self.stages.setdefault(
+            name, {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "items": None}
+        )
+
+    @contextlib.contextmanager
+    def stage(self, name, items=None):
+        wall, cpu = time.perf_counter(), cpu_seconds()
+        self.nested.append([0.0, 0.0])
+        try:
+            yield
+        finally:
+            nested_wall, nested_cpu = self.nested.pop()
+            wall = time.perf_counter() - wall
+            cpu = cpu_seconds() - cpu
+            if self.nested:
+                self.nested[-1][0] += wall
+                self.nested[-1][1] += cpu
+            entry = self.entry(name)
+            entry["calls"] += 1
+            entry["wall_seconds"] += wall - nested_wall
+            entry["cpu_seconds"] += cpu - nested_cpu
+            if items is not None:
+                self.count(name, items)
+            entry.update(peak_rss_mb())
+
+    def count(self, name, items):
+        # items a stage got through, for when that's only known once it's running
+        entry = self.entry(name)
+        entry["items"] = (entry["items"] or 0) + int(items)
+
+    def report(self, **details):
+        stages = []
+        for name, entry in self.stages.items():
+            stage = {"stage": name, **entry}
+            stage["wall_seconds"] = round(entry["wall_seconds"], 6)
+            stage["cpu_seconds"] = round(entry["cpu_seconds"], 6)
+            if entry["items"] is not None and entry["wall_seconds"] > 0:
+                stage["items_per_second"] = round(
+                    entry["items"] / entry["wall_seconds"], 3
+                )
+            stages.append(stage)
+        total = {
+            "wall_seconds": round(time.time() - started, 6),
+            "cpu_seconds": round(cpu_seconds(), 6),
+            **peak_rss_mb(),
+        }
+        return {**details, "total": total, "stages": stages}
+
+    def write(self, path, **details):
+        with open(path, "w") as f:
+            json.dump(self.report(**details), f, indent=2)
+        return path
+
+
+def cpu_seconds():
+    # user and system time of this process and of the workers it has waited on
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def peak_rss_mb():
+    if resource is None:
+        return {}
+    # kilobytes on linux, bytes on macos
+    scale = 1 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    workers = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return {
+        "peak_rss_mb": round(own / 1024**2, 1),
+        "peak_worker_rss_mb": round(workers / 1024**2, 1),
+    }
+
+
+# the one a process reports on
+timings = StageTimings()
+stage = timings.stage
+count = timings.count
+
+
+def timed(name):
+    # decorator form of stage() for methods that are a stage on their own
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
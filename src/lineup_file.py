@@ -0,0 +1,111 @@
+import collections
+
+import numpy as np
+
+# rows of an uploaded lineup file read at a time, so a huge file never sits in memory
+# whole, only its player rows
+chunk_rows = 50000
+
+# unknown cells listed in the summary of skipped lineups
+listed_unknown = 5
+
+
+def read_chunks(path, columns, limit=None):
+    # the first `columns` cells of every row as text, a chunk of rows at a time. limit
+    # stops after that many rows, like the contest's field size
+    import pandas as pd
+
+    reader = pd.read_csv(
+        path,
+        usecols=range(columns),
+        dtype=str,
+        keep_default_na=False,
+        nrows=limit if limit and limit > 0 else None,
+        chunksize=chunk_rows,
+    )
+    for chunk in reader:
+        yield chunk.to_numpy()
+
+
+def cell_rows(cells, lookup):
+    # player row of every cell, or -1 where the cell isn't a player in the pool. lookup
+    # is only called once per distinct cell, a file repeats the same few hundred players
+    unique, inverse = np.unique(cells, return_inverse=True)
+    rows = np.array([lookup(cell) for cell in unique], dtype=np.int64)
+    return rows[inverse.reshape(-1)].reshape(cells.shape)
+
+
+def position_masks(player_positions, slots):
+    # bitmask of the slots each player can go in, and the bit of every slot
+    bits = {name: 1 << i for i, name in enumerate(dict.fromkeys(slots))}
+    masks = np.array(
+        [
+            sum(bits[p] for p in set(positions) if p in bits)
+            for positions in player_positions
+        ],
+        dtype=np.int64,
+    )
+    return masks, np.array([bits[name] for name in slots], dtype=np.int64)
+
+
+def canonical_slots(lineups, masks, slot_bits):
+    # players of each lineup moved into the roster's slot order, every slot taking the
+    # first player left that can go in it, and whether each lineup filled every slot
+    rows = np.arange(lineups.shape[0])
+    player_masks = masks[lineups]
+    left = np.ones(lineups.shape, dtype=bool)
+    ordered = np.empty_like(lineups)
+    fits = np.ones(lineups.shape[0], dtype=bool)
+    for slot, bit in enumerate(slot_bits):
+        can = left & (player_masks & bit != 0)
+        pick = can.argmax(axis=1)
+        fits &= can[rows, pick]
+        ordered[:, slot] = lineups[rows, pick]
+        left[rows, pick] = False
+    return ordered, fits
+
+
+def load_lineups(path, lookups, masks, slot_bits, limit=None):
+    """Player rows of the lineups in an uploaded lineup file, in roster slot order.
+
+    `lookups` has a function per roster slot turning that column's cell into the player's
+    row, or -1 when it isn't one. Players are moved into the slots they can go in with
+    `masks` and `slot_bits` from `position_masks`. Lineups with a cell that isn't a player
+    or with players that can't fill the roster are skipped and reported together once the
+    whole file is read."""
+    loaded = [np.empty((0, len(lookups)), dtype=np.int64)]
+    read = 0
+    unknown = collections.Counter()
+    unknown_lineups = 0
+    misfits = 0
+    for cells in read_chunks(path, len(lookups), limit):
+        read += len(cells)
+        lineups = np.column_stack(
+            [cell_rows(cells[:, j], lookup) for j, lookup in enumerate(lookups)]
+        )
+        missing = lineups < 0
+        if missing.any():
+            unknown.update(cells[missing].tolist())
+            known = ~missing.any(axis=1)
+            unknown_lineups += int((~known).sum())
+            lineups = lineups[known]
+        lineups, fits = canonical_slots(lineups, masks, slot_bits)
+        misfits += int((~fits).sum())
+        loaded.append(lineups[fits])
+    if unknown_lineups or misfits:
+        print("skipped {} of {} lineups:".format(unknown_lineups + misfits, read))
+        if unknown_lineups:
+            print(
+                "  {} with players that aren't in the player pool, {} unknown: {}".format(
+                    unknown_lineups,
+                    len(unknown),
+                    ", ".join(
+                        "{!r} x{}".format(cell, n)
+                        for cell, n in unknown.most_common(listed_unknown)
+                    )
+                    + (", ..." if len(unknown) > listed_unknown else ""),
+                )
+            )
+        if misfits:
+            print("  {} whose players don't fit the roster's positions".format(misfits))
+    return np.concatenate(loaded)
@@ -0,0 +1,66 @@
+import csv
+
+import numpy as np
+
+
+def player_column(player_dict, player_keys, field, default=0, dtype=None):
+    # one value per player row, in the simulators' player_keys order
+    return np.array(
+        [player_dict[k].get(field, default) for k in player_keys], dtype=dtype
+    )
+
+
+def slot_sum(values):
+    # per-lineup total of a (lineups x slots) array, added slot by slot in lineup order so
+    # the floats come out exactly as the old running totals did
+    total = np.zeros(values.shape[0], dtype=values.dtype)
+    for j in range(values.shape[1]):
+        total += values[:, j]
+    return total
+
+
+def stack_columns(teams, anchor, team_names):
+    # "TEAM count" strings for the anchor team (qb or captain) and the next biggest team in
+    # each lineup. teams is (lineups x slots) of team codes with -1 for slots left out of the
+    # count, anchor the anchor team's code per lineup (-1 for none). ties for the second stack
+    # go to the team listed first, like Counter.most_common
+    same = teams[:, :, None] == teams[:, None, :]
+    slot_counts = same.sum(axis=2)
+    slot_counts[teams < 0] = 0
+    primary_count = ((teams == anchor[:, None]) & (teams >= 0)).sum(axis=1)
+    others = np.where(teams == anchor[:, None], 0, slot_counts)
+    best = others.argmax(axis=1)
+    rows = np.arange(teams.shape[0])
+    secondary_team = teams[rows, best]
+    secondary_count = others[rows, best]
+    primary = [
+        "{} {}".format(team_names[t], c) if c else ""
+        for t, c in zip(anchor.tolist(), primary_count.tolist())
+    ]
+    secondary = [
+        "{} {}".format(team_names[t], c) if c else ""
+        for t, c in zip(secondary_team.tolist(), secondary_count.tolist())
+    ]
+    return primary, secondary
+
+
+def players_vs_dst(teams, opps, is_dst):
+    # number of non-DST players in each lineup whose team is facing one of its DSTs
+    dst_opps = np.where(is_dst, opps, -2)
+    facing = (teams[:, :, None] == dst_opps[:, None, :]).any(axis=2)
+    return (facing & ~is_dst).sum(axis=1)
+
+
+def first_appearance(lineups):
+    # player indices in the order they first show up in the field, the row order of the
+    # exposure files
+    players = lineups.ravel()
+    unique, first = np.unique(players, return_index=True)
+    return unique[np.argsort(first)]
+
+
+def write_csv(path, header, rows):
+    # header is written as is, rows through one buffered csv writer
+    with open(path, "w", newline="") as f:
+        f.write(header)
+        csv.writer(f, lineterminator="\n").writerows(rows)
@@ -1,23 +1,233 @@
+import os
 import sys
 from windows_inhibitor import *
-from nfl_showdown_optimizer import *
-from nfl_optimizer import *
 import time
+import instrumentation
+import profiler
+
+# options that never take a value
+flag_options = {"entries_only", "save_baseline"}
+# options whose value can be left out, they only take the next argument if it's a number
+optional_number_options = {"histogram", "importance", "profile"}
+# options whose directory can be left out, they only take the next argument if it looks
+# like a path (has a slash, starts with a dot or already exists), otherwise use --name=dir
+optional_directory_options = {"cache", "outcome_store"}
+# options each process understands on top of --profile, anything else is a typo or meant
+# for another process
+process_options = {
+    "opto": {"seed"},
+    "sd_opto": {"seed"},
+    "sd_sim": {"outcome_store", "entries_only", "histogram", "sampler", "seed"},
+    "sim": {
+        "max_mem",
+        "sim_block",
+        "outcome_store",
+        "cache",
+        "cache_size",
+        "entries_only",
+        "histogram",
+        "target_se",
+        "time_budget",
+        "sampler",
+        "importance",
+        "seed",
+    },
+    "bench": {
+        "games",
+        "players",
+        "field_size",
+        "iterations",
+        "lineups",
+        "seed",
+        "repeats",
+        "processes",
+        "save_baseline",
+        "max_slowdown",
+        "max_memory_growth",
+        "import_budget",
+        "workspace",
+    },
+}
+
+
+# whether the argument after `--name` is its value rather than the next positional one
+def takes_value(name, following):
+    if following.startswith("--") or name in flag_options:
+        return False
+    if name in optional_number_options:
+        try:
+            float(following)
+        except ValueError:
+            return False
+    elif name in optional_directory_options:
+        return (
+            "/" in following
+            or os.sep in following
+            or following.startswith(".")
+            or os.path.isdir(following)
+        )
+    return True
+
+
+# pull `--name value` options out of the arguments so the positional usage stays the same
+def parse_options(arguments):
+    positional = []
+    options = {}
+    i = 0
+    while i < len(arguments):
+        arg = arguments[i]
+        if arg.startswith("--"):
+            name, value = arg[2:], True
+            if "=" in name:
+                name, value = name.split("=", 1)
+            if "_" in name:
+                print(
+                    "options are spelt with dashes, --{} rather than --{}".format(
+                        name.replace("_", "-"), name
+                    )
+                )
+                print("Incorrect usage. Please see `README.md` for proper usage.")
+                exit(1)
+            name = name.replace("-", "_")
+            if (
+                value is True
+                and i + 1 < len(arguments)
+                and takes_value(name, arguments[i + 1])
+            ):
+                value = arguments[i + 1]
+                i += 1
+            options[name] = value
+        else:
+            positional.append(arg)
+        i += 1
+    return positional, options
+
+
+# exits with the usage message if any option isn't one process understands
+def check_options(process, options):
+    allowed = process_options.get(process)
+    if allowed is None:
+        return
+    unknown = [name for name in options if name not in allowed | {"profile"}]
+    if unknown:
+        print(
+            "{} doesn't take {}".format(
+                process,
+                ", ".join("--" + name.replace("_", "-") for name in unknown),
+            )
+        )
+        print("Incorrect usage. Please see `README.md` for proper usage.")
+        exit(1)
+
+
+# turn sizes like 4G, 512M or 1.5GB into bytes
+def parse_mem_size(value):
+    units = {"K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+    value = str(value).strip().upper().rstrip("B")
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(float(value))
+
+
+# where sampled outcomes are kept for reuse, `--outcome-store` alone uses ../outcome_store
+def outcome_store_dir(options):
+    directory = options.get("outcome_store")
+    if directory is True:
+        directory = os.path.join(os.path.dirname(__file__), "../outcome_store")
+    return directory
+
+
+# stage cache directory, `--cache` alone uses ../cache
+def cache_dir(options):
+    directory = options.get("cache")
+    if directory is True:
+        directory = os.path.join(os.path.dirname(__file__), "../cache")
+    return directory
+
+
+# bucket width in points for approximate ranking, `--histogram` alone uses 0.01
+def histogram_width(options):
+    width = options.get("histogram")
+    if width is True:
+        width = 0.01
+    return None if width is None else float(width)
+
+
+# standard deviations to tilt the draws by towards each uploaded lineup, `--importance`
+# alone uses 1
+def importance_tilt(options):
+    tilt = options.get("importance")
+    if tilt is True:
+        tilt = 1.0
+    return None if tilt is None else float(tilt)
+
+
+# numeric option or None when it wasn't given
+def float_option(options, name):
+    value = options.get(name)
+    return None if value is None else float(value)
+
+
+# `--seed <n>` makes a run repeatable, without it every run draws fresh randomness
+def seed_option(options):
+    seed = options.get("seed")
+    return None if seed is None else int(seed)
+
+
+# per-stage timing and memory of the run, written next to its output files
+def write_timings(site, process, arguments, options):
+    path = os.path.join(
+        os.path.dirname(__file__),
+        "../output/{}_{}_timings.json".format(site, process),
+    )
+    instrumentation.timings.write(
+        path, site=site, process=process, arguments=arguments[1:], options=options
+    )
+    print("stage timings written to " + path)
+
+
+# milliseconds between stack samples, `--profile` alone samples every 5
+def profile_interval(options):
+    interval = options.get("profile")
+    if interval is True:
+        interval = 5
+    return None if interval is None else float(interval) / 1000
+
+
+# flame graph files and hot function table of a profiled run, next to its output files
+def write_profile(site, process):
+    profiler.write(
+        os.path.join(
+            os.path.dirname(__file__),
+            "../output/{}_{}_profile".format(site, process),
+        )
+    )
 
 
 def main(arguments):
+    arguments, options = parse_options(arguments)
     if len(arguments) < 3 or len(arguments) > 7:
         print("Incorrect usage. Please see `README.md` for proper usage.")
         exit()
 
     site = arguments[1]
     process = arguments[2]
+    check_options(process, options)
+    interval = profile_interval(options)
+    if interval is not None:
+        profiler.start(interval)
 
+    # each process imports only its own engine, the simulators' numerical libraries take
+    # a while to load
     if process == "opto":
+        import nfl_optimizer
+
         num_lineups = arguments[3]
         num_uniques = arguments[4]
         start = time.time()
-        opto = NFL_Optimizer(site, num_lineups, num_uniques)
+        opto = nfl_optimizer.NFL_Optimizer(
+            site, num_lineups, num_uniques, seed_option(options)
+        )
         opto.optimize()
         opto.output()
         end = time.time()
@@ -26,9 +236,13 @@ def main(arguments):
         print(f"Elapsed time: {int(minutes)} minutes, {int(seconds)} seconds")
 
     elif process == "sd_opto":
+        import nfl_showdown_optimizer
+
         num_lineups = arguments[3]
         num_uniques = arguments[4]
-        opto = NFL_Showdown_Optimizer(site, num_lineups, num_uniques)
+        opto = nfl_showdown_optimizer.NFL_Showdown_Optimizer(
+            site, num_lineups, num_uniques, seed_option(options)
+        )
         opto.optimize()
         opto.output()
 
@@ -53,7 +267,16 @@ def main(arguments):
         # if 'match' in arguments:
         #    match_lineup_input_to_field_size = True
         sim = nfl_showdown_simulator.NFL_Showdown_Simulator(
-            site, field_size, num_iterations, use_contest_data, use_file_upload
+            site,
+            field_size,
+            num_iterations,
+            use_contest_data,
+            use_file_upload,
+            outcome_store=outcome_store_dir(options),
+            entries_only=bool(options.get("entries_only")),
+            histogram_width=histogram_width(options),
+            sampler=options.get("sampler", "mc"),
+            seed=seed_option(options),
         )
         sim.generate_field_lineups()
         sim.run_tournament_simulation()
@@ -80,13 +303,56 @@ def main(arguments):
             num_iterations = arguments[4]
         # if 'match' in arguments:
         #    match_lineup_input_to_field_size = True
+        max_mem = None
+        if "max_mem" in options:
+            max_mem = parse_mem_size(options["max_mem"])
+        cache_size = None
+        if "cache_size" in options:
+            cache_size = parse_mem_size(options["cache_size"])
+        sim_block = None
+        if "sim_block" in options:
+            sim_block = int(options["sim_block"])
         sim = nfl_gpp_simulator.NFL_GPP_Simulator(
-            site, field_size, num_iterations, use_contest_data, use_file_upload
+            site,
+            field_size,
+            num_iterations,
+            use_contest_data,
+            use_file_upload,
+            max_mem=max_mem,
+            sim_block_size=sim_block,
+            outcome_store=outcome_store_dir(options),
+            cache_dir=cache_dir(options),
+            cache_size=cache_size,
+            entries_only=bool(options.get("entries_only")),
+            histogram_width=histogram_width(options),
+            target_se=float_option(options, "target_se"),
+            time_budget=float_option(options, "time_budget"),
+            sampler=options.get("sampler", "mc"),
+            importance=importance_tilt(options),
+            seed=seed_option(options),
         )
         sim.generate_field_lineups()
         sim.run_tournament_simulation()
         sim.output()
 
+    elif process == "bench":
+        import bench
+
+        size = arguments[3] if len(arguments) > 3 else "small"
+        passed = bench.run(site, size, options)
+        if interval is not None:
+            write_profile(site, process)
+        # non-zero exit status on a regression, so it can gate a build
+        exit(0 if passed else 1)
+
+    else:
+        print("Incorrect usage. Please see `README.md` for proper usage.")
+        exit(1)
+
+    if interval is not None:
+        write_profile(site, process)
+    write_timings(site, process, arguments, options)
+
 
 if __name__ == "__main__":
     main(sys.argv)
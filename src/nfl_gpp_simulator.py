@@ -2,30 +2,58 @@ import csv
 import json
 import math
 import os
-import random
 import time
 import numpy as np
-import pulp as plp
 import multiprocessing as mp
-import pandas as pd
 import statistics
 
 # import fuzzywuzzy
 import itertools
 import collections
 import re
-from scipy.stats import norm, kendalltau, multivariate_normal, gamma
-import matplotlib.pyplot as plt
-import seaborn as sns
-from collections import Counter
-from numba import jit
-
-
-@jit(nopython=True)
-def salary_boost(salary, max_salary):
-    return (salary / max_salary) ** 2
-
-
+from numba import jit, njit, get_num_threads
+from field_lineups import FieldLineups
+from lineup_file import load_lineups, position_masks
+from lineup_table import (
+    player_column,
+    slot_sum,
+    stack_columns,
+    players_vs_dst,
+    first_appearance,
+    write_csv,
+)
+from sim_kernels import (
+    rank_sims,
+    rank_entries,
+    rank_histogram,
+    histogram_rank_error,
+)
+import instrumentation
+import shared_arrays
+from outcome_store import OutcomeStore, hash_inputs
+from stage_cache import StageCache, file_digest
+from work_blocks import plan_blocks
+from seeding import (
+    run_entropy,
+    seed_sequence,
+    field_stream,
+    games_stream,
+    tilt_stream,
+)
+from sim_sampling import (
+    samplers,
+    game_factor,
+    sample_game,
+    sample_sims,
+    sampler_speedup,
+    lineup_tilts,
+    mixture_weights,
+    correlation_rows,
+    game_correlation,
+)
+
+
+@jit(nopython=True, cache=True)
 def salary_boost(salary, max_salary):
     # Linear boost
     # return salary / max_salary
@@ -34,10 +62,242 @@ def salary_boost(salary, max_salary):
     return (salary / max_salary) ** 2
 
 
+@njit(cache=True)
+def weighted_choice(weights):
+    # draw an index with probability proportional to weights, -1 if nothing is eligible
+    total = weights.sum()
+    if total <= 0:
+        return -1
+    r = np.random.random() * total
+    acc = 0.0
+    last = -1
+    for i in range(weights.shape[0]):
+        if weights[i] > 0:
+            acc += weights[i]
+            last = i
+            if r < acc:
+                return i
+    return last
+
+
+@njit(cache=True)
+def build_lineup(
+    lineup,
+    in_lineup,
+    team_counts,
+    weights,
+    team_stack,
+    stack_len,
+    pos_matrix,
+    ownership,
+    salaries,
+    projections,
+    teams,
+    opponents,
+    matchups,
+    salary_floor,
+    salary_ceiling,
+    reasonable_projection,
+    reasonable_stack_projection,
+    overlap_limit,
+    max_players_per_team,
+):
+    # one attempt at a field lineup, filled in place. returns True if it passes every acceptance rule
+    num_players, num_slots = pos_matrix.shape
+    lineup[:] = -1
+    in_lineup[:] = False
+    team_counts[:] = 0
+    salary = 0.0
+    proj = 0.0
+    team_stack_len = 0
+
+    if team_stack >= 0:
+        # stacks always use the first listed qb on the team
+        qb = -1
+        for p in range(num_players):
+            if teams[p] == team_stack and pos_matrix[p, 1] > 0:
+                qb = p
+                break
+        if qb < 0:
+            return False
+        lineup[1] = qb
+        in_lineup[qb] = True
+        team_counts[teams[qb]] += 1
+        salary += salaries[qb]
+        proj += projections[qb]
+        team_stack_len += 1
+        # pass catchers (WR/TE slots) to pair with the qb, sampled without replacement
+        for s in range(stack_len):
+            for p in range(num_players):
+                if (
+                    teams[p] == team_stack
+                    and not in_lineup[p]
+                    and pos_matrix[p, 4:8].sum() > 0
+                ):
+                    weights[p] = ownership[p]
+                else:
+                    weights[p] = 0.0
+            choice = weighted_choice(weights)
+            if choice < 0:
+                return False
+            placed = False
+            for slot in range(num_slots):
+                if pos_matrix[choice, slot] > 0 and lineup[slot] < 0:
+                    lineup[slot] = choice
+                    placed = True
+                    break
+            if not placed:
+                return False
+            in_lineup[choice] = True
+            team_counts[teams[choice]] += 1
+            salary += salaries[choice]
+            proj += projections[choice]
+        team_stack_len += stack_len
+
+    # fill the open slots in roster order, DST first so the overlap rule can be applied
+    def_opp = -1
+    players_opposing_def = 0
+    for slot in range(num_slots):
+        if lineup[slot] >= 0:
+            continue
+        if slot == 0:
+            for p in range(num_players):
+                if (
+                    pos_matrix[p, slot] > 0
+                    and not in_lineup[p]
+                    and (team_stack < 0 or opponents[p] != team_stack)
+                ):
+                    weights[p] = ownership[p]
+                else:
+                    weights[p] = 0.0
+        else:
+            remaining_salary = salary_ceiling - salary
+            last_slot = slot == num_slots - 1
+            avoid_def = players_opposing_def >= overlap_limit
+            for p in range(num_players):
+                if (
+                    pos_matrix[p, slot] > 0
+                    and not in_lineup[p]
+                    and salaries[p] <= remaining_salary
+                    and (not last_slot or salary + salaries[p] >= salary_floor)
+                    and (not avoid_def or teams[p] != def_opp)
+                ):
+                    weights[p] = ownership[p]
+                    if last_slot or avoid_def:
+                        weights[p] *= salary_boost(salaries[p], salary_ceiling)
+                else:
+                    weights[p] = 0.0
+        choice = weighted_choice(weights)
+        if choice < 0:
+            return False
+        lineup[slot] = choice
+        in_lineup[choice] = True
+        team_counts[teams[choice]] += 1
+        salary += salaries[choice]
+        proj += projections[choice]
+        if slot == 0:
+            def_opp = opponents[choice]
+        else:
+            if teams[choice] == def_opp:
+                players_opposing_def += 1
+            if teams[choice] == team_stack:
+                team_stack_len += 1
+        if (
+            max_players_per_team > 0
+            and team_counts[teams[choice]] > max_players_per_team
+        ):
+            return False
+
+    if team_stack >= 0:
+        if team_stack_len < stack_len:
+            return False
+        # loosening reasonable projection constraint for team stacks
+        if proj < reasonable_stack_projection:
+            return False
+    elif proj < reasonable_projection:
+        return False
+    if salary < salary_floor or salary > salary_ceiling:
+        return False
+    # lineup has to span more than one game
+    for slot in range(1, num_slots):
+        if matchups[lineup[slot]] != matchups[lineup[0]]:
+            return True
+    return False
+
+
+@njit(cache=True)
+def generate_lineup_block(
+    seeds,
+    stack_teams,
+    stack_lens,
+    pos_matrix,
+    ownership,
+    salaries,
+    projections,
+    teams,
+    opponents,
+    matchups,
+    num_teams,
+    salary_floor,
+    salary_ceiling,
+    optimal_score,
+    max_pct_off_optimal,
+    overlap_limit,
+    max_players_per_team,
+    max_attempts,
+):
+    # generates one field lineup per entry of stack_teams (-1 for no stack) as rows of player indices,
+    # columns in DST, QB, RB, RB, WR, WR, WR, TE, FLEX order. every lineup is drawn from its own
+    # seed, so the field doesn't depend on how it was split into blocks. gives up on a lineup
+    # after max_attempts draws and returns its index as the second value (-1 if every lineup
+    # was built), the lineups from there on are left unfilled
+    num_players, num_slots = pos_matrix.shape
+    num_lineups = stack_teams.shape[0]
+    lineups = np.empty((num_lineups, num_slots), dtype=np.int64)
+    lineup = np.empty(num_slots, dtype=np.int64)
+    in_lineup = np.zeros(num_players, dtype=np.bool_)
+    team_counts = np.zeros(num_teams, dtype=np.int64)
+    weights = np.zeros(num_players, dtype=np.float64)
+    reasonable_projection = optimal_score - (max_pct_off_optimal * optimal_score)
+    reasonable_stack_projection = optimal_score - (
+        (max_pct_off_optimal * 1.25) * optimal_score
+    )
+    for i in range(num_lineups):
+        np.random.seed(seeds[i])
+        # keep drawing until a lineup passes, same as the field would keep tinkering
+        attempts = 0
+        while not build_lineup(
+            lineup,
+            in_lineup,
+            team_counts,
+            weights,
+            stack_teams[i],
+            stack_lens[i],
+            pos_matrix,
+            ownership,
+            salaries,
+            projections,
+            teams,
+            opponents,
+            matchups,
+            salary_floor,
+            salary_ceiling,
+            reasonable_projection,
+            reasonable_stack_projection,
+            overlap_limit,
+            max_players_per_team,
+        ):
+            attempts += 1
+            if attempts == max_attempts:
+                return lineups, i
+        lineups[i] = lineup
+    return lineups, -1
+
+
 class NFL_GPP_Simulator:
     config = None
     player_dict = {}
-    field_lineups = {}
+    field_lineups = None
     stacks_dict = {}
     gen_lineup_list = []
     roster_construction = []
@@ -59,6 +319,27 @@ class NFL_GPP_Simulator:
     max_pct_off_optimal = 0.4
     teams_dict = collections.defaultdict(list)  # Initialize teams_dict
     correlation_rules = {}
+    # rough bytes held per lineup per sim while ranking a block (scores and their temporaries)
+    bytes_per_ranked_cell = 8
+    # lineups generated up front to time the generator before splitting up the field
+    pilot_lineups = 64
+    # draws at a field lineup before the slate and config are taken to rule it out
+    max_lineup_attempts = 1000000
+    # sims ranked exactly as well to report the error of histogram ranking
+    histogram_check_sims = 8
+    # sims per block when stopping on a target standard error or a time budget
+    adaptive_block_sims = 1000
+    # lineups whose standard errors decide when to stop, without uploaded lineups
+    tracked_lineups = 150
+    # uploaded lineups importance sampling tilts towards, the most entered ones
+    max_importance_tilts = 256
+    # normal quantile for the 95% confidence intervals in the output
+    confidence_z = 1.96
+    # ranking blocks with a seed, fixed so the float totals add up in the same order on any
+    # number of threads
+    seeded_rank_blocks = 16
+    # bytes the stage cache may use before evicting what was used least recently
+    default_cache_size = 2 * 1024**3
 
     def __init__(
         self,
@@ -67,9 +348,63 @@ class NFL_GPP_Simulator:
         num_iterations,
         use_contest_data,
         use_lineup_input,
+        max_mem=None,
+        sim_block_size=None,
+        outcome_store=None,
+        cache_dir=None,
+        cache_size=None,
+        entries_only=False,
+        histogram_width=None,
+        target_se=None,
+        time_budget=None,
+        sampler="mc",
+        importance=None,
+        seed=None,
     ):
         self.site = site
+        # every random draw of the run comes from streams derived from this, see seeding.py.
+        # seed is kept as given for the cache keys, stages drawn from it are only cached
+        # with one
+        self.seed = seed
+        self.entropy = run_entropy(seed)
+        print("random seed " + str(self.entropy))
         self.use_lineup_input = use_lineup_input
+        # only rank (and output) the lineups from tournament_lineups.csv
+        self.entries_only = entries_only
+        # bucket width in points for approximate ranking, None ranks exactly
+        self.histogram_width = histogram_width
+        # mean and largest places the approximate ranking was off by and over how many sims,
+        # once checked
+        self.histogram_error = None
+        # with either of these num_iterations is only the most sims to run: they stop once
+        # our lineups' standard errors are all under target_se (dollars of average return,
+        # or points of win % without a contest) or after time_budget seconds
+        self.target_se = target_se
+        self.time_budget = time_budget
+        # how the outcome draws are spread out, one of sim_sampling.samplers
+        if sampler not in samplers:
+            raise ValueError(
+                "unknown sampler {}, use one of {}".format(sampler, samplers)
+            )
+        self.sampler = sampler
+        # with importance sampling most sims are drawn shifted this many standard deviations
+        # towards one of our lineups beating the field, and every sim is weighted by how
+        # much more likely the shifts made it
+        self.importance = importance
+        # memory ceiling in bytes for ranking, or a fixed number of sims per block
+        self.max_mem = max_mem
+        self.sim_block_size = sim_block_size
+        # directory to keep sampled player outcomes in for reuse by later runs
+        self.outcome_store = outcome_store
+        # stages whose inputs haven't changed since an earlier run are loaded from here
+        self.stage_cache = None
+        self.stage_keys = {}
+        if cache_dir is not None:
+            self.stage_cache = StageCache(
+                cache_dir, cache_size or self.default_cache_size
+            )
+            if outcome_store is None:
+                self.outcome_store = os.path.join(cache_dir, "outcomes")
         self.load_config()
         self.load_rules()
 
@@ -77,14 +412,17 @@ class NFL_GPP_Simulator:
             os.path.dirname(__file__),
             "../{}_data/{}".format(site, self.config["projection_path"]),
         )
-        self.load_projections(projection_path)
-
         player_path = os.path.join(
             os.path.dirname(__file__),
             "../{}_data/{}".format(site, self.config["player_path"]),
         )
-        self.load_player_ids(player_path)
-        self.load_team_stacks()
+        slate = self.cached_stage(
+            "slate",
+            (site, file_digest(projection_path), file_digest(player_path), self.config),
+            lambda: self.load_slate(projection_path, player_path),
+        )
+        for name, value in slate.items():
+            setattr(self, name, value)
 
         # ownership_path = os.path.join(
         #    os.path.dirname(__file__),
@@ -147,18 +485,53 @@ class NFL_GPP_Simulator:
 
         # self.adjust_default_stdev()
         self.assertPlayerDict()
+        self.index_players()
+        self.field_lineups = FieldLineups(len(self.roster_construction))
         self.num_iterations = int(num_iterations)
-        self.get_optimal()
+        self.optimal_score = self.cached_stage(
+            "optimal",
+            (self.stage_keys.get("slate"), self.roster_construction, self.salary),
+            self.get_optimal,
+        )
         if self.use_lineup_input:
             self.load_lineups_from_file()
         # if self.match_lineup_input_to_field_size or len(self.field_lineups) == 0:
         # self.generate_field_lineups()
         self.load_correlation_rules()
+        self.compile_correlations()
+
+    # runs compute() unless the stage cache already holds its result for these inputs.
+    # seeded_only stages are random, so without a seed they're drawn afresh every run
+    def cached_stage(self, stage, inputs, compute, seeded_only=False):
+        if self.stage_cache is None or (seeded_only and self.seed is None):
+            return compute()
+        key = self.stage_cache.key(stage, inputs)
+        self.stage_keys[stage] = key
+        value = self.stage_cache.get(key)
+        if value is None:
+            value = compute()
+            self.stage_cache.put(key, value)
+        else:
+            print("loaded " + stage + " from cache")
+        return value
+
+    def load_slate(self, projection_path, player_path):
+        self.load_projections(projection_path)
+        self.load_player_ids(player_path)
+        self.load_team_stacks()
+        return {
+            "player_dict": self.player_dict,
+            "teams_dict": self.teams_dict,
+            "matchups": self.matchups,
+            "stacks_dict": self.stacks_dict,
+            "id_name_dict": self.id_name_dict,
+        }
 
     # make column lookups on datafiles case insensitive
     def lower_first(self, iterator):
         return itertools.chain([next(iterator).lower()], iterator)
 
+    @instrumentation.timed("config load")
     def load_rules(self):
         self.projection_minimum = int(self.config["projection_minimum"])
         self.randomness_amount = float(self.config["randomness"])
@@ -181,9 +554,21 @@ class NFL_GPP_Simulator:
                 )
                 self.player_dict.pop(p)
 
+    # field lineups store players as row indices into these arrays
+    def index_players(self):
+        self.player_keys = list(self.player_dict.keys())
+        self.player_ids = np.array(
+            [self.player_dict[k]["ID"] for k in self.player_keys]
+        )
+        self.id_to_index = {pid: i for i, pid in enumerate(self.player_ids)}
+
     # In order to make reasonable tournament lineups, we want to be close enough to the optimal that
     # a person could realistically land on this lineup. Skeleton here is taken from base `mlb_optimizer.py`
+    @instrumentation.timed("model build")
     def get_optimal(self):
+        # loaded here rather than up top, runs that reuse a cached field never need it
+        import pulp as plp
+
         # print(s['Name'],s['ID'])
         # print(self.player_dict)
         problem = plp.LpProblem("NFL", plp.LpMaximize)
@@ -429,7 +814,8 @@ class NFL_GPP_Simulator:
         #     print(f"Error while printing variable: {e}")
         # Crunch!
         try:
-            problem.solve(plp.PULP_CBC_CMD(msg=0))
+            with instrumentation.stage("solve"):
+                problem.solve(plp.PULP_CBC_CMD(msg=0))
         except plp.PulpSolverError:
             print(
                 "Infeasibility reached - only generated {} lineups out of {}. Continuing with export.".format(
@@ -453,8 +839,10 @@ class NFL_GPP_Simulator:
             score = score.replace(v.name, str(v.varValue))
 
         self.optimal_score = eval(score)
+        return self.optimal_score
 
     # Load player IDs for exporting
+    @instrumentation.timed("player id join")
     def load_player_ids(self, path):
         with open(path, encoding="utf-8-sig") as file:
             reader = csv.DictReader(self.lower_first(file))
@@ -495,6 +883,7 @@ class NFL_GPP_Simulator:
                     self.player_dict[(player_name, pos_str, team)]["Matchup"] = opp
                 self.id_name_dict[str(row["id"])] = row[name_key]
 
+    @instrumentation.timed("csv parse")
     def load_contest_data(self, path):
         with open(path, encoding="utf-8-sig") as file:
             reader = csv.DictReader(self.lower_first(file))
@@ -525,6 +914,7 @@ class NFL_GPP_Simulator:
                     )
         # print(self.payout_structure)
 
+    @instrumentation.timed("config load")
     def load_correlation_rules(self):
         if len(self.correlation_rules.keys()) > 0:
             for c in self.correlation_rules.keys():
@@ -538,7 +928,27 @@ class NFL_GPP_Simulator:
                                 v
                             ] = self.correlation_rules[c][v]
 
+    # game correlation matrices are built by indexing these per team tables instead of
+    # looking up every pair of players in their Correlations dicts
+    def compile_correlations(self):
+        self.correlation_positions = sorted(
+            {p["Position"][0] for players in self.teams_dict.values() for p in players}
+        )
+        self.team_correlations = {}
+        for team, players in self.teams_dict.items():
+            self.team_correlations[team] = (
+                correlation_rows(players, self.correlation_positions),
+                np.array(
+                    [
+                        self.correlation_positions.index(p["Position"][0])
+                        for p in players
+                    ],
+                    dtype=np.int64,
+                ),
+            )
+
     # Load config from file
+    @instrumentation.timed("config load")
     def load_config(self):
         with open(
             os.path.join(os.path.dirname(__file__), "../config.json"),
@@ -547,6 +957,7 @@ class NFL_GPP_Simulator:
             self.config = json.load(json_file)
 
     # Load projections from file
+    @instrumentation.timed("csv parse")
     def load_projections(self, path):
         # Read projections into a dictionary
         with open(path, encoding="utf-8-sig") as file:
@@ -742,783 +1153,89 @@ class NFL_GPP_Simulator:
         else:
             return cell_value
 
+    @instrumentation.timed("csv parse")
     def load_lineups_from_file(self):
         print("loading lineups")
-        i = 0
         path = os.path.join(
             os.path.dirname(__file__),
             "../{}_data/{}".format(self.site, "tournament_lineups.csv"),
         )
-        with open(path) as file:
-            reader = pd.read_csv(file)
-            lineup = []
-            j = 0
-            for i, row in reader.iterrows():
-                # print(row)
-                if i == self.field_size:
-                    break
-                lineup = [self.extract_id(str(row[j])) for j in range(9)]
-                # storing if this lineup was made by an optimizer or with the generation process in this script
-                error = False
-                for l in lineup:
-                    ids = [self.player_dict[k]["ID"] for k in self.player_dict]
-                    if l not in ids:
-                        print("lineup {} is missing players {}".format(i, l))
-                        if l in self.id_name_dict:
-                            print(self.id_name_dict[l])
-                        error = True
-                if len(lineup) < 9:
-                    print("lineup {} is missing players".format(i))
-                    continue
-                # storing if this lineup was made by an optimizer or with the generation process in this script
-                error = False
-                for l in lineup:
-                    ids = [self.player_dict[k]["ID"] for k in self.player_dict]
-                    if l not in ids:
-                        print("lineup {} is missing players {}".format(i, l))
-                        if l in self.id_name_dict:
-                            print(self.id_name_dict[l])
-                        error = True
-                if len(lineup) < 9:
-                    print("lineup {} is missing players".format(i))
-                    continue
-                if not error:
-                    # reshuffle lineup to match temp_roster_construction
-                    temp_roster_construction = [
-                        "DST",
-                        "QB",
-                        "RB",
-                        "RB",
-                        "WR",
-                        "WR",
-                        "WR",
-                        "TE",
-                        "FLEX",
-                    ]
-                    shuffled_lu = []
+        # the slot order the generator fills, see fill_field_lineups
+        slots = ["DST", "QB", "RB", "RB", "WR", "WR", "WR", "TE", "FLEX"]
+        masks, slot_bits = position_masks(
+            [self.player_dict[k]["Position"] for k in self.player_keys], slots
+        )
 
-                    id_to_player_dict = {
-                        v["ID"]: v for k, v in self.player_dict.items()
-                    }
-                    lineup_copy = lineup.copy()
-                    position_counts = {
-                        "DST": 0,
-                        "QB": 0,
-                        "RB": 0,
-                        "WR": 0,
-                        "TE": 0,
-                        "FLEX": 0,
-                    }
-                    z = 0
-
-                    while z < 9:
-                        for t in temp_roster_construction:
-                            if position_counts[t] < temp_roster_construction.count(t):
-                                for l in lineup_copy:
-                                    player_info = id_to_player_dict.get(l)
-                                    if player_info and t in player_info["Position"]:
-                                        shuffled_lu.append(l)
-                                        lineup_copy.remove(l)
-                                        position_counts[t] += 1
-                                        z += 1
-                                        if z == 9:
-                                            break
-                            if z == 9:
-                                break
-                    self.field_lineups[j] = {
-                        "Lineup": shuffled_lu,
-                        "Wins": 0,
-                        "Top10": 0,
-                        "ROI": 0,
-                        "Cashes": 0,
-                        "Type": "input",
-                    }
-                    j += 1
-        print("loaded {} lineups".format(j))
-        # print(self.field_lineups)
+        def lookup(cell):
+            return self.id_to_index.get(self.extract_id(cell), -1)
+
+        loaded = load_lineups(
+            path, [lookup] * len(slots), masks, slot_bits, self.field_size
+        )
+        self.field_lineups.append(loaded.astype(np.uint16), "input")
+        print("loaded {} lineups".format(len(loaded)))
 
     @staticmethod
     def generate_lineups(
-        lu_num,
-        ids,
-        in_lineup,
-        pos_matrix,
-        ownership,
+        start,
+        stop,
+        num_teams,
         salary_floor,
         salary_ceiling,
         optimal_score,
-        salaries,
-        projections,
         max_pct_off_optimal,
-        teams,
-        opponents,
-        team_stack,
-        stack_len,
         overlap_limit,
-        max_stack_len,
-        matchups,
-        num_players_in_roster,
-        site,
+        max_players_per_team,
+        max_attempts,
+        arrays=None,
     ):
-        # new random seed for each lineup (without this there is a ton of dupes)
-        rng = np.random.Generator(np.random.PCG64())
-        lus = {}
-        # make sure nobody is already showing up in a lineup
-        if sum(in_lineup) != 0:
-            in_lineup.fill(0)
-        reject = True
-        iteration_count = 0
-        total_players = num_players_in_roster
-        issue = ""
-        complete = ""
-        reasonable_projection = optimal_score - (max_pct_off_optimal * optimal_score)
-        reasonable_stack_projection = optimal_score - (
-            (max_pct_off_optimal * 1.25) * optimal_score
+        # player arrays are attached from shared memory when the worker starts, so a task
+        # is just a range of field lineups. each lineup has its own seed (without this
+        # there is a ton of dupes). returns the first lineup that couldn't be built, or -1
+        if arrays is None:
+            arrays = shared_arrays.worker_arrays
+        lineups, failed = generate_lineup_block(
+            arrays["lineup_seeds"][start:stop],
+            arrays["stack_teams"][start:stop],
+            arrays["stack_lens"][start:stop],
+            arrays["pos_matrix"],
+            arrays["ownership"],
+            arrays["salaries"],
+            arrays["projections"],
+            arrays["teams"],
+            arrays["opponents"],
+            arrays["matchups"],
+            num_teams,
+            salary_floor,
+            salary_ceiling,
+            optimal_score,
+            max_pct_off_optimal,
+            overlap_limit,
+            max_players_per_team,
+            max_attempts,
         )
-        max_players_per_team = 4 if site == "fd" else None
-        # reject_counters = {
-        #     "salary_too_low": 0,
-        #     "salary_too_high": 0,
-        #     "projection_too_low": 0,
-        #     "invalid_matchups": 0,
-        #     "stack_length_insufficient": 0,
-        # }
-        # print(lu_num, ' started',  team_stack, max_stack_len)
-        while reject:
-            iteration_count += 1
-            if team_stack == "":
-                salary = 0
-                proj = 0
-                if sum(in_lineup) != 0:
-                    in_lineup.fill(0)
-                lineup = []
-                player_teams = []
-                def_opps = []
-                players_opposing_def = 0
-                lineup_matchups = []
-                k = 0
-                for pos in pos_matrix.T:
-                    if k < 1:
-                        # check for players eligible for the position and make sure they arent in a lineup, returns a list of indices of available player
-                        valid_players = np.nonzero((pos > 0) & (in_lineup == 0))[0]
-                        # grab names of players eligible
-                        plyr_list = ids[valid_players]
-                        # create np array of probability of being seelcted based on ownership and who is eligible at the position
-                        prob_list = ownership[valid_players]
-                        prob_list = prob_list / prob_list.sum()
-                        try:
-                            choice = rng.choice(plyr_list, p=prob_list)
-                        except:
-                            print(plyr_list, prob_list)
-                            print("find failed on nonstack and first player selection")
-                        choice_idx = np.nonzero(ids == choice)[0]
-                        lineup.append(str(choice))
-                        in_lineup[choice_idx] = 1
-                        salary += salaries[choice_idx]
-                        proj += projections[choice_idx]
-                        def_opp = opponents[choice_idx][0]
-                        lineup_matchups.append(matchups[choice_idx[0]])
-                        player_teams.append(teams[choice_idx][0])
-                    if k >= 1:
-                        remaining_salary = salary_ceiling - salary
-                        if players_opposing_def < overlap_limit:
-                            if k == total_players - 1:
-                                valid_players = np.nonzero(
-                                    (pos > 0)
-                                    & (in_lineup == 0)
-                                    & (salaries <= remaining_salary)
-                                    & (salary + salaries >= salary_floor)
-                                )[0]
-                            else:
-                                valid_players = np.nonzero(
-                                    (pos > 0)
-                                    & (in_lineup == 0)
-                                    & (salaries <= remaining_salary)
-                                )[0]
-                            # grab names of players eligible
-                            plyr_list = ids[valid_players]
-                            # create np array of probability of being seelcted based on ownership and who is eligible at the position
-                            prob_list = ownership[valid_players]
-                            prob_list = prob_list / prob_list.sum()
-                            if k == total_players - 1:
-                                boosted_salaries = np.array(
-                                    [
-                                        salary_boost(s, salary_ceiling)
-                                        for s in salaries[valid_players]
-                                    ]
-                                )
-                                boosted_probabilities = prob_list * boosted_salaries
-                                boosted_probabilities /= (
-                                    boosted_probabilities.sum()
-                                )  # normalize to ensure it sums to 1
-                            try:
-                                if k == total_players - 1:
-                                    choice = rng.choice(
-                                        plyr_list, p=boosted_probabilities
-                                    )
-                                else:
-                                    choice = rng.choice(plyr_list, p=prob_list)
-                            except:
-                                # if remaining_salary <= np.min(salaries):
-                                #     reject_counters["salary_too_high"] += 1
-                                # else:
-                                #     reject_counters["salary_too_low"]
-                                salary = 0
-                                proj = 0
-                                if team_stack == "":
-                                    lineup = []
-                                else:
-                                    lineup = np.zeros(shape=pos_matrix.shape[1]).astype(
-                                        str
-                                    )
-                                player_teams = []
-                                def_opps = []
-                                players_opposing_def = 0
-                                lineup_matchups = []
-                                in_lineup.fill(0)  # Reset the in_lineup array
-                                k = 0  # Reset the player index
-                                continue  # Skip to the next iteration of the while loop
-                            choice_idx = np.nonzero(ids == choice)[0]
-                            lineup.append(str(choice))
-                            in_lineup[choice_idx] = 1
-                            salary += salaries[choice_idx]
-                            proj += projections[choice_idx]
-                            player_teams.append(teams[choice_idx][0])
-                            lineup_matchups.append(matchups[choice_idx[0]])
-                            if teams[choice_idx][0] == def_opp:
-                                players_opposing_def += 1
-                            if max_players_per_team is not None:
-                                team_count = Counter(player_teams)
-                                if any(
-                                    count > max_players_per_team
-                                    for count in team_count.values()
-                                ):
-                                    salary = 0
-                                    proj = 0
-                                    if team_stack == "":
-                                        lineup = []
-                                    else:
-                                        lineup = np.zeros(
-                                            shape=pos_matrix.shape[1]
-                                        ).astype(str)
-                                    player_teams = []
-                                    def_opps = []
-                                    players_opposing_def = 0
-                                    lineup_matchups = []
-                                    in_lineup.fill(0)  # Reset the in_lineup array
-                                    k = 0  # Reset the player index
-                                    continue  # Skip to the next iteration of the while loop
-                        else:
-                            if k == total_players - 1:
-                                valid_players = np.nonzero(
-                                    (pos > 0)
-                                    & (in_lineup == 0)
-                                    & (salaries <= remaining_salary)
-                                    & (salary + salaries >= salary_floor)
-                                    & (teams != def_opp)
-                                )[0]
-                            else:
-                                valid_players = np.nonzero(
-                                    (pos > 0)
-                                    & (in_lineup == 0)
-                                    & (salaries <= remaining_salary)
-                                    & (teams != def_opp)
-                                )[0]
-                            # grab names of players eligible
-                            plyr_list = ids[valid_players]
-                            # create np array of probability of being seelcted based on ownership and who is eligible at the position
-                            prob_list = ownership[valid_players]
-                            prob_list = prob_list / prob_list.sum()
-                            boosted_salaries = np.array(
-                                [
-                                    salary_boost(s, salary_ceiling)
-                                    for s in salaries[valid_players]
-                                ]
-                            )
-                            boosted_probabilities = prob_list * boosted_salaries
-                            boosted_probabilities /= (
-                                boosted_probabilities.sum()
-                            )  # normalize to ensure it sums to 1
-                            try:
-                                choice = rng.choice(plyr_list, p=boosted_probabilities)
-                            except:
-                                salary = 0
-                                proj = 0
-                                if team_stack == "":
-                                    lineup = []
-                                else:
-                                    lineup = np.zeros(shape=pos_matrix.shape[1]).astype(
-                                        str
-                                    )
-                                player_teams = []
-                                def_opps = []
-                                players_opposing_def = 0
-                                lineup_matchups = []
-                                in_lineup.fill(0)  # Reset the in_lineup array
-                                k = 0  # Reset the player index
-                                continue  # Skip to the next iteration of the while loop
-                                # if remaining_salary <= np.min(salaries):
-                                #     reject_counters["salary_too_high"] += 1
-                                # else:
-                                #     reject_counters["salary_too_low"]
-                            choice_idx = np.nonzero(ids == choice)[0]
-                            lineup.append(str(choice))
-                            in_lineup[choice_idx] = 1
-                            salary += salaries[choice_idx]
-                            proj += projections[choice_idx]
-                            player_teams.append(teams[choice_idx][0])
-                            lineup_matchups.append(matchups[choice_idx[0]])
-                            if teams[choice_idx][0] == def_opp:
-                                players_opposing_def += 1
-                            if max_players_per_team is not None:
-                                team_count = Counter(player_teams)
-                                if any(
-                                    count > max_players_per_team
-                                    for count in team_count.values()
-                                ):
-                                    salary = 0
-                                    proj = 0
-                                    if team_stack == "":
-                                        lineup = []
-                                    else:
-                                        lineup = np.zeros(
-                                            shape=pos_matrix.shape[1]
-                                        ).astype(str)
-                                    player_teams = []
-                                    def_opps = []
-                                    players_opposing_def = 0
-                                    lineup_matchups = []
-                                    in_lineup.fill(0)  # Reset the in_lineup array
-                                    k = 0  # Reset the player index
-                                    continue  # Skip to the next iteration of the while loop
-                    k += 1
-                # Must have a reasonable salary
-                # if salary > salary_ceiling:
-                #     reject_counters["salary_too_high"] += 1
-                # elif salary < salary_floor:
-                #     reject_counters["salary_too_low"] += 1
-                if salary >= salary_floor and salary <= salary_ceiling:
-                    # Must have a reasonable projection (within 60% of optimal) **people make a lot of bad lineups
-                    if proj >= reasonable_projection:
-                        if len(set(lineup_matchups)) > 1:
-                            if max_players_per_team is not None:
-                                team_count = Counter(player_teams)
-                                if all(
-                                    count <= max_players_per_team
-                                    for count in team_count.values()
-                                ):
-                                    reject = False
-                                    lus[lu_num] = {
-                                        "Lineup": lineup,
-                                        "Wins": 0,
-                                        "Top10": 0,
-                                        "ROI": 0,
-                                        "Cashes": 0,
-                                        "Type": "generated",
-                                    }
-                                    if len(set(lineup)) != 9:
-                                        print(
-                                            "non stack lineup dupes",
-                                            lu_num,
-                                            plyr_stack_indices,
-                                            str(lu_num),
-                                            salaries[plyr_stack_indices],
-                                            lineup,
-                                            stack_len,
-                                            team_stack,
-                                            x,
-                                        )
-                            else:
-                                reject = False
-                                lus[lu_num] = {
-                                    "Lineup": lineup,
-                                    "Wins": 0,
-                                    "Top10": 0,
-                                    "ROI": 0,
-                                    "Cashes": 0,
-                                    "Type": "generated",
-                                }
-                                if len(set(lineup)) != 9:
-                                    print(
-                                        "stack lineup dupes",
-                                        lu_num,
-                                        plyr_stack_indices,
-                                        str(lu_num),
-                                        salaries[plyr_stack_indices],
-                                        lineup,
-                                        stack_len,
-                                        team_stack,
-                                        x,
-                                    )
-                            # complete = 'completed'
-                            # print(str(lu_num) + ' ' + complete)
-                    #     else:
-                    #         reject_counters["invalid_matchups"] += 1
-                    # else:
-                    #     reject_counters["projection_too_low"] += 1
-            else:
-                salary = 0
-                proj = 0
-                if sum(in_lineup) != 0:
-                    in_lineup.fill(0)
-                player_teams = []
-                def_opps = []
-                lineup_matchups = []
-                filled_pos = np.zeros(shape=pos_matrix.shape[1])
-                team_stack_len = 0
-                k = 0
-                stack = True
-                lineup = np.zeros(shape=pos_matrix.shape[1]).astype(str)
-                valid_team = np.nonzero(teams == team_stack)[0]
-                # select qb
-                qb = np.unique(
-                    valid_team[np.nonzero(pos_matrix[valid_team, 1] > 0)[0]]
-                )[0]
-                salary += salaries[qb]
-                proj += projections[qb]
-                # print(salary)
-                team_stack_len += 1
-                lineup[1] = ids[qb]
-                in_lineup[qb] = 1
-                lineup_matchups.append(matchups[qb])
-                valid_players = np.unique(
-                    valid_team[np.nonzero(pos_matrix[valid_team, 4:8] > 0)[0]]
-                )
-                player_teams.append(teams[qb])
-                players_opposing_def = 0
-                plyr_list = ids[valid_players]
-                prob_list = ownership[valid_players]
-                prob_list = prob_list / prob_list.sum()
-                while stack:
-                    try:
-                        choices = rng.choice(
-                            a=plyr_list, p=prob_list, size=stack_len, replace=False
-                        )
-                        if len(set(choices)) != len(choices):
-                            print(
-                                "choice dupe",
-                                plyr_stack_indices,
-                                str(lu_num),
-                                salaries[plyr_stack_indices],
-                                lineup,
-                                stack_len,
-                                team_stack,
-                                x,
-                            )
-                    except:
-                        stack = False
-                        continue
-                    plyr_stack_indices = np.nonzero(np.in1d(ids, choices))[0]
-                    x = 0
-                    for p in plyr_stack_indices:
-                        player_placed = False
-                        for l in np.nonzero(pos_matrix[p] > 0)[0]:
-                            if lineup[l] == "0.0":
-                                lineup[l] = ids[p]
-                                lineup_matchups.append(matchups[p])
-                                player_teams.append(teams[p])
-                                x += 1
-                                player_placed = True
-                                break
-                            if player_placed:
-                                break
-                    # print(plyr_stack_indices, str(lu_num), salaries[plyr_stack_indices], lineup, stack_len, x)
-                    if x == stack_len:
-                        in_lineup[plyr_stack_indices] = 1
-                        salary += sum(salaries[plyr_stack_indices])
-                        # rint(salary)
-                        proj += sum(projections[plyr_stack_indices])
-                        # print(proj)
-                        team_stack_len += stack_len
-                        x = 0
-                        stack = False
-                    else:
-                        stack = False
-                # print(sum(in_lineup), stack_len)
-                for ix, (l, pos) in enumerate(zip(lineup, pos_matrix.T)):
-                    if l == "0.0":
-                        if k < 1:
-                            valid_players = np.nonzero(
-                                (pos > 0) & (in_lineup == 0) & (opponents != team_stack)
-                            )[0]
-                            # grab names of players eligible
-                            plyr_list = ids[valid_players]
-                            # create np array of probability of being selected based on ownership and who is eligible at the position
-                            prob_list = ownership[valid_players]
-                            prob_list = prob_list / prob_list.sum()
-                            try:
-                                choice = rng.choice(plyr_list, p=prob_list)
-                            except:
-                                print("find failed on stack and first player selection")
-
-                            #    print(k, pos)
-                            choice_idx = np.nonzero(ids == choice)[0]
-                            in_lineup[choice_idx] = 1
-                            try:
-                                lineup[ix] = str(choice)
-                            except IndexError:
-                                print(lineup, choice, ix)
-                            salary += salaries[choice_idx]
-                            proj += projections[choice_idx]
-                            def_opp = opponents[choice_idx][0]
-                            lineup_matchups.append(matchups[choice_idx[0]])
-                            player_teams.append(teams[choice_idx][0])
-                            k += 1
-                        elif k >= 1:
-                            remaining_salary = salary_ceiling - salary
-                            if players_opposing_def < overlap_limit:
-                                if k == total_players - 1:
-                                    valid_players = np.nonzero(
-                                        (pos > 0)
-                                        & (in_lineup == 0)
-                                        & (salaries <= remaining_salary)
-                                        & (salary + salaries >= salary_floor)
-                                    )[0]
-                                else:
-                                    valid_players = np.nonzero(
-                                        (pos > 0)
-                                        & (in_lineup == 0)
-                                        & (salaries <= remaining_salary)
-                                    )[0]
-                                # grab names of players eligible
-                                plyr_list = ids[valid_players]
-                                # create np array of probability of being seelcted based on ownership and who is eligible at the position
-                                prob_list = ownership[valid_players]
-                                prob_list = prob_list / prob_list.sum()
-                                if k == total_players - 1:
-                                    boosted_salaries = np.array(
-                                        [
-                                            salary_boost(s, salary_ceiling)
-                                            for s in salaries[valid_players]
-                                        ]
-                                    )
-                                    boosted_probabilities = prob_list * boosted_salaries
-                                    boosted_probabilities /= (
-                                        boosted_probabilities.sum()
-                                    )  # normalize to ensure it sums to 1
-                                try:
-                                    if k == total_players - 1:
-                                        choice = rng.choice(
-                                            plyr_list, p=boosted_probabilities
-                                        )
-                                    else:
-                                        choice = rng.choice(plyr_list, p=prob_list)
-                                except:
-                                    salary = 0
-                                    proj = 0
-                                    if team_stack == "":
-                                        lineup = []
-                                    else:
-                                        lineup = np.zeros(
-                                            shape=pos_matrix.shape[1]
-                                        ).astype(str)
-                                    player_teams = []
-                                    def_opps = []
-                                    players_opposing_def = 0
-                                    lineup_matchups = []
-                                    in_lineup.fill(0)  # Reset the in_lineup array
-                                    k = 0  # Reset the player index
-                                    continue  # Skip to the next iteration of the while loop
-                                    # if remaining_salary <= np.min(salaries):
-                                    #     reject_counters["salary_too_high"] += 1
-                                    # else:
-                                    #     reject_counters["salary_too_low"]
-                                choice_idx = np.nonzero(ids == choice)[0]
-                                try:
-                                    lineup[ix] = str(choice)
-                                except IndexError:
-                                    print(lineup, choice, ix)
-                                in_lineup[choice_idx] = 1
-                                salary += salaries[choice_idx]
-                                proj += projections[choice_idx]
-                                player_teams.append(teams[choice_idx][0])
-                                lineup_matchups.append(matchups[choice_idx[0]])
-                                if max_players_per_team is not None:
-                                    team_count = Counter(player_teams)
-                                    if any(
-                                        count > max_players_per_team
-                                        for count in team_count.values()
-                                    ):
-                                        salary = 0
-                                        proj = 0
-                                        if team_stack == "":
-                                            lineup = []
-                                        else:
-                                            lineup = np.zeros(
-                                                shape=pos_matrix.shape[1]
-                                            ).astype(str)
-                                        player_teams = []
-                                        def_opps = []
-                                        players_opposing_def = 0
-                                        lineup_matchups = []
-                                        in_lineup.fill(0)  # Reset the in_lineup array
-                                        k = 0  # Reset the player index
-                                        continue  # Skip to the next iteration of the while loop
-                                if teams[choice_idx][0] == def_opp:
-                                    players_opposing_def += 1
-                                if teams[choice_idx][0] == team_stack:
-                                    team_stack_len += 1
-                            else:
-                                if k == total_players - 1:
-                                    valid_players = np.nonzero(
-                                        (pos > 0)
-                                        & (in_lineup == 0)
-                                        & (salaries <= remaining_salary)
-                                        & (salary + salaries >= salary_floor)
-                                        & (teams != def_opp)
-                                    )[0]
-                                else:
-                                    valid_players = np.nonzero(
-                                        (pos > 0)
-                                        & (in_lineup == 0)
-                                        & (salaries <= remaining_salary)
-                                        & (teams != def_opp)
-                                    )[0]
-                                # grab names of players eligible
-                                plyr_list = ids[valid_players]
-                                # create np array of probability of being seelcted based on ownership and who is eligible at the position
-                                prob_list = ownership[valid_players]
-                                prob_list = prob_list / prob_list.sum()
-                                boosted_salaries = np.array(
-                                    [
-                                        salary_boost(s, salary_ceiling)
-                                        for s in salaries[valid_players]
-                                    ]
-                                )
-                                boosted_probabilities = prob_list * boosted_salaries
-                                boosted_probabilities /= (
-                                    boosted_probabilities.sum()
-                                )  # normalize to ensure it sums to 1
-                                try:
-                                    choice = rng.choice(
-                                        plyr_list, p=boosted_probabilities
-                                    )
-                                except:
-                                    salary = 0
-                                    proj = 0
-                                    if team_stack == "":
-                                        lineup = []
-                                    else:
-                                        lineup = np.zeros(
-                                            shape=pos_matrix.shape[1]
-                                        ).astype(str)
-                                    player_teams = []
-                                    def_opps = []
-                                    players_opposing_def = 0
-                                    lineup_matchups = []
-                                    in_lineup.fill(0)  # Reset the in_lineup array
-                                    k = 0  # Reset the player index
-                                    continue  # Skip to the next iteration of the while loop
-                                    # if remaining_salary <= np.min(salaries):
-                                    #     reject_counters["salary_too_high"] += 1
-                                    # else:
-                                    #     reject_counters["salary_too_low"]
-                                choice_idx = np.nonzero(ids == choice)[0]
-                                lineup[ix] = str(choice)
-                                in_lineup[choice_idx] = 1
-                                salary += salaries[choice_idx]
-                                proj += projections[choice_idx]
-                                player_teams.append(teams[choice_idx][0])
-                                lineup_matchups.append(matchups[choice_idx[0]])
-                                if teams[choice_idx][0] == def_opp:
-                                    players_opposing_def += 1
-                                if teams[choice_idx][0] == team_stack:
-                                    team_stack_len += 1
-                                if max_players_per_team is not None:
-                                    team_count = Counter(player_teams)
-                                    if any(
-                                        count > max_players_per_team
-                                        for count in team_count.values()
-                                    ):
-                                        salary = 0
-                                        proj = 0
-                                        if team_stack == "":
-                                            lineup = []
-                                        else:
-                                            lineup = np.zeros(
-                                                shape=pos_matrix.shape[1]
-                                            ).astype(str)
-                                        player_teams = []
-                                        def_opps = []
-                                        players_opposing_def = 0
-                                        lineup_matchups = []
-                                        in_lineup.fill(0)  # Reset the in_lineup array
-                                        k = 0  # Reset the player index
-                                        continue  # Skip to the next iteration of the while loop
-                            k += 1
-                    else:
-                        k += 1
-                # Must have a reasonable salary
-                if team_stack_len >= stack_len:
-                    if salary >= salary_floor and salary <= salary_ceiling:
-                        # loosening reasonable projection constraint for team stacks
-                        if proj >= reasonable_stack_projection:
-                            if len(set(lineup_matchups)) > 1:
-                                if max_players_per_team is not None:
-                                    team_count = Counter(player_teams)
-                                    if all(
-                                        count <= max_players_per_team
-                                        for count in team_count.values()
-                                    ):
-                                        reject = False
-                                        lus[lu_num] = {
-                                            "Lineup": lineup,
-                                            "Wins": 0,
-                                            "Top10": 0,
-                                            "ROI": 0,
-                                            "Cashes": 0,
-                                            "Type": "generated",
-                                        }
-                                        if len(set(lineup)) != 9:
-                                            print(
-                                                "stack lineup dupes",
-                                                lu_num,
-                                                plyr_stack_indices,
-                                                str(lu_num),
-                                                salaries[plyr_stack_indices],
-                                                lineup,
-                                                stack_len,
-                                                team_stack,
-                                                x,
-                                            )
-
-                                else:
-                                    reject = False
-                                    lus[lu_num] = {
-                                        "Lineup": lineup,
-                                        "Wins": 0,
-                                        "Top10": 0,
-                                        "ROI": 0,
-                                        "Cashes": 0,
-                                        "Type": "generated",
-                                    }
-                                    if len(set(lineup)) != 9:
-                                        print(
-                                            "stack lineup dupes",
-                                            lu_num,
-                                            plyr_stack_indices,
-                                            str(lu_num),
-                                            salaries[plyr_stack_indices],
-                                            lineup,
-                                            stack_len,
-                                            team_stack,
-                                            x,
-                                        )
-                #             else:
-                #                 reject_counters["invalid_matchups"] += 1
-                #         else:
-                #             reject_counters["projection_too_low"] += 1
-                #     else:
-                #         if salary > salary_ceiling:
-                #             reject_counters["salary_too_high"] += 1
-                #         elif salary < salary_floor:
-                #             reject_counters["salary_too_low"] += 1
-                # else:
-                #     reject_counters["stack_length_insufficient"] += 1
-        # return lus, reject_counters
-        return lus
+        arrays["lineups"][start:stop] = lineups
+        return -1 if failed < 0 else start + failed
 
     def generate_field_lineups(self):
+        fl = self.field_lineups
+        self.field_lineups = self.cached_stage(
+            "field",
+            (
+                self.stage_keys.get("optimal"),
+                self.field_size,
+                fl.lineups,
+                fl.counts,
+                fl.types,
+                self.seed,
+            ),
+            self.fill_field_lineups,
+            seeded_only=True,
+        )
+
+    # generates lineups until the field is full
+    @instrumentation.timed("field generation")
+    def fill_field_lineups(self):
         diff = self.field_size - len(self.field_lineups)
         if diff <= 0:
             print(
@@ -1528,7 +1245,7 @@ class NFL_GPP_Simulator:
             )
         else:
             print("Generating " + str(diff) + " lineups.")
-            ids = []
+            instrumentation.count("field generation", diff)
             ownership = []
             salaries = []
             projections = []
@@ -1554,7 +1271,6 @@ class NFL_GPP_Simulator:
                         self.player_dict[k]["Name"],
                         " name mismatch between projections and player ids!",
                     )
-                ids.append(self.player_dict[k]["ID"])
                 ownership.append(self.player_dict[k]["Ownership"])
                 salaries.append(self.player_dict[k]["Salary"])
                 if self.player_dict[k]["fieldFpts"] >= self.projection_minimum:
@@ -1571,317 +1287,270 @@ class NFL_GPP_Simulator:
                     else:
                         pos_list.append(0)
                 positions.append(np.array(pos_list))
-            in_lineup = np.zeros(shape=len(ids))
-            ownership = np.array(ownership)
-            salaries = np.array(salaries)
-            projections = np.array(projections)
-            pos_matrix = np.array(positions)
-            ids = np.array(ids)
-            optimal_score = self.optimal_score
-            salary_floor = self.min_lineup_salary
-            salary_ceiling = self.salary
-            max_pct_off_optimal = self.max_pct_off_optimal
-            stack_usage = self.pct_field_using_stacks
-            teams = np.array(teams)
-            opponents = np.array(opponents)
-            overlap_limit = self.overlap_limit
-            problems = []
-            stacks = np.random.binomial(n=1, p=self.pct_field_using_stacks, size=diff)
-            stack_len = np.random.choice(
+            # the generator works purely on integer indices, so encode teams and games
+            team_codes = {
+                t: i for i, t in enumerate(sorted(set(teams) | set(opponents)))
+            }
+            matchup_codes = {m: i for i, m in enumerate(set(matchups))}
+            ownership = np.array(ownership, dtype=np.float64)
+            salaries = np.array(salaries, dtype=np.float64)
+            projections = np.array(projections, dtype=np.float64)
+            pos_matrix = np.array(positions, dtype=np.int8)
+            teams = np.array([team_codes[t] for t in teams], dtype=np.int64)
+            opponents = np.array([team_codes[t] for t in opponents], dtype=np.int64)
+            matchups = np.array([matchup_codes[m] for m in matchups], dtype=np.int64)
+            max_players_per_team = 4 if self.site == "fd" else 0
+            rng = np.random.default_rng(seed_sequence(self.entropy, field_stream, 0))
+            stacks = rng.binomial(n=1, p=self.pct_field_using_stacks, size=diff)
+            stack_len = rng.choice(
                 a=[1, 2],
                 p=[1 - self.pct_field_double_stacks, self.pct_field_double_stacks],
                 size=diff,
-            )
-            max_stack_len = 2
-            num_players_in_roster = len(self.roster_construction)
+            ).astype(np.int64)
             a = list(self.stacks_dict.keys())
             p = np.array(list(self.stacks_dict.values()))
             probs = p / sum(p)
-            stacks = stacks.astype(str)
-            for i in range(len(stacks)):
-                if stacks[i] == "1":
-                    choice = random.choices(a, weights=probs, k=1)
-                    stacks[i] = choice[0]
-                else:
-                    stacks[i] = ""
-            # creating tuples of the above np arrays plus which lineup number we are going to create
-            for i in range(diff):
-                lu_tuple = (
-                    i,
-                    ids,
-                    in_lineup,
-                    pos_matrix,
-                    ownership,
-                    salary_floor,
-                    salary_ceiling,
-                    optimal_score,
-                    salaries,
-                    projections,
-                    max_pct_off_optimal,
-                    teams,
-                    opponents,
-                    stacks[i],
-                    stack_len[i],
-                    overlap_limit,
-                    max_stack_len,
-                    matchups,
-                    num_players_in_roster,
-                    self.site,
-                )
-                problems.append(lu_tuple)
+            stack_teams = np.full(diff, -1, dtype=np.int64)
+            if stacks.any():
+                choices = rng.choice(len(a), size=int(stacks.sum()), p=probs)
+                stack_teams[stacks == 1] = [team_codes[a[c]] for c in choices]
+            lineup_seeds = seed_sequence(self.entropy, field_stream, 1).generate_state(
+                diff
+            )
+            limits = (
+                len(team_codes),
+                self.min_lineup_salary,
+                self.salary,
+                self.optimal_score,
+                self.max_pct_off_optimal,
+                self.overlap_limit,
+                max_players_per_team,
+                self.max_lineup_attempts,
+            )
             start_time = time.time()
-            with mp.Pool() as pool:
-                output = pool.starmap(self.generate_lineups, problems)
-                print(
-                    "number of running processes =",
-                    pool.__dict__["_processes"]
-                    if (pool.__dict__["_state"]).upper() == "RUN"
-                    else None,
-                )
-                pool.close()
-                pool.join()
+            # the player arrays go into shared memory once rather than being pickled
+            # into every task, and workers write their lineups straight into place
+            with shared_arrays.SharedArrays(
+                pos_matrix=pos_matrix,
+                ownership=ownership,
+                salaries=salaries,
+                projections=projections,
+                teams=teams,
+                opponents=opponents,
+                matchups=matchups,
+                stack_teams=stack_teams,
+                stack_lens=stack_len,
+                lineup_seeds=lineup_seeds.astype(np.int64),
+                lineups=((diff, pos_matrix.shape[1]), np.uint16),
+            ) as shared:
+                # the first lineup compiles the generator (forked workers inherit it) and
+                # the next few are timed to size the blocks handed to the pool
+                pilot = min(diff, 1 + self.pilot_lineups)
+                failed = self.generate_lineups(0, 1, *limits, arrays=shared.arrays)
+                self.check_generated([failed], stack_teams, team_codes)
+                pilot_time = time.time()
+                failed = self.generate_lineups(1, pilot, *limits, arrays=shared.arrays)
+                self.check_generated([failed], stack_teams, team_codes)
+                seconds_per_lineup = (time.time() - pilot_time) / max(1, pilot - 1)
+                blocks = plan_blocks(pilot, diff, seconds_per_lineup, mp.cpu_count())
+                problems = [(start, stop) + limits for start, stop in blocks]
+                with mp.Pool(
+                    initializer=shared_arrays.attach_worker, initargs=(shared.spec,)
+                ) as pool:
+                    # blocks are already sized, don't let the pool batch them up again
+                    failed = pool.starmap(self.generate_lineups, problems, chunksize=1)
+                    print(
+                        "number of running processes =",
+                        pool.__dict__["_processes"]
+                        if (pool.__dict__["_state"]).upper() == "RUN"
+                        else None,
+                    )
+                    pool.close()
+                    pool.join()
+                self.check_generated(failed, stack_teams, team_codes)
+                # player order matches self.player_keys, so the indices go straight in
+                self.field_lineups.append(shared["lineups"], "generated")
             print("pool closed")
-            if len(self.field_lineups) == 0:
-                new_keys = list(range(0, self.field_size))
-            else:
-                new_keys = list(
-                    range(max(self.field_lineups.keys()) + 1, self.field_size)
-                )
-            nk = new_keys[0]
-            # overall_reject_counters = defaultdict(int)
-            # for i, (lineup, reject_counter) in enumerate(output):
-            #     if nk in self.field_lineups.keys():
-            #         print("bad lineups dict, please check dk_data files")
-
-            #     # Merge the reject counters into the overall counter
-            #     for key, value in reject_counter.items():
-            #         overall_reject_counters[key] += value
-
-            #     self.field_lineups[nk] = lineup  # Adjusted to handle the unpacked tuple
-            #     nk += 1
-            for i, o in enumerate(output):
-                if nk in self.field_lineups.keys():
-                    print("bad lineups dict, please check dk_data files")
-                self.field_lineups[nk] = o[i]
-                nk += 1
             end_time = time.time()
             print("lineups took " + str(end_time - start_time) + " seconds")
             print(str(diff) + " field lineups successfully generated")
-            # print("Reject counters:", dict(overall_reject_counters))
-
-            # print(self.field_lineups)
+        return self.field_lineups
+
+    def check_generated(self, failed, stack_teams, team_codes):
+        # raises on the first lineup generate_lineups gave up on, if any did
+        failed = [i for i in failed if i >= 0]
+        if not failed:
+            return
+        i = min(failed)
+        stack = ""
+        if stack_teams[i] >= 0:
+            team = [t for t, code in team_codes.items() if code == stack_teams[i]][0]
+            stack = " stacking " + team
+        raise RuntimeError(
+            "couldn't build field lineup {}{} in {} attempts. a stacked team needs a QB "
+            "and WR/TE to stack, and min_lineup_salary, max_pct_off_optimal, "
+            "num_players_vs_def and the team limits have to leave some lineups "
+            "possible".format(i, stack, self.max_lineup_attempts)
+        )
 
     def calc_gamma(self, mean, sd):
         alpha = (mean / sd) ** 2
         beta = sd**2 / mean
         return alpha, beta
 
+    def build_game_sampler(self, team1_id, team2_id):
+        team1, team2 = self.teams_dict[team1_id], self.teams_dict[team2_id]
+        rows1, positions1 = self.team_correlations[team1_id]
+        rows2, positions2 = self.team_correlations[team2_id]
+        corr_matrix = game_correlation(
+            np.concatenate((rows1, rows2)),
+            np.repeat([0, 1], [len(team1), len(team2)]),
+            np.concatenate((positions1, positions2)),
+        )
+        game = team1 + team2
+        means = np.array([player["Fpts"] for player in game])
+        # factored once per distinct game and cached, sampling is then a single matmul
+        factor = game_factor([player["StdDev"] for player in game], corr_matrix)
+        return means, factor
+
     @staticmethod
     def run_simulation_for_game(
-        team1_id,
-        team1,
-        team2_id,
-        team2,
-        qb_samples_dict,
-        num_iterations,
-        roster_construction,
+        rows,
+        means,
+        factor,
+        seed,
+        sampler="mc",
+        tilts=None,
+        tilt_seed=None,
+        first_sim=0,
+        num_sims=None,
     ):
-        # Define correlations between positions
-
-        def get_corr_value(player1, player2):
-            # If players are on the same team and have the same position
-            if (
-                player1["Team"] == player2["Team"]
-                and player1["Position"][0] == player2["Position"][0]
-            ):
-                return -0.25
-
-            if player1["Team"] != player2["Team"]:
-                player_2_pos = "Opp " + str(player2["Position"][0])
-            else:
-                player_2_pos = player2["Position"][0]
-
-            # Fetch correlation value based on player1's primary position for player2's primary position
-            return player1["Correlations"][player_2_pos]
-
-        def build_covariance_matrix(players):
-            N = len(players)
-            matrix = [[0 for _ in range(N)] for _ in range(N)]
-            corr_matrix = [[0 for _ in range(N)] for _ in range(N)]
-
-            for i in range(N):
-                for j in range(N):
-                    if i == j:
-                        matrix[i][j] = (
-                            players[i]["StdDev"] ** 2
-                        )  # Variance on the diagonal
-                        corr_matrix[i][j] = 1
-                    else:
-                        matrix[i][j] = (
-                            get_corr_value(players[i], players[j])
-                            * players[i]["StdDev"]
-                            * players[j]["StdDev"]
-                        )
-                        corr_matrix[i][j] = get_corr_value(players[i], players[j])
-            return matrix, corr_matrix
-
-        def ensure_positive_semidefinite(matrix):
-            eigs = np.linalg.eigvals(matrix)
-            if np.any(eigs < 0):
-                jitter = abs(min(eigs)) + 1e-6  # a small value
-                matrix += np.eye(len(matrix)) * jitter
-            return matrix
-
-        game = team1 + team2
-        covariance_matrix, corr_matrix = build_covariance_matrix(game)
-        # print(team1_id, team2_id)
-        # print(corr_matrix)
-        corr_matrix = np.array(corr_matrix)
-
-        # Given eigenvalues and eigenvectors from previous code
-        eigenvalues, eigenvectors = np.linalg.eigh(covariance_matrix)
-
-        # Set negative eigenvalues to zero
-        eigenvalues[eigenvalues < 0] = 0
-
-        # Reconstruct the matrix
-        covariance_matrix = eigenvectors.dot(np.diag(eigenvalues)).dot(eigenvectors.T)
-
-        try:
-            samples = multivariate_normal.rvs(
-                mean=[player["Fpts"] for player in game],
-                cov=covariance_matrix,
-                size=num_iterations,
+        # draws every sim of one game at once straight into the shared outcome matrix,
+        # rows of -1 are players without an entry in the player ids file. when simulating in
+        # blocks the matrix holds one block, the first num_sims columns of it being filled
+        # with sims first_sim onwards. importance sampled (tilted) runs are always simulated
+        # in blocks, and return the sims' log likelihood ratios for mixture_weights
+        player_outcomes = shared_arrays.worker_arrays["player_outcomes"]
+        if num_sims is not None:
+            player_outcomes = player_outcomes[:, :num_sims]
+        samples = np.empty((len(rows), player_outcomes.shape[1]), dtype=np.float32)
+        log_ratios = None
+        if num_sims is None:
+            rng = np.random.default_rng(seed)
+            sample_game(samples, means, factor, rng, sampler)
+        else:
+            log_ratios = sample_sims(
+                samples, means, factor, seed, first_sim, sampler, tilts, tilt_seed
             )
-        except:
-            print(team1_id, team2_id, "bad matrix")
-
-        player_samples = []
-        for i, player in enumerate(game):
-            if "QB" in player["Position"]:
-                sample = samples[:, i]
-            else:
-                sample = samples[:, i]
-            # if player['Team'] in ['LAR','SEA']:
-            #     print(player['Name'], player['Fpts'], player['StdDev'], sample, np.mean(sample), np.std(sample))
-            player_samples.append(sample)
-
-        temp_fpts_dict = {}
-        # print(team1_id, team2_id, len(game), uniform_samples.T.shape, len(player_samples), covariance_matrix.shape )
-
-        for i, player in enumerate(game):
-            temp_fpts_dict[player["ID"]] = player_samples[i]
-
-        # fig, (ax1, ax2, ax3,ax4) = plt.subplots(4, figsize=(15, 25))
-        # fig.tight_layout(pad=5.0)
-
-        # for i, player in enumerate(game):
-        #     sns.kdeplot(player_samples[i], ax=ax1, label=player['Name'])
-
-        # ax1.legend(loc='upper right', fontsize=14)
-        # ax1.set_xlabel('Fpts', fontsize=14)
-        # ax1.set_ylabel('Density', fontsize=14)
-        # ax1.set_title(f'Team {team1_id}{team2_id} Distributions', fontsize=14)
-        # ax1.tick_params(axis='both', which='both', labelsize=14)
-
-        # y_min, y_max = ax1.get_ylim()
-        # ax1.set_ylim(y_min, y_max*1.1)
-
-        # ax1.set_xlim(-5, 50)
-
-        # # # Sorting players and correlating their data
-        # player_names = [f"{player['Name']} ({player['Position']})" if player['Position'] is not None else f"{player['Name']} (P)" for player in game]
-
-        # # # Ensuring the data is correctly structured as a 2D array
-        # sorted_samples_array = np.array(player_samples)
-        # if sorted_samples_array.shape[0] < sorted_samples_array.shape[1]:
-        #     sorted_samples_array = sorted_samples_array.T
-
-        # correlation_matrix = pd.DataFrame(np.corrcoef(sorted_samples_array.T), columns=player_names, index=player_names)
-
-        # sns.heatmap(correlation_matrix, annot=True, ax=ax2, cmap='YlGnBu', cbar_kws={"shrink": .5})
-        # ax2.set_title(f'Correlation Matrix for Game {team1_id}{team2_id}', fontsize=14)
-
-        # original_corr_matrix = pd.DataFrame(corr_matrix, columns=player_names, index=player_names)
-        # sns.heatmap(original_corr_matrix, annot=True, ax=ax3, cmap='YlGnBu', cbar_kws={"shrink": .5})
-        # ax3.set_title(f'Original Correlation Matrix for Game {team1_id}{team2_id}', fontsize=14)
-
-        # cov_matrix = pd.DataFrame(covariance_matrix, columns=player_names, index=player_names)
-        # sns.heatmap(cov_matrix, annot=True, ax=ax4, cmap='YlGnBu', cbar_kws={"shrink": .5})
-        # ax4.set_title(f'Original Covariance Matrix for Game {team1_id}{team2_id}', fontsize=14)
-
-        # plt.savefig(f'output/Team_{team1_id}{team2_id}_Distributions_Correlation.png', bbox_inches='tight')
-        # plt.close()
-
-        return temp_fpts_dict
+        found = rows >= 0
+        player_outcomes[rows[found]] = samples[found]
+        return log_ratios
 
     def run_tournament_simulation(self):
         print("Running " + str(self.num_iterations) + " simulations")
-        for f in self.field_lineups:
-            if len(self.field_lineups[f]["Lineup"]) != 9:
-                print("bad lineup", f, self.field_lineups[f])
-
         start_time = time.time()
-        temp_fpts_dict = {}
-        qb_samples_dict = {}  # keep track of already simmed quarterbacks
-        size = self.num_iterations
+        num_players = len(self.player_ids)
+        simulated = np.zeros(num_players, dtype=bool)
         game_simulation_params = []
-        for m in self.matchups:
-            game_simulation_params.append(
-                (
-                    m[0],
-                    self.teams_dict[m[0]],
-                    m[1],
-                    self.teams_dict[m[1]],
-                    qb_samples_dict,
-                    self.num_iterations,
-                    self.roster_construction,
+        seeds = seed_sequence(self.entropy, games_stream).generate_state(
+            len(self.matchups)
+        )
+        memberships = None
+        if self.importance is not None:
+            memberships = self.importance_memberships()
+            if memberships is None:
+                print("no lineups from tournament_lineups.csv to tilt the sims towards")
+                self.importance = None
+        game_memberships = []
+        # games in a fixed order so the stored outcomes can be matched up on later runs
+        for seed, m in zip(seeds, sorted(self.matchups)):
+            team1, team2 = self.teams_dict[m[0]], self.teams_dict[m[1]]
+            rows = np.array(
+                [self.id_to_index.get(p["ID"], -1) for p in team1 + team2],
+                dtype=np.int64,
+            )
+            simulated[rows[rows >= 0]] = True
+            means, factor = self.build_game_sampler(m[0], m[1])
+            game_simulation_params.append((rows, means, factor, seed, self.sampler))
+            if memberships is not None:
+                game_memberships.append(
+                    np.where((rows >= 0)[:, None], memberships[rows], 0)
                 )
+        # one tilt per lineup, over every game of the slate together
+        tilts = [None] * len(game_simulation_params)
+        tilt_seed = None
+        if memberships is not None:
+            tilts = lineup_tilts(
+                [params[2] for params in game_simulation_params],
+                game_memberships,
+                self.importance,
             )
-        with mp.Pool() as pool:
-            results = pool.starmap(self.run_simulation_for_game, game_simulation_params)
-
-        for res in results:
-            temp_fpts_dict.update(res)
-
-        # generate arrays for every sim result for each player in the lineup and sum
-        fpts_array = np.zeros(shape=(self.field_size, self.num_iterations))
-        # converting payout structure into an np friendly format, could probably just do this in the load contest function
-        payout_array = np.array(list(self.payout_structure.values()))
-        # subtract entry fee
-        payout_array = payout_array - self.entry_fee
-        l_array = np.full(
-            shape=self.field_size - len(payout_array), fill_value=-self.entry_fee
+            tilt_seed = seed_sequence(self.entropy, tilt_stream).generate_state(1)[0]
+        game_simulation_params = [
+            params + (tilt, tilt_seed)
+            for params, tilt in zip(game_simulation_params, tilts)
+        ]
+        for i in np.flatnonzero(~simulated):
+            print("cant find player in sim dict", self.player_keys[i])
+        # everything the sampled outcomes depend on
+        input_hash = hash_inputs(
+            self.num_iterations,
+            self.player_ids,
+            [params[:3] for params in game_simulation_params],
+            self.sampler,
+            self.seed,
         )
-        payout_array = np.concatenate((payout_array, l_array))
-        for index, values in self.field_lineups.items():
-            try:
-                fpts_sim = sum([temp_fpts_dict[player] for player in values["Lineup"]])
-            except KeyError:
-                for player in values["Lineup"]:
-                    if player not in temp_fpts_dict.keys():
-                        for k, v in self.player_dict.items():
-                            if v["ID"] == player:
-                                print(k, v)
-                # print('cant find player in sim dict', values["Lineup"], temp_fpts_dict.keys())
-            # store lineup fpts sum in 2d np array where index (row) corresponds to index of field_lineups and columns are the fpts from each sim
-            fpts_array[index] = fpts_sim
-        ranks = np.argsort(fpts_array, axis=0)[::-1]
-        # count wins, top 10s vectorized
-        wins, win_counts = np.unique(ranks[0, :], return_counts=True)
-        t10, t10_counts = np.unique(ranks[0:9:], return_counts=True)
-        roi = payout_array[np.argsort(ranks, axis=0)].sum(axis=1)
-        # summing up ach lineup, probably a way to v)ectorize this too (maybe just turning the field dict into an array too)
-        for idx in self.field_lineups.keys():
-            # Winning
-            if idx in wins:
-                self.field_lineups[idx]["Wins"] += win_counts[np.where(wins == idx)][0]
-            # Top 10
-            if idx in t10:
-                self.field_lineups[idx]["Top10"] += t10_counts[np.where(t10 == idx)][0]
-            # can't figure out how to get roi for each lineup index without iterating and iterating is slow
-            if self.use_contest_data:
-                self.field_lineups[idx]["ROI"] += roi[idx]
+
+        fl = self.field_lineups
+        if self.entries_only and not len(fl.rows_of_type("input")):
+            print("no lineups from tournament_lineups.csv, ranking the whole field")
+            self.entries_only = False
+        # everything the results depend on besides the outcomes
+        results_inputs = (
+            input_hash,
+            fl.lineups,
+            fl.counts,
+            fl.types,
+            fl.finish_cutoffs(),
+            self.payout_structure,
+            self.entry_fee,
+            self.use_contest_data,
+            self.entries_only,
+            self.histogram_width,
+            self.target_se,
+            # the blocks a target_se run can stop after
+            self.adaptive_block_size() if self.target_se is not None else None,
+            self.importance,
+            self.seed,
+        )
+        if self.time_budget is not None:
+            # where a time budget runs out depends on the clock, a rerun couldn't
+            # reproduce the results so they're never cached
+            results = self.simulate_tournament(game_simulation_params, input_hash)
+        else:
+            results = self.cached_stage(
+                "results",
+                results_inputs,
+                lambda: self.simulate_tournament(game_simulation_params, input_hash),
+                seeded_only=True,
+            )
+        (
+            fl.wins,
+            fl.top10,
+            fl.top1pct,
+            fl.cashes,
+            fl.roi,
+            fl.prize_squares,
+            fl.win_squares,
+            self.num_iterations,
+            histogram_error,
+        ) = results
+        if histogram_error is not None and self.histogram_error is None:
+            # the results came from the cache, report the error they were ranked with
+            self.histogram_error = histogram_error
+            self.report_histogram_error()
+        if self.importance is not None:
+            self.report_importance()
         end_time = time.time()
         diff = end_time - start_time
         print(
@@ -1891,203 +1560,422 @@ class NFL_GPP_Simulator:
             + "seconds. Outputting."
         )
 
-    def output(self):
-        unique = {}
-        for index, x in self.field_lineups.items():
-            # if index == 0:
-            #    print(x)
-            lu_type = x["Type"]
-            salary = 0
-            fpts_p = 0
-            fieldFpts_p = 0
-            ceil_p = 0
-            own_p = []
-            lu_names = []
-            lu_teams = []
-            qb_stack = 0
-            qb_tm = ""
-            players_vs_def = 0
-            def_opps = []
-            for id in x["Lineup"]:
-                for k, v in self.player_dict.items():
-                    if v["ID"] == id:
-                        if "DST" in v["Position"]:
-                            def_opps.append(v["Opp"])
-                        if "QB" in v["Position"]:
-                            qb_tm = v["Team"]
-            for id in x["Lineup"]:
-                for k, v in self.player_dict.items():
-                    if v["ID"] == id:
-                        salary += v["Salary"]
-                        fpts_p += v["Fpts"]
-                        fieldFpts_p += v["fieldFpts"]
-                        ceil_p += v["Ceiling"]
-                        own_p.append(v["Ownership"] / 100)
-                        lu_names.append(v["Name"])
-                        if "DST" not in v["Position"]:
-                            lu_teams.append(v["Team"])
-                            if v["Team"] in def_opps:
-                                players_vs_def += 1
-                        continue
-            counter = collections.Counter(lu_teams)
-            stacks = counter.most_common()
-
-            # Find the QB team in stacks and set it as primary stack, remove it from stacks and subtract 1 to make sure qb isn't counted
-            for s in stacks:
-                if s[0] == qb_tm:
-                    primaryStack = str(qb_tm) + " " + str((s[1]))
-                    stacks.remove(s)
-                    break
-
-            # After removing QB team, the first team in stacks will be the team with most players not in QB stack
-            secondaryStack = str(stacks[0][0]) + " " + str(stacks[0][1])
-            own_p = np.prod(own_p)
-            win_p = round(x["Wins"] / self.num_iterations * 100, 2)
-            top10_p = round(x["Top10"] / self.num_iterations * 100, 2)
-            cash_p = round(x["Cashes"] / self.num_iterations * 100, 2)
-            if self.site == "dk":
-                if self.use_contest_data:
-                    roi_p = round(
-                        x["ROI"] / self.entry_fee / self.num_iterations * 100, 2
-                    )
-                    roi_round = round(x["ROI"] / self.num_iterations, 2)
-                    lineup_str = "{} ({}),{} ({}),{} ({}),{} ({}),{} ({}),{} ({}),{} ({}),{} ({}),{} ({}),{},{},{},${},{}%,{}%,{}%,{},${},{},{},{},{}".format(
-                        lu_names[1].replace("#", "-"),
-                        x["Lineup"][1],
-                        lu_names[2].replace("#", "-"),
-                        x["Lineup"][2],
-                        lu_names[3].replace("#", "-"),
-                        x["Lineup"][3],
-                        lu_names[4].replace("#", "-"),
-                        x["Lineup"][4],
-                        lu_names[5].replace("#", "-"),
-                        x["Lineup"][5],
-                        lu_names[6].replace("#", "-"),
-                        x["Lineup"][6],
-                        lu_names[7].replace("#", "-"),
-                        x["Lineup"][7],
-                        lu_names[8].replace("#", "-"),
-                        x["Lineup"][8],
-                        lu_names[0].replace("#", "-"),
-                        x["Lineup"][0],
-                        fpts_p,
-                        fieldFpts_p,
-                        ceil_p,
-                        salary,
-                        win_p,
-                        top10_p,
-                        roi_p,
-                        own_p,
-                        roi_round,
-                        primaryStack,
-                        secondaryStack,
-                        players_vs_def,
-                        lu_type,
-                    )
+    # samples (or loads) the player outcomes and ranks the field in every sim, returning
+    # the field's wins, top 10s, cashes and roi
+    def simulate_tournament(self, game_simulation_params, input_hash):
+        num_players = len(self.player_ids)
+        adaptive = self.target_se is not None or self.time_budget is not None
+        # the tilted sims' weights need every tilt's likelihood ratio, only kept a block at
+        # a time
+        blockwise = adaptive or self.importance is not None
+        # player x sim outcome matrix, rows line up with the indices stored in field_lineups.
+        # games write their rows in place, players that aren't simulated stay at zero
+        store, shared, reused = None, None, False
+        if self.outcome_store is not None and self.importance is not None:
+            print("importance sampled outcomes aren't kept in the outcome store")
+        elif self.outcome_store is not None:
+            store = OutcomeStore(self.outcome_store, "{}_gpp".format(self.site))
+            player_outcomes = store.load(input_hash, self.player_ids)
+            reused = player_outcomes is not None
+            if reused:
+                print("reusing sim outcomes from " + store.path(input_hash))
+            elif adaptive:
+                print("sims that may stop early aren't kept in the outcome store")
+            else:
+                player_outcomes = store.create(
+                    input_hash, num_players, self.num_iterations
+                )
+                spec = {"player_outcomes": store.path(input_hash)}
+        if blockwise and not reused:
+            return self.simulate_adaptively(game_simulation_params)
+        if store is None:
+            shared = shared_arrays.SharedArrays(
+                player_outcomes=((num_players, self.num_iterations), np.float32)
+            )
+            player_outcomes, spec = shared["player_outcomes"], shared.spec
+        if not reused:
+            with instrumentation.stage(
+                "outcome sampling", items=self.num_iterations
+            ), mp.Pool(
+                initializer=shared_arrays.attach_worker, initargs=(spec,)
+            ) as pool:
+                pool.starmap(self.run_simulation_for_game, game_simulation_params)
+            if store is not None:
+                store.save_index(input_hash, self.player_ids, player_outcomes)
+        if adaptive:
+            return self.simulate_adaptively(game_simulation_params, player_outcomes)
+
+        prize_cumsum = self.prize_cumsum()
+        # rank the sims in blocks so memory stays bounded for big fields
+        block_size = self.get_sim_block_size()
+        if block_size < self.num_iterations:
+            print(
+                "ranking {} sims per block ({} blocks)".format(
+                    block_size, math.ceil(self.num_iterations / block_size)
+                )
+            )
+        for start in range(0, self.num_iterations, block_size):
+            self.rank_sim_block(
+                player_outcomes[:, start : start + block_size], prize_cumsum
+            )
+        # the shared segment can only be released once nothing points into it
+        del player_outcomes
+        if shared is not None:
+            shared.close()
+        return self.results()
+
+    def simulate_adaptively(self, game_simulation_params, player_outcomes=None):
+        # simulates and ranks a block of sims at a time until our lineups' standard errors
+        # reach target_se, time_budget runs out or num_iterations sims are done. blocks are
+        # sliced from player_outcomes if it's already filled, otherwise sampled into one
+        # shared block by a pool that's kept for the whole run: it has to be forked before
+        # the ranking kernels start numba's threads
+        start_time = time.time()
+        prize_cumsum = self.prize_cumsum()
+        block_size = self.adaptive_block_size()
+        shared = pool = None
+        if player_outcomes is None:
+            shared = shared_arrays.SharedArrays(
+                player_outcomes=((len(self.player_ids), block_size), np.float32)
+            )
+            pool = mp.Pool(
+                initializer=shared_arrays.attach_worker, initargs=(shared.spec,)
+            )
+        done = 0
+        try:
+            while done < self.num_iterations:
+                num_sims = min(block_size, self.num_iterations - done)
+                weights = None
+                if pool is None:
+                    block = player_outcomes[:, done : done + num_sims]
                 else:
-                    lineup_str = "{} ({}),{} ({}),{} ({}),{} ({}),{} ({}),{} ({}),{} ({}),{} ({}),{} ({}),{} ({}),{},{},{},{},{}%,{}%,{}%,{},{},{},{}".format(
-                        lu_names[1].replace("#", "-"),
-                        x["Lineup"][1],
-                        lu_names[2].replace("#", "-"),
-                        x["Lineup"][2],
-                        lu_names[3].replace("#", "-"),
-                        x["Lineup"][3],
-                        lu_names[4].replace("#", "-"),
-                        x["Lineup"][4],
-                        lu_names[5].replace("#", "-"),
-                        x["Lineup"][5],
-                        lu_names[6].replace("#", "-"),
-                        x["Lineup"][6],
-                        lu_names[7].replace("#", "-"),
-                        x["Lineup"][7],
-                        lu_names[8].replace("#", "-"),
-                        x["Lineup"][8],
-                        lu_names[0].replace("#", "-"),
-                        x["Lineup"][0],
-                        fpts_p,
-                        fieldFpts_p,
-                        ceil_p,
-                        salary,
-                        win_p,
-                        top10_p,
-                        own_p,
-                        primaryStack,
-                        secondaryStack,
-                        players_vs_def,
-                        lu_type,
-                    )
-            elif self.site == "fd":
+                    with instrumentation.stage("outcome sampling", items=num_sims):
+                        weights = mixture_weights(
+                            pool.starmap(
+                                self.run_simulation_for_game,
+                                [
+                                    params + (done, num_sims)
+                                    for params in game_simulation_params
+                                ],
+                            )
+                        )
+                    block = shared["player_outcomes"][:, :num_sims]
+                self.rank_sim_block(block, prize_cumsum, weights)
+                done += num_sims
                 if self.use_contest_data:
-                    roi_p = round(
-                        x["ROI"] / self.entry_fee / self.num_iterations * 100, 2
-                    )
-                    roi_round = round(x["ROI"] / self.num_iterations, 2)
-                    lineup_str = "{}:{},{}:{},{}:{},{}:{},{}:{},{}:{},{}:{},{}:{},{}:{},{},{},{},{},{}%,{}%,{}%,{},${},{},{},{},{}".format(
-                        x["Lineup"][1],
-                        lu_names[1].replace("#", "-"),
-                        x["Lineup"][2],
-                        lu_names[2].replace("#", "-"),
-                        x["Lineup"][3],
-                        lu_names[3].replace("#", "-"),
-                        x["Lineup"][4],
-                        lu_names[4].replace("#", "-"),
-                        x["Lineup"][5],
-                        lu_names[5].replace("#", "-"),
-                        x["Lineup"][6],
-                        lu_names[6].replace("#", "-"),
-                        x["Lineup"][7],
-                        lu_names[7].replace("#", "-"),
-                        x["Lineup"][8],
-                        lu_names[8].replace("#", "-"),
-                        x["Lineup"][0],
-                        lu_names[0].replace("#", "-"),
-                        fpts_p,
-                        fieldFpts_p,
-                        ceil_p,
-                        salary,
-                        win_p,
-                        top10_p,
-                        roi_p,
-                        own_p,
-                        roi_round,
-                        primaryStack,
-                        secondaryStack,
-                        players_vs_def,
-                        lu_type,
-                    )
+                    largest_se = self.return_standard_errors(done)
                 else:
-                    lineup_str = "{}:{},{}:{},{}:{},{}:{},{}:{},{}:{},{}:{},{}:{},{}:{},{},{},{},{},{}%,{}%,{},{},{},{},{}".format(
-                        x["Lineup"][1],
-                        lu_names[1].replace("#", "-"),
-                        x["Lineup"][2],
-                        lu_names[2].replace("#", "-"),
-                        x["Lineup"][3],
-                        lu_names[3].replace("#", "-"),
-                        x["Lineup"][4],
-                        lu_names[4].replace("#", "-"),
-                        x["Lineup"][5],
-                        lu_names[5].replace("#", "-"),
-                        x["Lineup"][6],
-                        lu_names[6].replace("#", "-"),
-                        x["Lineup"][7],
-                        lu_names[7].replace("#", "-"),
-                        x["Lineup"][8],
-                        lu_names[8].replace("#", "-"),
-                        x["Lineup"][0],
-                        lu_names[0].replace("#", "-"),
-                        fpts_p,
-                        fieldFpts_p,
-                        ceil_p,
-                        salary,
-                        win_p,
-                        top10_p,
-                        own_p,
-                        primaryStack,
-                        secondaryStack,
-                        players_vs_def,
-                        lu_type,
+                    largest_se = self.win_standard_errors(done)
+                largest_se = largest_se[self.tracked_rows()].max()
+                print(
+                    "{} sims, largest standard error of tracked lineups {}".format(
+                        done,
+                        (
+                            "${:.2f}".format(largest_se)
+                            if self.use_contest_data
+                            else "{:.2f}%".format(largest_se)
+                        ),
                     )
-            unique[index] = lineup_str
+                )
+                if self.target_se is not None and largest_se <= self.target_se:
+                    break
+                if (
+                    self.time_budget is not None
+                    and time.time() - start_time >= self.time_budget
+                ):
+                    print("time budget used up")
+                    break
+        finally:
+            if pool is not None:
+                pool.terminate()
+            block = player_outcomes = None
+            if shared is not None:
+                shared.close()
+        self.num_iterations = done
+        return self.results()
+
+    def results(self):
+        fl = self.field_lineups
+        return (
+            fl.wins,
+            fl.top10,
+            fl.top1pct,
+            fl.cashes,
+            fl.roi,
+            fl.prize_squares,
+            fl.win_squares,
+            self.num_iterations,
+            self.histogram_error,
+        )
+
+    def sampler_speedups(self, sampler, num_sims=1000, repeats=64, seed=None):
+        # equivalent-iterations speedup of sampler over plain monte carlo for each game of
+        # the slate, see sim_sampling.sampler_speedup
+        import pandas as pd
+
+        speedups = {}
+        for m in sorted(self.matchups):
+            means, factor = self.build_game_sampler(m[0], m[1])
+            speedups["{} vs {}".format(*m)] = sampler_speedup(
+                means, factor, sampler, num_sims, repeats, seed
+            )
+        return pd.Series(speedups, name="Speedup")
+
+    def importance_memberships(self):
+        # (players x lineups) for sim_sampling.lineup_tilts: how many more times each of the
+        # uploaded lineups has each player than the field's average entry, so its tilt
+        # raises its score above the field's rather than lifting everyone with it. None
+        # without uploaded lineups
+        fl = self.field_lineups
+        rows = fl.rows_of_type("input")
+        if not len(rows):
+            return None
+        lineups, inverse = np.unique(
+            np.sort(fl.lineups[rows], axis=1), axis=0, return_inverse=True
+        )
+        entries = np.bincount(inverse.ravel(), weights=fl.counts[rows])
+        lineups = lineups[np.argsort(-entries, kind="stable")]
+        lineups = lineups[: self.max_importance_tilts].astype(np.intp)
+        num_players = len(self.player_ids)
+        memberships = np.zeros((num_players, len(lineups)))
+        np.add.at(memberships, (lineups, np.arange(len(lineups))[:, None]), 1)
+        field_entries = np.bincount(
+            fl.lineups.ravel(),
+            weights=np.repeat(fl.counts, fl.lineups.shape[1]),
+            minlength=num_players,
+        )
+        return memberships - field_entries[:, None] / fl.counts.sum()
+
+    def report_importance(self):
+        # how the win % standard errors of the tracked lineups compare with plain sims',
+        # whose wins are all whole or split ties of weight one
+        rows = self.tracked_rows()
+        win_rate = self.field_lineups.wins[rows] / self.num_iterations
+        plain = 100 * np.sqrt(win_rate * (1 - win_rate) / self.num_iterations)
+        weighted = self.win_standard_errors(self.num_iterations)[rows]
+        if not (plain > 0).any():
+            return
+        ratio = np.median(weighted[plain > 0] / plain[plain > 0])
+        print(
+            "importance sampling left the tracked lineups' win % standard errors at "
+            "{:.2f} times those of plain sims (median)".format(ratio)
+        )
+        if ratio > 1:
+            print("the tilts aren't helping these lineups, run without --importance")
+
+    def prize_cumsum(self):
+        # running total of the prizes by place, the ranking kernels split these between tied
+        # lineups. unpaid places at the end are dropped so they only rank down to the last prize
+        prizes = np.array(list(self.payout_structure.values()), dtype=np.float64)
+        prizes = np.trim_zeros(prizes, "b")
+        return np.concatenate(([0.0], np.cumsum(prizes)))
+
+    def tracked_rows(self):
+        # lineups whose precision decides when adaptive runs stop: the uploaded ones if there
+        # are any, otherwise the best so far by return (or wins without a contest)
+        fl = self.field_lineups
+        rows = fl.rows_of_type("input")
+        if len(rows):
+            return rows
+        results = fl.roi if self.use_contest_data else fl.wins
+        return np.argsort(-results)[: self.tracked_lineups]
+
+    def win_standard_errors(self, num_sims):
+        # per-lineup standard error of the win % in points after num_sims sims, from the
+        # second moment of each sim's (weighted) share of the win
+        fl = self.field_lineups
+        win_rate = fl.wins / num_sims
+        variance = np.maximum(fl.win_squares / num_sims - win_rate**2, 0)
+        return 100 * np.sqrt(variance / num_sims)
+
+    def return_standard_errors(self, num_sims):
+        # per-lineup standard error of the average return in dollars after num_sims sims
+        fl = self.field_lineups
+        mean_prize = fl.roi / num_sims + self.entry_fee
+        variance = np.maximum(fl.prize_squares / num_sims - mean_prize**2, 0)
+        return np.sqrt(variance / num_sims)
+
+    def adaptive_block_size(self):
+        # sims per block of simulate_adaptively, the points where a run can stop
+        if self.sim_block_size is not None or self.max_mem is not None:
+            return self.get_sim_block_size()
+        return min(self.adaptive_block_sims, self.num_iterations)
+
+    def get_sim_block_size(self):
+        if self.sim_block_size is not None:
+            block_size = int(self.sim_block_size)
+        elif self.max_mem is not None:
+            block_size = int(
+                self.max_mem // (len(self.field_lineups) * self.bytes_per_ranked_cell)
+            )
+        else:
+            block_size = self.num_iterations
+        return min(max(block_size, 1), self.num_iterations)
+
+    # score and rank one block of sims, adding the results onto field_lineups
+    def rank_sim_block(self, player_outcomes, prize_cumsum, weights=None):
+        fl = self.field_lineups
+        num_sims = player_outcomes.shape[1]
+        # lineup fpts for every sim, row index corresponds to the row in field_lineups
+        with instrumentation.stage("scoring", items=num_sims):
+            fpts_array = fl.score(player_outcomes)
+        # wins, top 10s and top 1%s without sorting the whole field
+        with instrumentation.stage("ranking", items=num_sims):
+            if self.histogram_width is not None:
+                self.check_histogram(fpts_array)
+                ranked = rank_histogram(
+                    fpts_array,
+                    self.ranked_rows(),
+                    fl.counts,
+                    prize_cumsum,
+                    fl.finish_cutoffs(),
+                    self.histogram_width,
+                    self.rank_blocks(),
+                    weights,
+                )
+            elif self.entries_only:
+                ranked = rank_entries(
+                    fpts_array,
+                    self.ranked_rows(),
+                    fl.counts,
+                    prize_cumsum,
+                    fl.finish_cutoffs(),
+                    self.rank_blocks(),
+                    weights,
+                )
+            else:
+                ranked = rank_sims(
+                    fpts_array,
+                    fl.counts,
+                    prize_cumsum,
+                    fl.finish_cutoffs(),
+                    self.rank_blocks(),
+                    weights,
+                )
+        finishes, prize_totals, cashes, prize_squares, win_squares = ranked
+        with instrumentation.stage("payout"):
+            fl.add_finishes(finishes)
+            fl.win_squares += win_squares
+            if self.use_contest_data:
+                fl.cashes += cashes
+                fl.roi += prize_totals
+                fl.roi[self.ranked_rows()] -= self.entry_fee * num_sims
+                fl.prize_squares += prize_squares
+
+    def rank_blocks(self):
+        # blocks of sims the ranking kernels split between threads
+        if self.seed is not None:
+            return self.seeded_rank_blocks
+        return get_num_threads()
+
+    def check_histogram(self, fpts_array):
+        # compares the approximate ranking to an exact one on the first few sims, once a run
+        if self.histogram_error is not None:
+            return
+        self.histogram_error = histogram_rank_error(
+            fpts_array[:, : self.histogram_check_sims],
+            self.ranked_rows(),
+            self.field_lineups.counts,
+            self.histogram_width,
+        ) + (min(self.histogram_check_sims, fpts_array.shape[1]),)
+        self.report_histogram_error()
+
+    def report_histogram_error(self):
+        mean, largest, checked_sims = self.histogram_error
+        print(
+            "ranking with {} point buckets, lineups are placed {:.2f} entries (at most {}) "
+            "above their exact rank over {} checked sims".format(
+                self.histogram_width, mean, int(largest), checked_sims
+            )
+        )
+
+    def ranked_rows(self):
+        # field rows that get results, just the uploaded lineups with entries_only
+        if self.entries_only:
+            return self.field_lineups.rows_of_type("input")
+        return np.arange(len(self.field_lineups))
+
+    @instrumentation.timed("output")
+    def output(self):
+        fl = self.field_lineups
+        players = [self.player_dict[k] for k in self.player_keys]
+        # per-player columns, gathered through the field's player indices below
+        team_names = sorted({p["Team"] for p in players} | {p["Opp"] for p in players})
+        team_codes = {team: code for code, team in enumerate(team_names)}
+        teams = np.array([team_codes[p["Team"]] for p in players])
+        opps = np.array([team_codes[p["Opp"]] for p in players])
+        is_dst = np.array(["DST" in p["Position"] for p in players])
+        is_qb = np.array(["QB" in p["Position"] for p in players])
+        if self.site == "dk":
+            labels = [
+                "{} ({})".format(p["Name"].replace("#", "-"), pid)
+                for p, pid in zip(players, self.player_ids.tolist())
+            ]
+        else:
+            labels = [
+                "{}:{}".format(pid, p["Name"].replace("#", "-"))
+                for p, pid in zip(players, self.player_ids.tolist())
+            ]
+        labels = np.array(labels, dtype=object)
+
+        lineups = fl.lineups.astype(np.intp)
+        lu_teams = np.where(is_dst[lineups], -1, teams[lineups])
+        # the qb's team anchors the primary stack, the last one if there were ever two
+        last_qb = lineups.shape[1] - 1 - is_qb[lineups][:, ::-1].argmax(axis=1)
+        anchor = np.where(
+            is_qb[lineups].any(axis=1),
+            teams[lineups[np.arange(len(fl)), last_qb]],
+            -1,
+        )
+        primary_stack, secondary_stack = stack_columns(lu_teams, anchor, team_names)
+        players_vs_def = players_vs_dst(teams[lineups], opps[lineups], is_dst[lineups])
+        salary = slot_sum(
+            player_column(self.player_dict, self.player_keys, "Salary")[lineups]
+        )
+        fpts_p = slot_sum(
+            player_column(self.player_dict, self.player_keys, "Fpts", dtype=float)[
+                lineups
+            ]
+        )
+        fieldFpts_p = slot_sum(
+            player_column(self.player_dict, self.player_keys, "fieldFpts", dtype=float)[
+                lineups
+            ]
+        )
+        ceil_p = slot_sum(
+            player_column(self.player_dict, self.player_keys, "Ceiling", dtype=float)[
+                lineups
+            ]
+        )
+        own_p = np.prod(
+            player_column(self.player_dict, self.player_keys, "Ownership", dtype=float)[
+                lineups
+            ]
+            / 100,
+            axis=1,
+        )
+        win_p = np.round(fl.wins / self.num_iterations * 100, 2)
+        top10_p = np.round(fl.top10 / self.num_iterations * 100, 2)
+        lu_type = np.array(fl.lineup_types)[fl.types]
+
+        # dst goes in the last column
+        columns = list(labels[lineups[:, [1, 2, 3, 4, 5, 6, 7, 8, 0]]].T)
+        columns += [fpts_p.tolist(), fieldFpts_p.tolist(), ceil_p.tolist()]
+        if self.site == "dk" and self.use_contest_data:
+            columns.append(["${}".format(s) for s in salary.tolist()])
+        else:
+            columns.append(salary.tolist())
+        columns.append(["{}%".format(p) for p in win_p.tolist()])
+        columns.append(["{}%".format(p) for p in top10_p.tolist()])
+        if self.use_contest_data:
+            roi_p = np.round(fl.roi / self.entry_fee / self.num_iterations * 100, 2)
+            roi_round = np.round(fl.roi / self.num_iterations, 2)
+            columns.append(["{}%".format(p) for p in roi_p.tolist()])
+            columns.append(own_p.tolist())
+            columns.append(["${}".format(r) for r in roi_round.tolist()])
+        else:
+            columns.append(own_p.tolist())
+        columns += [primary_stack, secondary_stack, players_vs_def.tolist(), lu_type]
 
         out_path = os.path.join(
             os.path.dirname(__file__),
@@ -2095,28 +1983,26 @@ class NFL_GPP_Simulator:
                 self.site, self.field_size, self.num_iterations
             ),
         )
-        with open(out_path, "w") as f:
-            if self.site == "dk":
-                if self.use_contest_data:
-                    f.write(
-                        "QB,RB,RB,WR,WR,WR,TE,FLEX,DST,Fpts Proj,Field Fpts Proj,Ceiling,Salary,Win %,Top 10%,ROI%,Proj. Own. Product,Avg. Return,Stack1 Type,Stack2 Type,Players vs DST,Lineup Type\n"
-                    )
-                else:
-                    f.write(
-                        "QB,RB,RB,WR,WR,WR,TE,FLEX,DST,Fpts Proj,Field Fpts Proj,Ceiling,Salary,Win %,Top 10%, Proj. Own. Product,Stack1 Type,Stack2 Type,Players vs DST,Lineup Type\n"
-                    )
-            elif self.site == "fd":
-                if self.use_contest_data:
-                    f.write(
-                        "QB,RB,RB,WR,WR,WR,TE,FLEX,DST,Fpts Proj,Field Fpts Proj,Ceiling,Salary,Win %,Top 10%,ROI%,Proj. Own. Product,Avg. Return,Stack1 Type,Stack2 Type,Players vs DST,Lineup Type\n"
-                    )
-                else:
-                    f.write(
-                        "QB,RB,RB,WR,WR,WR,TE,FLEX,DST,Fpts Proj,Field Fpts Proj,Ceiling,Salary,Win %,Top 10%,Proj. Own. Product,Stack1 Type,Stack2 Type,Players vs DST,Lineup Type\n"
-                    )
-
-            for fpts, lineup_str in unique.items():
-                f.write("%s\n" % lineup_str)
+        if self.use_contest_data:
+            header = "QB,RB,RB,WR,WR,WR,TE,FLEX,DST,Fpts Proj,Field Fpts Proj,Ceiling,Salary,Win %,Top 10%,ROI%,Proj. Own. Product,Avg. Return,Stack1 Type,Stack2 Type,Players vs DST,Lineup Type\n"
+        else:
+            header = "QB,RB,RB,WR,WR,WR,TE,FLEX,DST,Fpts Proj,Field Fpts Proj,Ceiling,Salary,Win %,Top 10%,Proj. Own. Product,Stack1 Type,Stack2 Type,Players vs DST,Lineup Type\n"
+        if self.target_se is not None or self.time_budget is not None:
+            # 95% confidence margins, since the number of sims was decided as they ran
+            margin = self.confidence_z * self.win_standard_errors(self.num_iterations)
+            columns.append(["{}%".format(p) for p in np.round(margin, 2).tolist()])
+            extra = ",Win % ±"
+            if self.use_contest_data:
+                margin = self.return_standard_errors(self.num_iterations)
+                margin = np.round(self.confidence_z * margin, 2)
+                columns.append(["${}".format(r) for r in margin.tolist()])
+                extra += ",Avg. Return ±"
+            header = header[:-1] + extra + "\n"
+        rows = zip(*columns)
+        if self.entries_only:
+            # the rest of the field wasn't ranked
+            rows = itertools.compress(rows, fl.types == fl.lineup_types.index("input"))
+        write_csv(out_path, header, rows)
 
         out_path = os.path.join(
             os.path.dirname(__file__),
@@ -2124,53 +2010,47 @@ class NFL_GPP_Simulator:
                 self.site, self.field_size, self.num_iterations
             ),
         )
-        with open(out_path, "w") as f:
-            f.write(
-                "Player,Position,Team,Win%,Top10%,Sim. Own%,Proj. Own%,Avg. Return\n"
-            )
-            unique_players = {}
-            for val in self.field_lineups.values():
-                for player in val["Lineup"]:
-                    if player not in unique_players:
-                        unique_players[player] = {
-                            "Wins": val["Wins"],
-                            "Top10": val["Top10"],
-                            "In": 1,
-                            "ROI": val["ROI"],
-                        }
-                    else:
-                        unique_players[player]["Wins"] = (
-                            unique_players[player]["Wins"] + val["Wins"]
-                        )
-                        unique_players[player]["Top10"] = (
-                            unique_players[player]["Top10"] + val["Top10"]
-                        )
-                        unique_players[player]["In"] = unique_players[player]["In"] + 1
-                        unique_players[player]["ROI"] = (
-                            unique_players[player]["ROI"] + val["ROI"]
-                        )
+        exposure = self.player_exposure()
+        rows = zip(
+            exposure["Player"].str.replace("#", "-"),
+            exposure["Position"],
+            exposure["Team"],
+            ["{}%".format(p) for p in exposure["Win%"].tolist()],
+            ["{}%".format(p) for p in exposure["Top10%"].tolist()],
+            ["{}%".format(p) for p in exposure["Sim. Own%"].tolist()],
+            ["{}%".format(p) for p in exposure["Proj. Own%"].tolist()],
+            ["${}".format(r) for r in exposure["Avg. Return"].tolist()],
+        )
+        write_csv(
+            out_path,
+            "Player,Position,Team,Win%,Top10%,Sim. Own%,Proj. Own%,Avg. Return\n",
+            rows,
+        )
 
-            for player, data in unique_players.items():
-                field_p = round(data["In"] / self.field_size * 100, 2)
-                win_p = round(data["Wins"] / self.num_iterations * 100, 2)
-                top10_p = round(data["Top10"] / self.num_iterations / 10 * 100, 2)
-                roi_p = round(data["ROI"] / data["In"] / self.num_iterations, 2)
-                for k, v in self.player_dict.items():
-                    if player == v["ID"]:
-                        proj_own = v["Ownership"]
-                        p_name = v["Name"]
-                        position = "/".join(v.get("Position"))
-                        team = v.get("Team")
-                        break
-                f.write(
-                    "{},{},{},{}%,{}%,{}%,{}%,${}\n".format(
-                        p_name.replace("#", "-"),
-                        position,
-                        team,
-                        win_p,
-                        top10_p,
-                        field_p,
-                        proj_own,
-                        roi_p,
-                    )
-                )
+    def player_exposure(self):
+        # per-player results over the field as a DataFrame indexed by player ID, in the
+        # order players first appear in the field. percentages are already scaled to 0-100
+        import pandas as pd
+
+        fl = self.field_lineups
+        rows = self.ranked_rows()
+        totals = fl.player_totals(len(self.player_keys), rows)
+        order = first_appearance(fl.lineups[rows])
+        players = [self.player_dict[self.player_keys[i]] for i in order]
+        return pd.DataFrame(
+            {
+                "Player": [p["Name"] for p in players],
+                "Position": ["/".join(p.get("Position")) for p in players],
+                "Team": [p.get("Team") for p in players],
+                "Win%": np.round(totals["Wins"][order] / self.num_iterations * 100, 2),
+                "Top10%": np.round(
+                    totals["Top10"][order] / self.num_iterations / 10 * 100, 2
+                ),
+                "Sim. Own%": np.round(totals["In"][order] / self.field_size * 100, 2),
+                "Proj. Own%": [p["Ownership"] for p in players],
+                "Avg. Return": np.round(
+                    totals["ROI"][order] / totals["In"][order] / self.num_iterations, 2
+                ),
+            },
+            index=pd.Index(self.player_ids[order], name="ID"),
+        )
@@ -10,6 +10,8 @@ import copy
 import itertools
 from random import shuffle, choice
 from collections import Counter
+import instrumentation
+from seeding import run_entropy, seed_sequence, solve_stream
 
 
 class NFL_Optimizer:
@@ -39,8 +41,11 @@ class NFL_Optimizer:
     default_def_var = 0.5
     team_rename_dict = {"LA": "LAR"}
 
-    def __init__(self, site=None, num_lineups=0, num_uniques=1):
+    def __init__(self, site=None, num_lineups=0, num_uniques=1, seed=None):
         self.site = site
+        # each solve's random projections come from their own stream of this, see seeding.py
+        self.entropy = run_entropy(seed)
+        print("random seed " + str(self.entropy))
         self.num_lineups = int(num_lineups)
         self.num_uniques = int(num_uniques)
         self.load_config()
@@ -69,6 +74,7 @@ class NFL_Optimizer:
         return itertools.chain([next(iterator).lower()], iterator)
 
     # Load config from file
+    @instrumentation.timed("config load")
     def load_config(self):
         with open(
             os.path.join(os.path.dirname(__file__), "../config.json")
@@ -76,6 +82,7 @@ class NFL_Optimizer:
             self.config = json.load(json_file)
 
     # Load player IDs for exporting
+    @instrumentation.timed("player id join")
     def load_player_ids(self, path):
         with open(path) as file:
             reader = csv.DictReader(self.lower_first(file))
@@ -111,6 +118,7 @@ class NFL_Optimizer:
                             "id"
                         ]
 
+    @instrumentation.timed("config load")
     def load_rules(self):
         self.at_most = self.config["at_most"]
         self.at_least = self.config["at_least"]
@@ -145,6 +153,7 @@ class NFL_Optimizer:
                 self.player_dict.pop(p)
 
     # Load projections from file
+    @instrumentation.timed("csv parse")
     def load_projections(self, path):
         # Read projections into a dictionary
         with open(path, encoding="utf-8-sig") as file:
@@ -236,6 +245,7 @@ class NFL_Optimizer:
                   )
 
 
+    @instrumentation.timed("model build")
     def optimize(self):
         # Setup our linear programming equation - https://en.wikipedia.org/wiki/Linear_programming
         # We will use PuLP as our solver - https://coin-or.github.io/pulp/
@@ -251,9 +261,10 @@ class NFL_Optimizer:
 
         # set the objective - maximize fpts & set randomness amount from config
         if self.randomness_amount != 0:
+            rng = np.random.default_rng(seed_sequence(self.entropy, solve_stream, 0))
             self.problem += (
                 plp.lpSum(
-                    np.random.normal(
+                    rng.normal(
                         self.player_dict[(player, pos_str, team)]["Fpts"],
                         (
                             self.player_dict[(player, pos_str, team)]["StdDev"]
@@ -787,7 +798,8 @@ class NFL_Optimizer:
         # Crunch!
         for i in range(self.num_lineups):
             try:
-                self.problem.solve(plp.PULP_CBC_CMD(msg=0))
+                with instrumentation.stage("solve"):
+                    self.problem.solve(plp.PULP_CBC_CMD(msg=0))
             except plp.PulpSolverError:
                 print(
                     "Infeasibility reached - only generated {} lineups out of {}. Continuing with export.".format(
@@ -821,9 +833,12 @@ class NFL_Optimizer:
 
             # Set a new random fpts projection within their distribution
             if self.randomness_amount != 0:
+                rng = np.random.default_rng(
+                    seed_sequence(self.entropy, solve_stream, i + 1)
+                )
                 self.problem += (
                     plp.lpSum(
-                        np.random.normal(
+                        rng.normal(
                             self.player_dict[(player, pos_str, team)]["Fpts"],
                             (
                                 self.player_dict[(player, pos_str, team)]["StdDev"]
@@ -837,6 +852,7 @@ class NFL_Optimizer:
                     "Objective",
                 )
 
+    @instrumentation.timed("output")
     def output(self):
         print("Lineups done generating. Outputting.")
 
@@ -5,6 +5,8 @@ import datetime
 import numpy as np
 import pulp as plp
 import itertools
+import instrumentation
+from seeding import run_entropy, seed_sequence, solve_stream
 
 
 class NFL_Showdown_Optimizer:
@@ -33,8 +35,11 @@ class NFL_Showdown_Optimizer:
     default_def_var = 0.5
     team_rename_dict = {"LA": "LAR"}
 
-    def __init__(self, site=None, num_lineups=0, num_uniques=1):
+    def __init__(self, site=None, num_lineups=0, num_uniques=1, seed=None):
         self.site = site
+        # each solve's random projections come from their own stream of this, see seeding.py
+        self.entropy = run_entropy(seed)
+        print("random seed " + str(self.entropy))
         self.num_lineups = int(num_lineups)
         self.num_uniques = int(num_uniques)
         self.load_config()
@@ -62,6 +67,7 @@ class NFL_Showdown_Optimizer:
         return itertools.chain([next(iterator).lower()], iterator)
 
     # Load config from file
+    @instrumentation.timed("config load")
     def load_config(self):
         with open(
             os.path.join(os.path.dirname(__file__), "../config.json")
@@ -69,6 +75,7 @@ class NFL_Showdown_Optimizer:
             self.config = json.load(json_file)
 
     # Load player IDs for exporting
+    @instrumentation.timed("player id join")
     def load_player_ids(self, path):
         with open(path) as file:
             reader = csv.DictReader(self.lower_first(file))
@@ -143,6 +150,7 @@ class NFL_Showdown_Optimizer:
                             f"Player in player_ids.csv not found in player_dict (projections.csv): {player_name} FLEX {team}"
                         )
 
+    @instrumentation.timed("config load")
     def load_rules(self):
         self.at_most = self.config["at_most"]
         self.at_least = self.config["at_least"]
@@ -167,6 +175,7 @@ class NFL_Showdown_Optimizer:
         )
 
     # Load projections from file
+    @instrumentation.timed("csv parse")
     def load_projections(self, path):
         # Read projections into a dictionary
         with open(path, encoding="utf-8-sig") as file:
@@ -273,6 +282,7 @@ class NFL_Showdown_Optimizer:
                     self.player_dict[(player_name, "FLEX", team)]
                 )
 
+    @instrumentation.timed("model build")
     def optimize(self):
         # Setup our linear programming equation - https://en.wikipedia.org/wiki/Linear_programming
         # We will use PuLP as our solver - https://coin-or.github.io/pulp/
@@ -289,9 +299,10 @@ class NFL_Showdown_Optimizer:
 
         # set the objective - maximize fpts & set randomness amount from config
         if self.randomness_amount != 0:
+            rng = np.random.default_rng(seed_sequence(self.entropy, solve_stream, 0))
             self.problem += (
                 plp.lpSum(
-                    np.random.normal(
+                    rng.normal(
                         self.player_dict[player]["Fpts"],
                         (
                             self.player_dict[player]["StdDev"]
@@ -710,7 +721,8 @@ class NFL_Showdown_Optimizer:
         # Crunch!
         for i in range(self.num_lineups):
             try:
-                self.problem.solve(plp.PULP_CBC_CMD(msg=0))
+                with instrumentation.stage("solve"):
+                    self.problem.solve(plp.PULP_CBC_CMD(msg=0))
             except plp.PulpSolverError:
                 print(
                     "Infeasibility reached - only generated {} lineups out of {}. Continuing with export.".format(
@@ -747,9 +759,12 @@ class NFL_Showdown_Optimizer:
 
             # Set a new random fpts projection within their distribution
             if self.randomness_amount != 0:
+                rng = np.random.default_rng(
+                    seed_sequence(self.entropy, solve_stream, i + 1)
+                )
                 self.problem += (
                     plp.lpSum(
-                        np.random.normal(
+                        rng.normal(
                             self.player_dict[(player, pos_str, team)]["Fpts"],
                             (
                                 self.player_dict[(player, pos_str, team)]["StdDev"]
@@ -765,6 +780,7 @@ class NFL_Showdown_Optimizer:
                     "Objective",
                 )
 
+    @instrumentation.timed("output")
     def output(self):
         print("Lineups done generating. Outputting.")
 
@@ -2,32 +2,55 @@ import csv
 import json
 import math
 import os
-import random
 import time, datetime
 import numpy as np
-import pulp as plp
 import multiprocessing as mp
-import pandas as pd
 import statistics
 
 # import fuzzywuzzy
 import itertools
 import collections
 import re
-from scipy.stats import norm, kendalltau, multivariate_normal, gamma
-import matplotlib.pyplot as plt
-import seaborn as sns
-from numba import njit, jit
+from numba import njit, jit, get_num_threads
 import sys
-
-@jit(nopython=True)  
+from field_lineups import FieldLineups
+from sim_kernels import (
+    rank_sims,
+    rank_entries,
+    rank_histogram,
+    histogram_rank_error,
+)
+from lineup_file import load_lineups, position_masks
+from lineup_table import (
+    player_column,
+    slot_sum,
+    stack_columns,
+    players_vs_dst,
+    first_appearance,
+    write_csv,
+)
+from work_blocks import plan_blocks
+from seeding import run_entropy, seed_sequence, field_stream, games_stream
+import instrumentation
+import shared_arrays
+from outcome_store import OutcomeStore, hash_inputs
+from sim_sampling import (
+    samplers,
+    game_factor,
+    sample_game,
+    sampler_speedup,
+    correlation_rows,
+    game_correlation,
+)
+
+@jit(nopython=True, cache=True)  
 def salary_boost(salary, max_salary):
     return (salary / max_salary) ** 2
 
 class NFL_Showdown_Simulator:
     config = None
     player_dict = {}
-    field_lineups = {}
+    field_lineups = None
     stacks_dict = {}
     gen_lineup_list = []
     roster_construction = []
@@ -49,6 +72,13 @@ class NFL_Showdown_Simulator:
     max_pct_off_optimal = 0.4
     teams_dict = collections.defaultdict(list)  # Initialize teams_dict
     correlation_rules = {}
+    # lineups generated up front to time the generator before splitting up the field
+    pilot_lineups = 16
+    # sims ranked exactly as well to report the error of histogram ranking
+    histogram_check_sims = 8
+    # ranking blocks with a seed, fixed so the float totals add up in the same order on any
+    # number of threads
+    seeded_rank_blocks = 16
 
     def __init__(
         self,
@@ -57,9 +87,30 @@ class NFL_Showdown_Simulator:
         num_iterations,
         use_contest_data,
         use_lineup_input,
+        outcome_store=None,
+        entries_only=False,
+        histogram_width=None,
+        sampler="mc",
+        seed=None,
     ):
         self.site = site
+        # every random draw of the run comes from streams derived from this, see seeding.py
+        self.seed = seed
+        self.entropy = run_entropy(seed)
+        print(f"random seed {self.entropy}")
         self.use_lineup_input = use_lineup_input
+        # only rank (and output) the lineups from tournament_lineups.csv
+        self.entries_only = entries_only
+        # bucket width in points for approximate ranking, None ranks exactly
+        self.histogram_width = histogram_width
+        # mean and largest places the approximate ranking was off by, once checked
+        self.histogram_error = None
+        # how the outcome draws are spread out, one of sim_sampling.samplers
+        if sampler not in samplers:
+            raise ValueError(f"unknown sampler {sampler}, use one of {samplers}")
+        self.sampler = sampler
+        # directory to keep sampled player outcomes in for reuse by later runs
+        self.outcome_store = outcome_store
         self.load_config()
         self.load_rules()
 
@@ -75,8 +126,6 @@ class NFL_Showdown_Simulator:
         )
         self.load_player_ids(player_path)
         self.load_team_stacks()
-        self.seen_lineups = {}
-        self.seen_lineups_ix = {}
 
         # ownership_path = os.path.join(
         #    os.path.dirname(__file__),
@@ -119,6 +168,8 @@ class NFL_Showdown_Simulator:
 
         # self.adjust_default_stdev()
         self.assertPlayerDict()
+        self.index_players()
+        self.field_lineups = FieldLineups(len(self.roster_construction))
         self.num_iterations = int(num_iterations)
         self.get_optimal()
         if self.use_lineup_input:
@@ -126,11 +177,13 @@ class NFL_Showdown_Simulator:
         # if self.match_lineup_input_to_field_size or len(self.field_lineups) == 0:
         # self.generate_field_lineups()
         self.load_correlation_rules()
+        self.compile_correlations()
 
     # make column lookups on datafiles case insensitive
     def lower_first(self, iterator):
         return itertools.chain([next(iterator).lower()], iterator)
 
+    @instrumentation.timed("config load")
     def load_rules(self):
         self.projection_minimum = int(self.config["projection_minimum"])
         self.randomness_amount = float(self.config["randomness"])
@@ -154,9 +207,21 @@ class NFL_Showdown_Simulator:
                 )
                 self.player_dict.pop(p)
 
+    # field lineups store players as row indices into these arrays
+    def index_players(self):
+        self.player_keys = list(self.player_dict.keys())
+        self.player_ids = np.array(
+            [self.player_dict[k]["UniqueKey"] for k in self.player_keys]
+        )
+        self.id_to_index = {pid: i for i, pid in enumerate(self.player_ids)}
+
     # In order to make reasonable tournament lineups, we want to be close enough to the optimal that
     # a person could realistically land on this lineup. Skeleton here is taken from base `mlb_optimizer.py`
+    @instrumentation.timed("model build")
     def get_optimal(self):
+        # loaded here rather than up top, so importing the simulator stays quick
+        import pulp as plp
+
         # print(s['Name'],s['ID'])
         # print(self.player_dict)
         # for p in self.player_dict:
@@ -270,7 +335,8 @@ class NFL_Showdown_Simulator:
 
         # Crunch!
         try:
-            problem.solve(plp.PULP_CBC_CMD(msg=0))
+            with instrumentation.stage("solve"):
+                problem.solve(plp.PULP_CBC_CMD(msg=0))
         except plp.PulpSolverError:
             print(
                 "Infeasibility reached - only generated {} lineups out of {}. Continuing with export.".format(
@@ -305,6 +371,7 @@ class NFL_Showdown_Simulator:
         self.optimal_score = float(fpts_proj)
 
     # Load player IDs for exporting
+    @instrumentation.timed("player id join")
     def load_player_ids(self, path):
         with open(path, encoding="utf-8-sig") as file:
             reader = csv.DictReader(self.lower_first(file))
@@ -368,6 +435,7 @@ class NFL_Showdown_Simulator:
                             ] = opp
                     self.id_name_dict[str(row["id"])] = row[name_key]
 
+    @instrumentation.timed("csv parse")
     def load_contest_data(self, path):
         with open(path, encoding="utf-8-sig") as file:
             reader = csv.DictReader(self.lower_first(file))
@@ -398,6 +466,7 @@ class NFL_Showdown_Simulator:
                     )
         # print(self.payout_structure)
 
+    @instrumentation.timed("config load")
     def load_correlation_rules(self):
         if len(self.correlation_rules.keys()) > 0:
             for c in self.correlation_rules.keys():
@@ -411,7 +480,27 @@ class NFL_Showdown_Simulator:
                                 v
                             ] = self.correlation_rules[c][v]
 
+    # game correlation matrices are built by indexing these per team tables instead of
+    # looking up every pair of players in their Correlations dicts
+    def compile_correlations(self):
+        self.correlation_positions = sorted(
+            {p["Position"][0] for players in self.teams_dict.values() for p in players}
+        )
+        self.team_correlations = {}
+        for team, players in self.teams_dict.items():
+            self.team_correlations[team] = (
+                correlation_rows(players, self.correlation_positions),
+                np.array(
+                    [
+                        self.correlation_positions.index(p["Position"][0])
+                        for p in players
+                    ],
+                    dtype=np.int64,
+                ),
+            )
+
     # Load config from file
+    @instrumentation.timed("config load")
     def load_config(self):
         with open(
             os.path.join(os.path.dirname(__file__), "../config.json"),
@@ -420,6 +509,7 @@ class NFL_Showdown_Simulator:
             self.config = json.load(json_file)
 
     # Load projections from file
+    @instrumentation.timed("csv parse")
     def load_projections(self, path):
         # Read projections into a dictionary
         with open(path, encoding="utf-8-sig") as file:
@@ -677,92 +767,31 @@ class NFL_Showdown_Simulator:
         else:
             return cell_value
 
+    @instrumentation.timed("csv parse")
     def load_lineups_from_file(self):
         print("loading lineups")
-        i = 0
         path = os.path.join(
             os.path.dirname(__file__),
             "../{}_data/{}".format(self.site, "tournament_lineups.csv"),
         )
-        with open(path) as file:
-            reader = pd.read_csv(file)
-            lineup = []
-            j = 0
-            for i, row in reader.iterrows():
-                # print(row)
-                if i == self.field_size:
-                    break
-                lineup = [
-                    self.extract_id(str(row[j]))
-                    for j in range(len(self.roster_construction))
-                ]
-                # storing if this lineup was made by an optimizer or with the generation process in this script
-                error = False
-                for l in lineup:
-                    ids = [self.player_dict[k]["ID"] for k in self.player_dict]
-                    if l not in ids:
-                        print("lineup {} is missing players {}".format(i, l))
-                        if l in self.id_name_dict:
-                            print(self.id_name_dict[l])
-                        error = True
-                if len(lineup) < len(self.roster_construction):
-                    print("lineup {} is missing players".format(i))
-                    continue
-                # storing if this lineup was made by an optimizer or with the generation process in this script
-                error = False
-                if self.site == "fd":
-                    un_key_lu = []
-                    i = 0
-                    for l in lineup:
-                        ids = [self.player_dict[k]["ID"] for k in self.player_dict]
-                        if l not in ids:
-                            print("lineup {} is missing players {}".format(i, l))
-                            if l in self.id_name_dict:
-                                print(self.id_name_dict[l])
-                            error = True
-                        else:
-                            for k in self.player_dict:
-                                if self.player_dict[k]["ID"] == l:
-                                    if i == 0:
-                                        if (
-                                            self.player_dict[k]["rosterPosition"]
-                                            == "CPT"
-                                        ):
-                                            un_key_lu.append(
-                                                self.player_dict[k]["UniqueKey"]
-                                            )
-                                        else:
-                                            pass
-                                    else:
-                                        if (
-                                            self.player_dict[k]["rosterPosition"]
-                                            == "FLEX"
-                                        ):
-                                            un_key_lu.append(
-                                                self.player_dict[k]["UniqueKey"]
-                                            )
-                                        else:
-                                            pass
-                        i += 1
-                if len(lineup) < len(self.roster_construction):
-                    print("lineup {} is missing players".format(i))
-                    continue
-                lu = lineup if self.site == "dk" else un_key_lu
-                if not error:
-                    self.field_lineups[j] = {
-                        "Lineup": {
-                            "Lineup": lu,
-                            "Wins": 0,
-                            "Top10": 0,
-                            "ROI": 0,
-                            "Cashes": 0,
-                            "Type": "input",
-                        },
-                        "count": 1,
-                    }
-                    j += 1
-        print("loaded {} lineups".format(j))
-        # print(self.field_lineups)
+        masks, slot_bits = position_masks(
+            [[self.player_dict[k]["rosterPosition"]] for k in self.player_keys],
+            self.roster_construction,
+        )
+
+        # fanduel captains and flex plays share an id, which one it is comes from the column
+        def lookup(prefix):
+            return lambda cell: self.id_to_index.get(prefix + self.extract_id(cell), -1)
+
+        if self.site == "fd":
+            lookups = [lookup("CPT:")] + [lookup("FLEX:")] * (
+                len(self.roster_construction) - 1
+            )
+        else:
+            lookups = [lookup("")] * len(self.roster_construction)
+        loaded = load_lineups(path, lookups, masks, slot_bits, self.field_size)
+        self.field_lineups.append(loaded.astype(np.uint16), "input")
+        print("loaded {} lineups".format(len(loaded)))
 
     @staticmethod
     def select_player(
@@ -834,24 +863,25 @@ class NFL_Showdown_Simulator:
     @staticmethod
     def generate_lineups(
         lu_num,
-        ids,
+        arrays,
         in_lineup,
-        pos_matrix,
-        ownership,
         salary_floor,
         salary_ceiling,
         optimal_score,
-        salaries,
-        projections,
         max_pct_off_optimal,
-        teams,
-        opponents,
         overlap_limit,
-        matchups,
-        new_player_dict,
         num_players_in_roster,
+        entropy,
     ):
-        rng = np.random.Generator(np.random.PCG64())
+        # each lineup draws from its own stream, so the field doesn't depend on the blocks
+        rng = np.random.default_rng(seed_sequence(entropy, field_stream, lu_num))
+        ids = arrays["ids"]
+        pos_matrix = arrays["pos_matrix"]
+        ownership = arrays["ownership"]
+        salaries = arrays["salaries"]
+        projections = arrays["projections"]
+        teams = arrays["teams"]
+        opponents = arrays["opponents"]
         lus = {}
         in_lineup.fill(0)
         iteration_count = 0
@@ -859,6 +889,7 @@ class NFL_Showdown_Simulator:
             iteration_count += 1
             salary, proj = 0, 0
             lineup, player_teams, lineup_matchups = [], [], []
+            lineup_rows = []
             def_opp, players_opposing_def, cpt_selected = None, 0, False
             in_lineup.fill(0)
             cpt_name = None
@@ -885,37 +916,29 @@ class NFL_Showdown_Simulator:
                     iteration_count += 1
                     salary, proj = 0, 0
                     lineup, player_teams, lineup_matchups = [], [], []
+                    lineup_rows = []
                     def_opp, players_opposing_def, cpt_selected = None, 0, False
                     in_lineup.fill(0)
                     cpt_name = None
                     remaining_salary = salary_ceiling
                     continue
                 if k == 0:
-                    cpt_player_info = new_player_dict[choice]
-                    flex_choice_idx = next(
-                        (
-                            i
-                            for i, v in enumerate(new_player_dict.values())
-                            if v["Name"] == cpt_player_info["Name"]
-                            and v["Team"] == cpt_player_info["Team"]
-                            and v["Position"] == cpt_player_info["Position"]
-                            and v["rosterPosition"] == "FLEX"
-                        ),
-                        None,
-                    )
-                    if flex_choice_idx is not None:
+                    # the captain's flex version can't be picked as well
+                    flex_choice_idx = arrays["flex_rows"][choice_idx[0]]
+                    if flex_choice_idx >= 0:
                         in_lineup[flex_choice_idx] = 1
                     def_opp = opponents[choice_idx][0]
                     cpt_selected = True
 
                 if (
                     cpt_selected
-                    and "QB" in new_player_dict[choice]["Position"]
-                    and "DEF" in [new_player_dict[x]["Position"] for x in lineup]
+                    and arrays["is_qb"][choice_idx[0]]
+                    and arrays["is_def"][lineup_rows].any()
                 ):
                     continue
 
                 lineup.append(str(choice))
+                lineup_rows.append(choice_idx[0])
                 in_lineup[choice_idx] = 1
                 salary += salaries[choice_idx]
                 proj += projections[choice_idx]
@@ -927,6 +950,9 @@ class NFL_Showdown_Simulator:
                 if teams[choice_idx][0] == def_opp:
                     players_opposing_def += 1
 
+            # a skipped slot leaves the lineup short, start over
+            if len(lineup) != num_players_in_roster:
+                continue
             if NFL_Showdown_Simulator.validate_lineup(
                 salary,
                 salary_floor,
@@ -947,6 +973,21 @@ class NFL_Showdown_Simulator:
                 break
         return lus
 
+    @staticmethod
+    def generate_lineup_block(start, stop, *limits, arrays=None):
+        # one task per block of lineups rather than per lineup, handed back as a dense list.
+        # the player arrays are attached from shared memory when the worker starts, so a
+        # task is just the block and the limits
+        if arrays is None:
+            arrays = shared_arrays.worker_arrays
+        in_lineup = np.zeros(len(arrays["ids"]))
+        return [
+            NFL_Showdown_Simulator.generate_lineups(i, arrays, in_lineup, *limits)[i][
+                "Lineup"
+            ]
+            for i in range(start, stop)
+        ]
+
     def remap_player_dict(self, player_dict):
         remapped_dict = {}
         for key, value in player_dict.items():
@@ -957,6 +998,7 @@ class NFL_Showdown_Simulator:
                 raise KeyError(f"Player details for {key} does not contain an 'ID' key")
         return remapped_dict
 
+    @instrumentation.timed("field generation")
     def generate_field_lineups(self):
         diff = self.field_size - len(self.field_lineups)
         if diff <= 0:
@@ -966,30 +1008,43 @@ class NFL_Showdown_Simulator:
             return
 
         print(f"Generating {diff} lineups.")
+        instrumentation.count("field generation", diff)
         player_data = self.extract_player_data()
 
-        # Initialize problem list
-        problems = self.initialize_problems_list(diff, player_data)
-
-        # print(problems[0])
-
-        # Handle stacks logic
-        # stacks = self.handle_stacks_logic(diff)
-        # print(problems)
-        # print(self.player_dict)
-
         start_time = time.time()
 
-        # Parallel processing for generating lineups
-        with mp.Pool() as pool:
-            output = pool.starmap(self.generate_lineups, problems)
-            pool.close()
-            pool.join()
+        arrays, limits = self.lineup_arrays(player_data)
+        # the player arrays go into shared memory once rather than being pickled into
+        # every task
+        with shared_arrays.SharedArrays(**arrays) as shared:
+            # time a few lineups here to size the blocks handed to the pool
+            pilot = min(diff, self.pilot_lineups)
+            pilot_time = time.time()
+            pilot_lineups = self.generate_lineup_block(
+                0, pilot, *limits, arrays=shared.arrays
+            )
+            seconds_per_lineup = (time.time() - pilot_time) / max(1, pilot)
+            problems = [
+                (start, stop) + limits
+                for start, stop in plan_blocks(
+                    pilot, diff, seconds_per_lineup, mp.cpu_count()
+                )
+            ]
+            # Parallel processing for generating lineups, blocks are already sized so
+            # don't let the pool batch them up again
+            with mp.Pool(
+                initializer=shared_arrays.attach_worker, initargs=(shared.spec,)
+            ) as pool:
+                output = pool.starmap(self.generate_lineup_block, problems, chunksize=1)
+                pool.close()
+                pool.join()
 
         print("pool closed")
 
         # Update field lineups
-        self.update_field_lineups(output, diff)
+        self.update_field_lineups(
+            pilot_lineups + list(itertools.chain.from_iterable(output)), diff
+        )
 
         end_time = time.time()
         print(f"lineups took {end_time - start_time} seconds")
@@ -1034,7 +1089,10 @@ class NFL_Showdown_Simulator:
             positions,
         )
 
-    def initialize_problems_list(self, diff, player_data):
+    def lineup_arrays(self, player_data):
+        # the player arrays generate_lineups works from, and the limits passed with every
+        # block. each player's flex version (for a captain) and the positions of the
+        # captain rule are looked up here, so the workers need no player dicts
         (
             ids,
             ownership,
@@ -1045,360 +1103,212 @@ class NFL_Showdown_Simulator:
             matchups,
             positions,
         ) = player_data
-        in_lineup = np.zeros(shape=len(ids))
-        ownership, salaries, projections, pos_matrix = map(
-            np.array, [ownership, salaries, projections, positions]
-        )
-        teams, opponents, ids = map(np.array, [teams, opponents, ids])
-        new_player_dict = self.remap_player_dict(self.player_dict)
-        num_players_in_roster = len(self.roster_construction)
-        problems = []
-        for i in range(diff):
-            lu_tuple = (
-                i,
-                ids,
-                in_lineup,
-                pos_matrix,
-                ownership,
-                self.min_lineup_salary,
-                self.salary,
-                self.optimal_score,
-                salaries,
-                projections,
-                self.max_pct_off_optimal,
-                teams,
-                opponents,
-                self.overlap_limit,
-                matchups,
-                new_player_dict,
-                num_players_in_roster,
+        players = list(self.remap_player_dict(self.player_dict).values())
+        flex_rows = [
+            next(
+                (
+                    i
+                    for i, v in enumerate(players)
+                    if v["Name"] == player["Name"]
+                    and v["Team"] == player["Team"]
+                    and v["Position"] == player["Position"]
+                    and v["rosterPosition"] == "FLEX"
+                ),
+                -1,
             )
-            problems.append(lu_tuple)
-        # print(self.player_dict.keys())
-        return problems
-
-    def handle_stacks_logic(self, diff):
-        stacks = np.random.binomial(
-            n=1, p=self.pct_field_using_stacks, size=diff
-        ).astype(str)
-        stack_len = np.random.choice(
-            a=[1, 2],
-            p=[1 - self.pct_field_double_stacks, self.pct_field_double_stacks],
-            size=diff,
+            for player in players
+        ]
+        arrays = {
+            "ids": np.array(ids),
+            "pos_matrix": np.array(positions),
+            "ownership": np.array(ownership),
+            "salaries": np.array(salaries),
+            "projections": np.array(projections),
+            "teams": np.array(teams),
+            "opponents": np.array(opponents),
+            "flex_rows": np.array(flex_rows, dtype=np.int64),
+            "is_qb": np.array(["QB" in player["Position"] for player in players]),
+            "is_def": np.array([player["Position"] == "DEF" for player in players]),
+        }
+        limits = (
+            self.min_lineup_salary,
+            self.salary,
+            self.optimal_score,
+            self.max_pct_off_optimal,
+            self.overlap_limit,
+            len(self.roster_construction),
+            self.entropy,
         )
-        a = list(self.stacks_dict.keys())
-        p = np.array(list(self.stacks_dict.values()))
-        probs = p / sum(p)
-        for i in range(len(stacks)):
-            if stacks[i] == "1":
-                choice = random.choices(a, weights=probs, k=1)
-                stacks[i] = choice[0]
-            else:
-                stacks[i] = ""
-        return stacks
+        return arrays, limits
 
     def update_field_lineups(self, output, diff):
-        if len(self.field_lineups) == 0:
-            new_keys = list(range(0, self.field_size))
-        else:
-            new_keys = list(
-                range(
-                    max(self.field_lineups.keys()) + 1,
-                    max(self.field_lineups.keys()) + 1 + diff,
-                )
-            )
-
-        nk = new_keys[0]
-        for i, o in enumerate(output):
-            lineup_list = sorted(next(iter(o.values()))["Lineup"])
-            lineup_set = frozenset(lineup_list)  # Convert the list to a frozenset
-
-            # Keeping track of lineup duplication counts
-            if lineup_set in self.seen_lineups:
-                self.seen_lineups[lineup_set] += 1
-
-                # Increase the count in field_lineups using the index stored in seen_lineups_ix
-                self.field_lineups[self.seen_lineups_ix[lineup_set]]["count"] += 1
-            else:
-                self.seen_lineups[lineup_set] = 1
-
-                # Updating the field lineups dictionary
-                if nk in self.field_lineups.keys():
-                    print("bad lineups dict, please check dk_data files")
-                else:
-                    self.field_lineups[nk] = {
-                        "Lineup": next(iter(o.values())),
-                        "count": self.seen_lineups[lineup_set],
-                    }
-
-                    # Store the new nk in seen_lineups_ix for quick access in the future
-                    self.seen_lineups_ix[lineup_set] = nk
-                    nk += 1
+        lineups = np.array(
+            [[self.id_to_index[p] for p in lineup] for lineup in output],
+            dtype=np.uint16,
+        )
+        # Keeping track of lineup duplication counts
+        self.field_lineups.append_unique(lineups, "generated")
 
     def calc_gamma(self, mean, sd):
         alpha = (mean / sd) ** 2
         beta = sd**2 / mean
         return alpha, beta
 
-    def run_simulation_for_game(self, team1_id, team1, team2_id, team2, num_iterations):
-        def get_corr_value(player1, player2):
-            if (
-                player1["Team"] == player2["Team"]
-                and player1["Position"][0] == player2["Position"][0]
-            ):
-                return -0.25
-            if player1["Team"] != player2["Team"]:
-                player_2_pos = "Opp " + str(player2["Position"][0])
-            else:
-                player_2_pos = player2["Position"][0]
-            return player1["Correlations"].get(player_2_pos, 0)
-
-        def build_covariance_matrix(players):
-            N = len(players)
-            matrix = [[0 for _ in range(N)] for _ in range(N)]
-            corr_matrix = [[0 for _ in range(N)] for _ in range(N)]
-
-            for i in range(N):
-                for j in range(N):
-                    if i == j:
-                        matrix[i][j] = (
-                            players[i]["StdDev"] ** 2
-                        )  # Variance on the diagonal
-                        corr_matrix[i][j] = 1
-                    else:
-                        matrix[i][j] = (
-                            get_corr_value(players[i], players[j])
-                            * players[i]["StdDev"]
-                            * players[j]["StdDev"]
-                        )
-                        corr_matrix[i][j] = get_corr_value(players[i], players[j])
-            return matrix, corr_matrix
-
-        def ensure_positive_semidefinite(matrix):
-            eigs = np.linalg.eigvals(matrix)
-            if np.any(eigs < 0):
-                jitter = abs(min(eigs)) + 1e-6  # a small value
-                matrix += np.eye(len(matrix)) * jitter
-
-            # Given eigenvalues and eigenvectors from previous code
-            eigenvalues, eigenvectors = np.linalg.eigh(matrix)
-
-            # Set negative eigenvalues to zero
-            eigenvalues[eigenvalues < 0] = 0
-
-            # Reconstruct the matrix
-            matrix = eigenvectors.dot(np.diag(eigenvalues)).dot(eigenvectors.T)
-            return matrix
-
-        # Filter out players with projections less than or equal to 0
-        team1 = [
-            player
-            for player in team1
-            if player["Fpts"] > 0 and player["rosterPosition"] == "FLEX"
-        ]
-        team2 = [
-            player
-            for player in team2
-            if player["Fpts"] > 0 and player["rosterPosition"] == "FLEX"
-        ]
-
-        game = team1 + team2
-        covariance_matrix, corr_matrix = build_covariance_matrix(game)
-        covariance_matrix = ensure_positive_semidefinite(covariance_matrix)
-
-        try:
-            samples = multivariate_normal.rvs(
-                mean=[player["Fpts"] for player in game],
-                cov=covariance_matrix,
-                size=num_iterations,
-            )
-        except Exception as e:
-            print(f"{team1_id}, {team2_id}, bad matrix: {str(e)}")
-            return {}
-
-        player_samples = [samples[:, i] for i in range(len(game))]
-
-        temp_fpts_dict = {}
-        for i, player in enumerate(game):
-            temp_fpts_dict[player["UniqueKey"]] = player_samples[i]
-
-        return temp_fpts_dict
+    def build_game_sampler(self, team1_id, team1, team2_id, team2):
+        # only flex players with a projection are simulated
+        keep1, keep2 = (
+            [
+                i
+                for i, player in enumerate(team)
+                if player["Fpts"] > 0 and player["rosterPosition"] == "FLEX"
+            ]
+            for team in (team1, team2)
+        )
+        rows1, positions1 = self.team_correlations[team1_id]
+        rows2, positions2 = self.team_correlations[team2_id]
+        corr_matrix = game_correlation(
+            np.concatenate((rows1[keep1], rows2[keep2])),
+            np.repeat([0, 1], [len(keep1), len(keep2)]),
+            np.concatenate((positions1[keep1], positions2[keep2])),
+        )
+        game = [team1[i] for i in keep1] + [team2[i] for i in keep2]
+        # factored once per distinct game and cached, the jitter matches the old
+        # ensure_positive_semidefinite repair
+        factor = game_factor(
+            [player["StdDev"] for player in game], corr_matrix, jitter=True
+        )
+        rows = np.array(
+            [self.id_to_index.get(player["UniqueKey"], -1) for player in game],
+            dtype=np.int64,
+        )
+        means = np.array([player["Fpts"] for player in game])
+        return rows, means, factor
 
     @staticmethod
-    @jit(nopython=True)
-    def calculate_payouts(args):
-        (
-            ranks,
-            payout_array,
-            entry_fee,
-            field_lineup_keys,
-            use_contest_data,
-            field_lineups_count,
-        ) = args
-        num_lineups = len(field_lineup_keys)
-        combined_result_array = np.zeros(num_lineups)
-
-        payout_cumsum = np.cumsum(payout_array)
-
-        for r in range(ranks.shape[1]):
-            ranks_in_sim = ranks[:, r]
-            payout_index = 0
-            for lineup_index in ranks_in_sim:
-                lineup_count = field_lineups_count[lineup_index]
-                prize_for_lineup = (
-                    (
-                        payout_cumsum[payout_index + lineup_count - 1]
-                        - payout_cumsum[payout_index - 1]
-                    )
-                    / lineup_count
-                    if payout_index != 0
-                    else payout_cumsum[payout_index + lineup_count - 1] / lineup_count
-                )
-                combined_result_array[lineup_index] += prize_for_lineup
-                payout_index += lineup_count
-        return combined_result_array
+    def run_simulation_for_game(
+        rows, means, factor, player_outcomes, sampler="mc", seed=None
+    ):
+        # draws every sim of the game straight into the outcome matrix, rows of -1 are
+        # players without an entry in the player ids file
+        samples = np.empty((len(rows), player_outcomes.shape[1]), dtype=np.float32)
+        sample_game(samples, means, factor, np.random.default_rng(seed), sampler)
+        found = rows >= 0
+        player_outcomes[rows[found]] = samples[found]
 
     def run_tournament_simulation(self):
         print(f"Running {self.num_iterations} simulations")
-        print(f"Number of unique field lineups: {len(self.field_lineups.keys())}")
-
-        def generate_cpt_outcomes(flex_dict):
-            cpt_dict = {}
-            for player_id, flex_outcomes in flex_dict.items():
-                # Fetch team information using the player_id
-                # Assuming self.player_dict uses a structure like {(player_name, position, team): player_data}
-                player_data_flex = [
-                    data
-                    for (name, pos, team), data in self.player_dict.items()
-                    if data["UniqueKey"] == player_id and pos == "FLEX"
-                ]
-                if player_data_flex:
-                    player_data_flex = player_data_flex[
-                        0
-                    ]  # Get the first match (there should only be one)
-                    team = player_data_flex["Team"]
-
-                    # Fetch the CPT data using the player_name and team fetched from the above step
-                    player_data_cpt = self.player_dict.get(
-                        (player_data_flex["Name"], "CPT", team)
-                    )
-                    if player_data_cpt:
-                        cpt_outcomes = flex_outcomes * 1.5
-                        cpt_dict[player_data_cpt["UniqueKey"]] = cpt_outcomes
-            return cpt_dict
-
-        # Validation on lineups
-        for f in self.field_lineups:
-            if len(self.field_lineups[f]["Lineup"]["Lineup"]) != len(
-                self.roster_construction
-            ):
-                print("bad lineup", f, self.field_lineups[f])
+        print(f"Number of unique field lineups: {len(self.field_lineups)}")
 
         start_time = time.time()
-        temp_fpts_dict = {}
 
         # Get the only matchup since it's a showdown
         matchup = list(self.matchups)[0]
 
-        # Prepare the arguments for the simulation function
-        game_simulation_params = (
+        rows, means, factor = self.build_game_sampler(
             matchup[0],
             self.teams_dict[matchup[0]],
             matchup[1],
             self.teams_dict[matchup[1]],
-            self.num_iterations,
         )
-
-        # Run the simulation for the single game
-        temp_fpts_dict.update(self.run_simulation_for_game(*game_simulation_params))
-        cpt_outcomes_dict = generate_cpt_outcomes(temp_fpts_dict)
-        temp_fpts_dict.update(cpt_outcomes_dict)
+        simulated = np.zeros(len(self.player_ids), dtype=bool)
+        simulated[rows[rows >= 0]] = True
+
+        # player x sim outcome matrix, rows line up with the indices stored in field_lineups.
+        # the game fills in the flex rows and captains score 1.5x their flex outcome
+        store, reused = None, False
+        if self.outcome_store is not None:
+            store = OutcomeStore(self.outcome_store, f"{self.site}_showdown")
+            input_hash = hash_inputs(
+                self.num_iterations,
+                self.player_ids,
+                rows,
+                means,
+                factor,
+                self.sampler,
+                self.seed,
+            )
+            player_outcomes = store.load(input_hash, self.player_ids)
+            reused = player_outcomes is not None
+            if reused:
+                print(f"reusing sim outcomes from {store.path(input_hash)}")
+            else:
+                player_outcomes = store.create(
+                    input_hash, len(self.player_ids), self.num_iterations
+                )
+        else:
+            player_outcomes = np.zeros(
+                shape=(len(self.player_ids), self.num_iterations), dtype=np.float32
+            )
+        if not reused:
+            with instrumentation.stage("outcome sampling", items=self.num_iterations):
+                self.run_simulation_for_game(
+                    rows,
+                    means,
+                    factor,
+                    player_outcomes,
+                    self.sampler,
+                    seed_sequence(self.entropy, games_stream),
+                )
+        for i, (name, pos, team) in enumerate(self.player_keys):
+            flex = self.player_dict.get((name, "FLEX", team))
+            flex_row = None if flex is None else self.id_to_index[flex["UniqueKey"]]
+            if flex_row is None or not simulated[flex_row]:
+                print("cant find player in sim dict", self.player_keys[i])
+                continue
+            if pos == "CPT" and not reused:
+                player_outcomes[i] = 1.5 * player_outcomes[flex_row]
+        if store is not None and not reused:
+            store.save_index(input_hash, self.player_ids, player_outcomes)
         # generate arrays for every sim result for each player in the lineup and sum
-        fpts_array = np.zeros(shape=(len(self.field_lineups), self.num_iterations))
-        # converting payout structure into an np friendly format, could probably just do this in the load contest function
-        # print(self.field_lineups)
-        # print(temp_fpts_dict)
-        # print(payout_array)
-        # print(self.player_dict[('patrick mahomes', 'FLEX', 'KC')])
-        field_lineups_count = np.array(
-            [self.field_lineups[idx]["count"] for idx in self.field_lineups.keys()]
+        fl = self.field_lineups
+        with instrumentation.stage("scoring", items=self.num_iterations):
+            fpts_array = fl.score(player_outcomes)
+        # running total of the prizes by place, down to the last paid one
+        prizes = np.trim_zeros(
+            np.array(list(self.payout_structure.values()), dtype=np.float64), "b"
         )
-
-        for index, values in self.field_lineups.items():
-            try:
-                fpts_sim = sum(
-                    [temp_fpts_dict[player] for player in values["Lineup"]["Lineup"]]
+        prize_cumsum = np.concatenate(([0.0], np.cumsum(prizes)))
+        # wins, top 10s, top 1%s and payouts without sorting the whole field
+        if self.entries_only and not len(fl.rows_of_type("input")):
+            print("no lineups from tournament_lineups.csv, ranking the whole field")
+            self.entries_only = False
+        with instrumentation.stage("ranking", items=self.num_iterations):
+            if self.histogram_width is not None:
+                self.check_histogram(fpts_array)
+                ranked = rank_histogram(
+                    fpts_array,
+                    self.ranked_rows(),
+                    fl.counts,
+                    prize_cumsum,
+                    fl.finish_cutoffs(),
+                    self.histogram_width,
+                    self.rank_blocks(),
                 )
-            except KeyError:
-                for player in values["Lineup"]["Lineup"]:
-                    if player not in temp_fpts_dict.keys():
-                        print(player)
-                        # for k,v in self.player_dict.items():
-                        # if v['ID'] == player:
-                        #        print(k,v)
-                # print('cant find player in sim dict', values["Lineup"], temp_fpts_dict.keys())
-            # store lineup fpts sum in 2d np array where index (row) corresponds to index of field_lineups and columns are the fpts from each sim
-            fpts_array[index] = fpts_sim
-
-        fpts_array = fpts_array.astype(np.float16)
-        # ranks = np.argsort(fpts_array, axis=0)[::-1].astype(np.uint16)
-        ranks = np.argsort(-fpts_array, axis=0).astype(np.uint32)
-
-        # count wins, top 10s vectorized
-        wins, win_counts = np.unique(ranks[0, :], return_counts=True)
-        t10, t10_counts = np.unique(ranks[0:9], return_counts=True)
-        payout_array = np.array(list(self.payout_structure.values()))
-        # subtract entry fee
-        payout_array = payout_array - self.entry_fee
-        l_array = np.full(
-            shape=self.field_size - len(payout_array), fill_value=-self.entry_fee
-        )
-        payout_array = np.concatenate((payout_array, l_array))
-        field_lineups_keys_array = np.array(list(self.field_lineups.keys()))
-
-        # Adjusted ROI calculation
-        # print(field_lineups_count.shape, payout_array.shape, ranks.shape, fpts_array.shape)
-
-        # Split the simulation indices into chunks
-        field_lineups_keys_array = np.array(list(self.field_lineups.keys()))
-
-        chunk_size = self.num_iterations // 16  # Adjust chunk size as needed
-        simulation_chunks = [
-            (
-                ranks[:, i : min(i + chunk_size, self.num_iterations)].copy(),
-                payout_array,
-                self.entry_fee,
-                field_lineups_keys_array,
-                self.use_contest_data,
-                field_lineups_count,
-            )  # Adding field_lineups_count here
-            for i in range(0, self.num_iterations, chunk_size)
-        ]
-
-        # Use the pool to process the chunks in parallel
-        with mp.Pool() as pool:
-            results = pool.map(self.calculate_payouts, simulation_chunks)
-
-        combined_result_array = np.sum(results, axis=0)
-        total_sum = 0
-        index_to_key = list(self.field_lineups.keys())
-        for idx, roi in enumerate(combined_result_array):
-            lineup_key = index_to_key[idx]
-            lineup_count = self.field_lineups[lineup_key][
-                "count"
-            ]  # Assuming "Count" holds the count of the lineups
-            total_sum += roi * lineup_count
-            self.field_lineups[lineup_key]["Lineup"]["ROI"] += roi
-
-        for idx in self.field_lineups.keys():
-            if idx in wins:
-                self.field_lineups[idx]["Lineup"]["Wins"] += win_counts[
-                    np.where(wins == idx)
-                ][0]
-            if idx in t10:
-                self.field_lineups[idx]["Lineup"]["Top10"] += t10_counts[
-                    np.where(t10 == idx)
-                ][0]
+            elif self.entries_only:
+                ranked = rank_entries(
+                    fpts_array,
+                    self.ranked_rows(),
+                    fl.counts,
+                    prize_cumsum,
+                    fl.finish_cutoffs(),
+                    self.rank_blocks(),
+                )
+            else:
+                ranked = rank_sims(
+                    fpts_array,
+                    fl.counts,
+                    prize_cumsum,
+                    fl.finish_cutoffs(),
+                    self.rank_blocks(),
+                )
+        finishes, prize_totals, cashes, prize_squares, win_squares = ranked
+        with instrumentation.stage("payout"):
+            fl.add_finishes(finishes)
+            fl.win_squares += win_squares
+            fl.cashes += cashes
+            fl.roi += prize_totals
+            fl.roi[self.ranked_rows()] -= self.entry_fee * self.num_iterations
+            fl.prize_squares += prize_squares
 
         end_time = time.time()
         diff = end_time - start_time
@@ -1409,93 +1319,138 @@ class NFL_Showdown_Simulator:
             + " seconds. Outputting."
         )
 
-    def output(self):
-        unique = {}
-        for index, data in self.field_lineups.items():
-            # if index == 0:
-            #    print(data)
-            lineup = data["Lineup"]["Lineup"]
-            lineup_data = data["Lineup"]
-            lu_type = lineup_data["Type"]
-
-            salary = 0
-            fpts_p = 0
-            fieldFpts_p = 0
-            ceil_p = 0
-            own_p = []
-            own_s = []
-            lu_names = []
-            lu_teams = []
-            cpt_tm = ""
-            def_opps = []
-            players_vs_def = 0
-
-            player_dict_values = {
-                v["UniqueKey"]: v for k, v in self.player_dict.items()
-            }
-
-            for player_id in lineup:
-                player_data = player_dict_values.get(player_id, {})
-                if player_data:
-                    if "DST" in player_data["Position"]:
-                        def_opps.append(player_data["Opp"])
-                    if "CPT" in player_data["rosterPosition"]:
-                        cpt_tm = player_data["Team"]
-
-                    salary += player_data.get("Salary", 0)
-                    fpts_p += player_data.get("Fpts", 0)
-                    fieldFpts_p += player_data.get("fieldFpts", 0)
-                    ceil_p += player_data.get("Ceiling", 0)
-                    own_p.append(player_data.get("Ownership", 0) / 100)
-                    own_s.append(player_data.get("Ownership", 0))
-                    if self.site == "fd" and "CPT" in player_data["rosterPosition"]:
-                        player_id = player_data.get("ID", "")
-                        if player_id.endswith("69696969"):
-                            player_id = player_id.replace("69696969", "")
-                        lu_names.append(f"{player_data.get('Name', '')} ({player_id})")
-                    else:
-                        lu_names.append(
-                            f"{player_data.get('Name', '').replace('#','-')} ({player_data.get('ID', '')})"
-                        )
-                    lu_teams.append(player_data["Team"])
-                    if "DST" not in player_data["Position"]:
-                        if player_data["Team"] in def_opps:
-                            players_vs_def += 1
-
-            counter = collections.Counter(lu_teams)
-            stacks = counter.most_common()
-
-            primary_stack = secondary_stack = ""
-            for s in stacks:
-                if s[0] == cpt_tm:
-                    primary_stack = f"{cpt_tm} {s[1]}"
-                    stacks.remove(s)
-                    break
-
-            if stacks:
-                secondary_stack = f"{stacks[0][0]} {stacks[0][1]}"
-
-            own_p = np.prod(own_p)
-            own_s = np.sum(own_s)
-            win_p = round(lineup_data["Wins"] / self.num_iterations * 100, 2)
-            top10_p = round(lineup_data["Top10"] / self.num_iterations * 100, 2)
-            cash_p = round(lineup_data["Cashes"] / self.num_iterations * 100, 2)
-            num_dupes = data["count"]
-            if self.use_contest_data:
-                roi_p = round(
-                    lineup_data["ROI"] / self.entry_fee / self.num_iterations * 100, 2
-                )
-                roi_round = round(lineup_data["ROI"] / self.num_iterations, 2)
+    def check_histogram(self, fpts_array):
+        # compares the approximate ranking to an exact one on the first few sims, once a run
+        if self.histogram_error is not None:
+            return
+        self.histogram_error = histogram_rank_error(
+            fpts_array[:, : self.histogram_check_sims],
+            self.ranked_rows(),
+            self.field_lineups.counts,
+            self.histogram_width,
+        )
+        print(
+            "ranking with {} point buckets, lineups are placed {:.2f} entries (at most {}) "
+            "above their exact rank over {} checked sims".format(
+                self.histogram_width,
+                self.histogram_error[0],
+                int(self.histogram_error[1]),
+                min(self.histogram_check_sims, fpts_array.shape[1]),
+            )
+        )
 
-            if self.use_contest_data:
-                lineup_str = f"{lu_type},{','.join(lu_names)},{salary},{fpts_p},{fieldFpts_p},{ceil_p},{primary_stack},{secondary_stack},{players_vs_def},{win_p}%,{top10_p}%,{cash_p}%,{own_p},{own_s},{roi_p}%,${roi_round},{num_dupes}"
-            else:
-                lineup_str = f"{lu_type},{','.join(lu_names)},{salary},{fpts_p},{fieldFpts_p},{ceil_p},{primary_stack},{secondary_stack},{players_vs_def},{win_p}%,{top10_p}%,{cash_p}%,{own_p},{own_s},{num_dupes}"
-            unique[
-                lineup_str
-            ] = fpts_p  # Changed data["Fpts"] to fpts_p, which contains the accumulated Fpts
+    def rank_blocks(self):
+        # blocks of sims the ranking kernels split between threads
+        if self.seed is not None:
+            return self.seeded_rank_blocks
+        return get_num_threads()
+
+    def sampler_speedup(self, sampler, num_sims=1000, repeats=64, seed=None):
+        # equivalent-iterations speedup of sampler over plain monte carlo for the game, see
+        # sim_sampling.sampler_speedup
+        matchup = list(self.matchups)[0]
+        _, means, factor = self.build_game_sampler(
+            matchup[0],
+            self.teams_dict[matchup[0]],
+            matchup[1],
+            self.teams_dict[matchup[1]],
+        )
+        return sampler_speedup(means, factor, sampler, num_sims, repeats, seed)
 
-        return unique
+    def ranked_rows(self):
+        # field rows that get results, just the uploaded lineups with entries_only
+        if self.entries_only:
+            return self.field_lineups.rows_of_type("input")
+        return np.arange(len(self.field_lineups))
+
+    def output(self):
+        # one row per field lineup, built from per-player columns gathered through the
+        # field's player indices
+        fl = self.field_lineups
+        players = [self.player_dict[k] for k in self.player_keys]
+        team_names = sorted({p["Team"] for p in players} | {p["Opp"] for p in players})
+        team_codes = {team: code for code, team in enumerate(team_names)}
+        teams = np.array([team_codes[p["Team"]] for p in players])
+        opps = np.array([team_codes[p["Opp"]] for p in players])
+        is_dst = np.array(["DST" in p["Position"] for p in players])
+        is_cpt = np.array(["CPT" in p["rosterPosition"] for p in players])
+        labels = []
+        for p in players:
+            if self.site == "fd" and "CPT" in p["rosterPosition"]:
+                player_id = p.get("ID", "")
+                if player_id.endswith("69696969"):
+                    player_id = player_id.replace("69696969", "")
+                labels.append(f"{p.get('Name', '')} ({player_id})")
+            else:
+                labels.append(f"{p.get('Name', '').replace('#','-')} ({p.get('ID', '')})")
+        labels = np.array(labels, dtype=object)
+
+        lineups = fl.lineups.astype(np.intp)
+        # the captain's team anchors the primary stack
+        last_cpt = lineups.shape[1] - 1 - is_cpt[lineups][:, ::-1].argmax(axis=1)
+        anchor = np.where(
+            is_cpt[lineups].any(axis=1),
+            teams[lineups[np.arange(len(fl)), last_cpt]],
+            -1,
+        )
+        primary_stack, secondary_stack = stack_columns(
+            teams[lineups], anchor, team_names
+        )
+        players_vs_def = players_vs_dst(teams[lineups], opps[lineups], is_dst[lineups])
+        salary = slot_sum(
+            player_column(self.player_dict, self.player_keys, "Salary")[lineups]
+        )
+        fpts_p = slot_sum(
+            player_column(self.player_dict, self.player_keys, "Fpts", dtype=float)[
+                lineups
+            ]
+        )
+        fieldFpts_p = slot_sum(
+            player_column(self.player_dict, self.player_keys, "fieldFpts", dtype=float)[
+                lineups
+            ]
+        )
+        ceil_p = slot_sum(
+            player_column(self.player_dict, self.player_keys, "Ceiling", dtype=float)[
+                lineups
+            ]
+        )
+        ownership = player_column(
+            self.player_dict, self.player_keys, "Ownership", dtype=float
+        )[lineups]
+        own_p = np.prod(ownership / 100, axis=1)
+        own_s = slot_sum(ownership)
+        win_p = np.round(fl.wins / self.num_iterations * 100, 2)
+        top10_p = np.round(fl.top10 / self.num_iterations * 100, 2)
+        cash_p = np.round(fl.cashes / self.num_iterations * 100, 2)
+
+        columns = [np.array(fl.lineup_types)[fl.types]]
+        columns += list(labels[lineups].T)
+        columns += [
+            salary.tolist(),
+            fpts_p.tolist(),
+            fieldFpts_p.tolist(),
+            ceil_p.tolist(),
+            primary_stack,
+            secondary_stack,
+            players_vs_def.tolist(),
+            [f"{p}%" for p in win_p.tolist()],
+            [f"{p}%" for p in top10_p.tolist()],
+            [f"{p}%" for p in cash_p.tolist()],
+            own_p.tolist(),
+            own_s.tolist(),
+        ]
+        if self.use_contest_data:
+            roi_p = np.round(fl.roi / self.entry_fee / self.num_iterations * 100, 2)
+            roi_round = np.round(fl.roi / self.num_iterations, 2)
+            columns.append([f"{p}%" for p in roi_p.tolist()])
+            columns.append([f"${r}" for r in roi_round.tolist()])
+        columns.append(fl.counts.tolist())
+        rows = zip(*columns)
+        if self.entries_only:
+            # the rest of the field wasn't ranked
+            rows = itertools.compress(rows, fl.types == fl.lineup_types.index("input"))
+        return rows
 
     def player_output(self):
         # out_path = os.path.join(self.output_dir, f"{self.slate_id}_{self.sport}_{self.site}_player_output.csv")
@@ -1506,50 +1461,56 @@ class NFL_Showdown_Simulator:
                 self.site, self.field_size, self.num_iterations
             ),
         )
-        with open(out_path, "w") as f:
-            f.write(
-                "Player,Roster Position,Position,Team,Win%,Top10%,Sim. Own%,Proj. Own%,Avg. Return\n"
-            )
-            unique_players = {}
-
-            for val in self.field_lineups.values():
-                lineup_data = val["Lineup"]
-                counts = val["count"]
-                for player_id in lineup_data["Lineup"]:
-                    if player_id not in unique_players:
-                        unique_players[player_id] = {
-                            "Wins": lineup_data["Wins"],
-                            "Top10": lineup_data["Top10"],
-                            "In": val["count"],
-                            "ROI": lineup_data["ROI"],
-                        }
-                    else:
-                        unique_players[player_id]["Wins"] += lineup_data["Wins"]
-                        unique_players[player_id]["Top10"] += lineup_data["Top10"]
-                        unique_players[player_id]["In"] += val["count"]
-                        unique_players[player_id]["ROI"] += lineup_data["ROI"]
-
-            for player_id, data in unique_players.items():
-                field_p = round(data["In"] / self.field_size * 100, 2)
-                win_p = round(data["Wins"] / self.num_iterations * 100, 2)
-                top10_p = round(data["Top10"] / self.num_iterations / 10 * 100, 2)
-                roi_p = round(data["ROI"] / data["In"] / self.num_iterations, 2)
-                for k, v in self.player_dict.items():
-                    if v["UniqueKey"] == player_id:
-                        player_info = v
-                        break
-                proj_own = player_info.get("Ownership", "N/A")
-                p_name = player_info.get("Name", "N/A").replace("#", "-")
-                sd_position = player_info.get("rosterPosition", ["N/A"])
-                position = player_info.get("Position", ["N/A"])[0]
-                team = player_info.get("Team", "N/A")
-
-                f.write(
-                    f"{p_name},{sd_position},{position},{team},{win_p}%,{top10_p}%,{field_p}%,{proj_own}%,${roi_p}\n"
-                )
+        exposure = self.player_exposure()
+        rows = zip(
+            exposure["Player"].str.replace("#", "-"),
+            exposure["Roster Position"],
+            exposure["Position"],
+            exposure["Team"],
+            [f"{p}%" for p in exposure["Win%"].tolist()],
+            [f"{p}%" for p in exposure["Top10%"].tolist()],
+            [f"{p}%" for p in exposure["Sim. Own%"].tolist()],
+            [f"{p}%" for p in exposure["Proj. Own%"].tolist()],
+            [f"${r}" for r in exposure["Avg. Return"].tolist()],
+        )
+        write_csv(
+            out_path,
+            "Player,Roster Position,Position,Team,Win%,Top10%,Sim. Own%,Proj. Own%,Avg. Return\n",
+            rows,
+        )
+
+    def player_exposure(self):
+        # per-player results over the field as a DataFrame indexed by the player's unique
+        # key (captains and flex spots are separate rows), in the order they first appear
+        import pandas as pd
+
+        fl = self.field_lineups
+        rows = self.ranked_rows()
+        totals = fl.player_totals(len(self.player_keys), rows)
+        order = first_appearance(fl.lineups[rows])
+        players = [self.player_dict[self.player_keys[i]] for i in order]
+        return pd.DataFrame(
+            {
+                "Player": [p.get("Name", "N/A") for p in players],
+                "Roster Position": [p.get("rosterPosition", "N/A") for p in players],
+                "Position": [p.get("Position", ["N/A"])[0] for p in players],
+                "Team": [p.get("Team", "N/A") for p in players],
+                "Win%": np.round(totals["Wins"][order] / self.num_iterations * 100, 2),
+                "Top10%": np.round(
+                    totals["Top10"][order] / self.num_iterations / 10 * 100, 2
+                ),
+                "Sim. Own%": np.round(totals["In"][order] / self.field_size * 100, 2),
+                "Proj. Own%": [p.get("Ownership", "N/A") for p in players],
+                "Avg. Return": np.round(
+                    totals["ROI"][order] / totals["In"][order] / self.num_iterations, 2
+                ),
+            },
+            index=pd.Index(self.player_ids[order], name="ID"),
+        )
 
+    @instrumentation.timed("output")
     def save_results(self):
-        unique = self.output()
+        rows = self.output()
 
         # First output file
         # include timetsamp in filename, formatted as readable
@@ -1562,28 +1523,13 @@ class NFL_Showdown_Simulator:
         )
         if self.site == "dk":
             if self.use_contest_data:
-                with open(out_path, "w") as f:
-                    header = "Type,CPT,FLEX,FLEX,FLEX,FLEX,FLEX,Salary,Fpts Proj,Field Fpts Proj,Ceiling,Primary Stack,Secondary Stack,Players vs DST,Win %,Top 10%,Cash %,Proj. Own. Product,Proj. Own. Sum,ROI%,ROI$,Num Dupes\n"
-                    f.write(header)
-                    for lineup_str, fpts in unique.items():
-                        f.write(f"{lineup_str}\n")
+                header = "Type,CPT,FLEX,FLEX,FLEX,FLEX,FLEX,Salary,Fpts Proj,Field Fpts Proj,Ceiling,Primary Stack,Secondary Stack,Players vs DST,Win %,Top 10%,Cash %,Proj. Own. Product,Proj. Own. Sum,ROI%,ROI$,Num Dupes\n"
             else:
-                with open(out_path, "w") as f:
-                    header = "Type,CPT,FLEX,FLEX,FLEX,FLEX,FLEX,Salary,Fpts Proj,Field Fpts Proj,Ceiling,Primary Stack,Secondary Stack,Players vs DST,Win %,Top 10%,Cash %,Proj. Own. Product,Proj. Own. Sum,Num Dupes\n"
-                    f.write(header)
-                    for lineup_str, fpts in unique.items():
-                        f.write(f"{lineup_str}\n")
+                header = "Type,CPT,FLEX,FLEX,FLEX,FLEX,FLEX,Salary,Fpts Proj,Field Fpts Proj,Ceiling,Primary Stack,Secondary Stack,Players vs DST,Win %,Top 10%,Cash %,Proj. Own. Product,Proj. Own. Sum,Num Dupes\n"
         else:
             if self.use_contest_data:
-                with open(out_path, "w") as f:
-                    header = "Type,CPT,FLEX,FLEX,FLEX,FLEX,Salary,Fpts Proj,Field Fpts Proj,Ceiling,Primary Stack,Secondary Stack,Players vs DST,Win %,Top 10%,Cash %,Proj. Own. Product,Proj. Own. Sum,ROI,ROI/Entry Fee,Num Dupes\n"
-                    f.write(header)
-                    for lineup_str, fpts in unique.items():
-                        f.write(f"{lineup_str}\n")
+                header = "Type,CPT,FLEX,FLEX,FLEX,FLEX,Salary,Fpts Proj,Field Fpts Proj,Ceiling,Primary Stack,Secondary Stack,Players vs DST,Win %,Top 10%,Cash %,Proj. Own. Product,Proj. Own. Sum,ROI,ROI/Entry Fee,Num Dupes\n"
             else:
-                with open(out_path, "w") as f:
-                    header = "Type,CPT,FLEX,FLEX,FLEX,FLEX,Salary,Fpts Proj,Field Fpts Proj,Ceiling,Primary Stack,Secondary Stack,Players vs DST,Win %,Top 10%,Cash %,Proj. Own. Product,Proj. Own. Sum,Num Dupes\n"
-                    f.write(header)
-                    for lineup_str, fpts in unique.items():
-                        f.write(f"{lineup_str}\n")
+                header = "Type,CPT,FLEX,FLEX,FLEX,FLEX,Salary,Fpts Proj,Field Fpts Proj,Ceiling,Primary Stack,Secondary Stack,Players vs DST,Win %,Top 10%,Cash %,Proj. Own. Product,Proj. Own. Sum,Num Dupes\n"
+        write_csv(out_path, header, rows)
         self.player_output()
@@ -0,0 +1,90 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+
+def hash_inputs(*parts):
+    # sha256 over everything that shapes the sampled outcomes (arrays by their bytes)
+    digest = hashlib.sha256()
+
+    def update(part):
+        if isinstance(part, np.ndarray):
+            digest.update(str((part.dtype.str, part.shape)).encode())
+            digest.update(np.ascontiguousarray(part).tobytes())
+        elif isinstance(part, (list, tuple)):
+            digest.update(b"[")
+            for item in part:
+                update(item)
+            digest.update(b"]")
+        else:
+            digest.update(repr(part).encode())
+
+    update(parts)
+    return digest.hexdigest()
+
+
+class OutcomeStore:
+    """Player x iteration outcome matrices kept on disk between runs.
+
+    Each matrix is a `.npy` file named after the hash of the sim inputs, with a `.json`
+    sidecar holding the player IDs (row order) and that hash. A later run with the same
+    players, projections, correlations and iteration count maps the file read-only
+    instead of sampling again, whatever field or contest it is ranking."""
+
+    def __init__(self, directory, prefix):
+        self.directory = directory
+        self.prefix = prefix
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, input_hash):
+        return os.path.join(
+            self.directory, "{}_{}.npy".format(self.prefix, input_hash[:16])
+        )
+
+    def index_path(self, input_hash):
+        return self.path(input_hash)[: -len(".npy")] + ".json"
+
+    def load(self, input_hash, player_ids):
+        # the stored matrix mapped read-only, or None if there isn't a complete one
+        try:
+            with open(self.index_path(input_hash)) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if index.get("input_hash") != input_hash or index.get("player_ids") != [
+            str(p) for p in player_ids
+        ]:
+            return None
+        try:
+            outcomes = np.load(self.path(input_hash), mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        # mark it as recently used for a stage cache sharing the directory
+        os.utime(self.path(input_hash))
+        return outcomes
+
+    def create(self, input_hash, num_players, num_iterations):
+        # zero filled float32 matrix for the sims to write into. the sidecar is only written
+        # by save_index once it's filled, so an interrupted run is never picked up
+        if os.path.exists(self.index_path(input_hash)):
+            os.remove(self.index_path(input_hash))
+        return np.lib.format.open_memmap(
+            self.path(input_hash),
+            mode="w+",
+            dtype=np.float32,
+            shape=(num_players, num_iterations),
+        )
+
+    def save_index(self, input_hash, player_ids, outcomes):
+        outcomes.flush()
+        with open(self.index_path(input_hash), "w") as f:
+            json.dump(
+                {
+                    "input_hash": input_hash,
+                    "player_ids": [str(p) for p in player_ids],
+                    "shape": list(outcomes.shape),
+                },
+                f,
+            )
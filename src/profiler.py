@@ -0,0 +1,283 @@
+import collections
+import json
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing import util
+
+# a profiled run leaves these for its pool workers: where they save their stacks, how
+# often they sample and which process is the run's own
+directory_variable = "NFL_DFS_PROFILE_DIR"
+interval_variable = "NFL_DFS_PROFILE_INTERVAL"
+parent_variable = "NFL_DFS_PROFILE_PARENT"
+
+# rows in the hot function table
+top_functions = 25
+
+# a pool worker only running code from these is waiting for work, not doing any
+idle_files = ("threading.py", "queue.py", "selectors.py")
+
+
+class StackSampler:
+    """Samples the Python stack of a process's main thread from a background thread.
+
+    Each sample counts for the wall time since the one before it, so a call that keeps the
+    GIL, like a numba kernel or a big numpy operation, still gets its time, under the
+    Python function that made it. Stacks are kept collapsed, as frame names joined by ";"
+    from the outermost in. A pool worker's samples start at the pool's worker loop and the
+    ones taken while it waits for a task are dropped; it saves what it has to a file in
+    `directory` now and then and when it exits, for the run's own process to merge."""
+
+    def __init__(self, role, interval, directory=None):
+        self.role = role
+        self.interval = interval
+        self.directory = directory
+        self.stacks = collections.Counter()
+        self.names = {}
+        self.thread_id = threading.get_ident()
+        self.finishing = False
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join(1)
+
+    def run(self):
+        last = saved = time.perf_counter()
+        while not self.stopping.wait(self.interval):
+            now = time.perf_counter()
+            frame = sys._current_frames().get(self.thread_id)
+            stack = None if frame is None else self.collapse(frame)
+            del frame
+            if stack is not None:
+                self.stacks[stack] += now - last
+            last = now
+            if self.directory is not None and now - saved >= 1:
+                self.save()
+                saved = now
+
+    def name(self, code):
+        name = self.names.get(code)
+        if name is None:
+            name = self.names[code] = "{} ({}:{})".format(
+                code.co_name, os.path.basename(code.co_filename), code.co_firstlineno
+            )
+        return name
+
+    def collapse(self, frame):
+        codes = []
+        while frame is not None:
+            code = frame.f_code
+            # in a worker, everything from the process start up is the same every time
+            # (and with fork, the stack of whoever started the pool)
+            if self.directory is not None and code.co_name == "_bootstrap":
+                break
+            codes.append(code)
+            frame = frame.f_back
+        if self.directory is not None and all(map(waiting, codes)):
+            return None
+        return ";".join([self.role] + [self.name(code) for code in reversed(codes)])
+
+    def path(self):
+        return os.path.join(self.directory, "{}.json".format(os.getpid()))
+
+    def save(self):
+        # written whole and swapped in, so it's never read half done
+        temp = "{}.{}.tmp".format(self.path(), threading.get_ident())
+        with open(temp, "w") as f:
+            json.dump(dict(self.stacks), f)
+        os.replace(temp, self.path())
+
+    def finish(self):
+        self.finishing = True
+        self.stop()
+        self.save()
+
+
+def waiting(code):
+    return (
+        os.sep + "multiprocessing" + os.sep in code.co_filename
+        or os.path.basename(code.co_filename) in idle_files
+    )
+
+
+# the sampler of this process, if it's being profiled
+sampler = None
+
+
+def start(interval=0.005):
+    """Profiles this process and the pool workers it starts, see `write`."""
+    global sampler
+    os.environ[directory_variable] = tempfile.mkdtemp(prefix="nfl_dfs_profile_")
+    os.environ[interval_variable] = str(interval)
+    os.environ[parent_variable] = str(os.getpid())
+    sampler = StackSampler("main", interval).start()
+    # forked workers don't import anything, they start sampling from here
+    util.register_after_fork(sampler, start_worker)
+
+
+def child_environment():
+    # os.environ without the profiling variables, for processes started some other way
+    # than as pool workers (the bench's runs), which would otherwise profile themselves
+    # as if they were workers of this one
+    profiling = (directory_variable, interval_variable, parent_variable)
+    return {name: value for name, value in os.environ.items() if name not in profiling}
+
+
+def start_worker(*unused):
+    global sampler
+    sampler = StackSampler(
+        "pool worker",
+        float(os.environ[interval_variable]),
+        os.environ[directory_variable],
+    ).start()
+    watch_exit(sampler)
+    # a spawned worker imports this before the process has started properly, and starting
+    # drops the exit hooks set up so far
+    util.register_after_fork(sampler, watch_exit)
+
+
+def watch_exit(worker):
+    # pools close their workers by ending the task loop or, when they're terminated, with
+    # SIGTERM; save the samples either way
+    util.Finalize(None, worker.finish, exitpriority=100)
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, terminated)
+
+
+def terminated(signum, frame):
+    if sampler.finishing:
+        # it's already saving on its way out, let it get on with it
+        return
+    sampler.finish()
+    signal.signal(signum, signal.SIG_DFL)
+    os.kill(os.getpid(), signum)
+
+
+def collect():
+    # stacks of this process and of every worker, merged
+    sampler.stop()
+    stacks = collections.Counter(sampler.stacks)
+    directory = os.environ.pop(directory_variable)
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.endswith(".json"):
+            with open(path) as f:
+                stacks.update(json.load(f))
+        os.remove(path)
+    os.rmdir(directory)
+    return stacks
+
+
+def hot_functions(stacks, top=top_functions):
+    # (function, self seconds, total seconds) of the functions with the most self time.
+    # self time is time in the function itself (or in something it calls that isn't
+    # python), total time includes everything it called
+    self_time = collections.Counter()
+    total_time = collections.Counter()
+    for stack, seconds in stacks.items():
+        names = stack.split(";")[1:]
+        if names:
+            self_time[names[-1]] += seconds
+        for name in set(names):
+            total_time[name] += seconds
+    return [
+        (name, seconds, total_time[name])
+        for name, seconds in self_time.most_common(top)
+    ]
+
+
+def speedscope(stacks, name):
+    # https://www.speedscope.app file with the main process and the pool workers as two
+    # profiles of one file
+    frames = {}
+    profiles = []
+    for role in ("main", "pool worker"):
+        samples = []
+        weights = []
+        for stack, seconds in stacks.items():
+            names = stack.split(";")
+            if names[0] != role:
+                continue
+            samples.append([frames.setdefault(n, len(frames)) for n in names[1:]])
+            weights.append(seconds)
+        if samples:
+            profiles.append(
+                {
+                    "type": "sampled",
+                    "name": role if role == "main" else "pool workers",
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": sum(weights),
+                    "samples": samples,
+                    "weights": weights,
+                }
+            )
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "NFL-DFS-Tools",
+        "activeProfileIndex": 0,
+        "shared": {"frames": [{"name": n} for n in frames]},
+        "profiles": profiles,
+    }
+
+
+def write(prefix):
+    """Stops profiling and writes what was sampled, by the main process and its workers.
+
+    `<prefix>.collapsed` has one line per stack with the milliseconds spent in it, for
+    flamegraph.pl, speedscope and other flame graph tools. `<prefix>.speedscope.json` is
+    the same as a speedscope file and `<prefix>_top.txt` the hot function table, which is
+    also printed."""
+    stacks = collect()
+    with open(prefix + ".collapsed", "w") as f:
+        for stack, seconds in sorted(stacks.items()):
+            milliseconds = round(seconds * 1000)
+            if milliseconds:
+                f.write("{} {}\n".format(stack, milliseconds))
+    with open(prefix + ".speedscope.json", "w") as f:
+        json.dump(speedscope(stacks, os.path.basename(prefix)), f)
+
+    sampled = sum(stacks.values())
+    lines = [
+        "{:>9} {:>7} {:>9} {:>7}  {}".format(
+            "self s", "self %", "total s", "total %", "function"
+        )
+    ]
+    for name, self_seconds, total_seconds in hot_functions(stacks):
+        lines.append(
+            "{:>9.2f} {:>7.1%} {:>9.2f} {:>7.1%}  {}".format(
+                self_seconds,
+                self_seconds / sampled,
+                total_seconds,
+                total_seconds / sampled,
+                name,
+            )
+        )
+    lines.append(
+        "{:.2f} seconds sampled across the main process and its pool workers".format(
+            sampled
+        )
+    )
+    table = "\n".join(lines)
+    with open(prefix + "_top.txt", "w") as f:
+        f.write(table + "\n")
+    print(table)
+    print(
+        "profile written to {}.collapsed and {}.speedscope.json".format(prefix, prefix)
+    )
+
+
+# a worker started with spawn imports its modules from scratch, see start_worker
+if os.environ.get(parent_variable, str(os.getpid())) != str(os.getpid()):
+    start_worker()
@@ -0,0 +1,20 @@
+import numpy as np
+
+# spawn keys of the parts of a run that draw random numbers, each gets its own stream
+field_stream = 0
+games_stream = 1
+solve_stream = 2
+tilt_stream = 3
+
+
+def run_entropy(seed=None):
+    # the number every stream of a run is derived from: seed itself, or fresh entropy
+    # without one (printed, so that run can be repeated with --seed)
+    return np.random.SeedSequence(seed).entropy
+
+
+def seed_sequence(entropy, *spawn_key):
+    # independent stream for one part of a run, e.g. seed_sequence(entropy, games_stream).
+    # derived from the key rather than spawned in order, so it doesn't matter which worker
+    # asks for it or in what order
+    return np.random.SeedSequence(entropy, spawn_key=spawn_key)
@@ -0,0 +1,76 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# arrays attached by a pool worker, filled in by attach_worker
+worker_arrays = {}
+# open segments have to outlive the arrays viewing them
+_worker_segments = []
+
+
+class SharedArrays:
+    """NumPy arrays copied once into shared memory.
+
+    `spec` is a small picklable description of the segments; pool workers pass it to
+    `attach_worker` (as the pool initializer) and read the arrays from `worker_arrays`
+    instead of unpickling a copy with every task. An array can also be given as a
+    (shape, dtype) pair to get a zeroed one for workers to fill in. Use as a context
+    manager so the segments are unlinked when the pool is done."""
+
+    def __init__(self, **arrays):
+        self.arrays = {}
+        self.spec = {}
+        self._segments = []
+        for key, array in arrays.items():
+            if isinstance(array, tuple):
+                shape, dtype = array
+                array = None
+            else:
+                array = np.ascontiguousarray(array)
+                shape, dtype = array.shape, array.dtype
+            dtype = np.dtype(dtype)
+            nbytes = int(np.prod(shape)) * dtype.itemsize
+            # zero sized segments are not allowed, new ones come back zeroed
+            shm = shared_memory.SharedMemory(create=True, size=max(1, nbytes))
+            self._segments.append(shm)
+            view = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+            if array is not None:
+                view[...] = array
+            self.arrays[key] = view
+            self.spec[key] = (shm.name, view.shape, dtype.str)
+
+    def __getitem__(self, key):
+        return self.arrays[key]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # views have to go before the buffers they point at can be released
+        self.arrays = {}
+        for shm in self._segments:
+            shm.close()
+            shm.unlink()
+        self._segments = []
+
+
+def attach(spec):
+    # spec entries are shared memory segments from SharedArrays, or paths of .npy files
+    # (such as a stored outcome matrix) to map for writing
+    arrays = {}
+    for key, entry in spec.items():
+        if isinstance(entry, str):
+            arrays[key] = np.load(entry, mmap_mode="r+")
+            continue
+        name, shape, dtype = entry
+        shm = shared_memory.SharedMemory(name=name)
+        _worker_segments.append(shm)
+        arrays[key] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    return arrays
+
+
+def attach_worker(spec):
+    worker_arrays.update(attach(spec))
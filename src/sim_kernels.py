@@ -0,0 +1,428 @@
+import numpy as np
+from numba import njit, prange
+
+
+@njit(cache=True)
+def kth_largest(values, k):
+    # quickselect for the k-th largest (1 based) of values, which it reorders in place.
+    # numba's np.partition does the same but takes several times longer to compile
+    lo = 0
+    hi = values.shape[0] - 1
+    target = k - 1
+    while lo < hi:
+        pivot = values[(lo + hi) // 2]
+        i = lo
+        j = hi
+        while i <= j:
+            while values[i] > pivot:
+                i += 1
+            while values[j] < pivot:
+                j -= 1
+            if i <= j:
+                values[i], values[j] = values[j], values[i]
+                i += 1
+                j -= 1
+        if target <= j:
+            hi = j
+        elif target >= i:
+            lo = i
+        else:
+            break
+    return values[target]
+
+
+@njit(cache=True)
+def finish_share(cutoff, above, tied):
+    # share of a top cutoff finish each of tied lineups gets with above lineups ahead of
+    # them: the places inside the cutoff they cover, split evenly like tied prizes are
+    return min(max(cutoff - above, 0), tied) / tied
+
+
+def sim_weights(scores, weights):
+    # likelihood ratio of each sim (column of scores), all ones without importance sampling
+    if weights is None:
+        return np.ones(scores.shape[1])
+    return np.asarray(weights, dtype=np.float64)
+
+
+def rank_sims(scores, counts, prize_cumsum, cutoffs, num_blocks, weights=None):
+    # returns how often each lineup finished in the top cutoffs[c] lineups, the total prize won
+    # per entry, the number of cashes per lineup and the totals of each entry's prize and win
+    # share squared (for the standard errors of its average return and win %). with weights
+    # each sim counts as its weight rather than once. each thread's block of sims is summed
+    # up here, in numpy, as reducing them inside the kernel adds seconds to its compile time
+    finishes, prize_totals, cash_totals, prize_squares, win_squares = rank_sim_blocks(
+        scores,
+        counts,
+        prize_cumsum,
+        cutoffs,
+        num_blocks,
+        sim_weights(scores, weights),
+    )
+    return (
+        finishes.sum(axis=0),
+        prize_totals.sum(axis=0),
+        cash_totals.sum(axis=0),
+        prize_squares.sum(axis=0),
+        win_squares.sum(axis=0),
+    )
+
+
+@njit(parallel=True, cache=True)
+def rank_sim_blocks(scores, counts, prize_cumsum, cutoffs, num_blocks, weights):
+    # ranks each sim (column of scores) only as deep as the results need: the best
+    # max(cutoffs) lineups and every lineup down to the last paid place. prize_cumsum is the
+    # running total of the paid places with a leading zero. rather than sorting the field, the
+    # depth-th best score is found by quickselect and only lineups scoring at least that much
+    # are sorted, so every lineup tied at the cut is included. tied scores (and every duplicate
+    # entry of a lineup) split the prizes for the places they cover evenly, and lineups tied
+    # across a finish cutoff split the places inside it, see finish_share. sims are split
+    # into num_blocks blocks, one per thread, each with its own row of the results
+    num_lineups, num_sims = scores.shape
+    num_paid = prize_cumsum.shape[0] - 1
+    deepest_cutoff = cutoffs.max()
+    # every lineup is at least one entry, so num_paid lineups always cover the paid places
+    depth = min(num_lineups, max(num_paid, deepest_cutoff))
+    block = (num_sims + num_blocks - 1) // num_blocks
+    finishes = np.zeros((num_blocks, cutoffs.shape[0], num_lineups))
+    prize_totals = np.zeros((num_blocks, num_lineups))
+    cash_totals = np.zeros((num_blocks, num_lineups))
+    prize_squares = np.zeros((num_blocks, num_lineups))
+    win_squares = np.zeros((num_blocks, num_lineups))
+    for b in prange(num_blocks):
+        column = np.empty(num_lineups, dtype=scores.dtype)
+        scratch = np.empty(num_lineups, dtype=scores.dtype)
+        for r in range(b * block, min(num_sims, (b + 1) * block)):
+            for i in range(num_lineups):
+                column[i] = scores[i, r]
+                scratch[i] = column[i]
+            weight = weights[r]
+            threshold = kth_largest(scratch, depth)
+            ranked = np.nonzero(column >= threshold)[0]
+            order = ranked[np.argsort(-column[ranked], kind="mergesort")]
+            place = 0
+            i = 0
+            # groups of tied lineups from the top, with i lineups and place entries ahead of
+            # each. nothing left to hand out past the last paid place and the deepest cutoff
+            while i < order.shape[0] and (place < num_paid or i < deepest_cutoff):
+                score = column[order[i]]
+                j = i
+                entries = 0
+                while j < order.shape[0] and column[order[j]] == score:
+                    entries += counts[order[j]]
+                    j += 1
+                for c in range(cutoffs.shape[0]):
+                    share = finish_share(cutoffs[c], i, j - i)
+                    if share > 0:
+                        for k in range(i, j):
+                            finishes[b, c, order[k]] += weight * share
+                            if c == 0:
+                                win_squares[b, order[k]] += (weight * share) ** 2
+                if place < num_paid:
+                    last = min(place + entries, num_paid)
+                    per_entry = (prize_cumsum[last] - prize_cumsum[place]) / entries
+                    if per_entry > 0:
+                        per_entry *= weight
+                        for k in range(i, j):
+                            prize_totals[b, order[k]] += per_entry
+                            cash_totals[b, order[k]] += weight
+                            prize_squares[b, order[k]] += per_entry * per_entry
+                place += entries
+                i = j
+    return finishes, prize_totals, cash_totals, prize_squares, win_squares
+
+
+@njit(parallel=True, cache=True)
+def gather_scores(lineups, player_outcomes, out):
+    # adds up the outcome rows of every player in each lineup, out[i, r] being lineup i's
+    # score in sim r. lineups are independent so they're split across threads
+    num_lineups, roster_size = lineups.shape
+    num_sims = player_outcomes.shape[1]
+    for i in prange(num_lineups):
+        for r in range(num_sims):
+            out[i, r] = 0
+        for s in range(roster_size):
+            p = lineups[i, s]
+            for r in range(num_sims):
+                out[i, r] += player_outcomes[p, r]
+    return out
+
+
+def rank_entries(scores, rows, counts, prize_cumsum, cutoffs, num_blocks, weights=None):
+    # rank_sims for just the lineups in rows (our own entries): the rest of the field only
+    # sets the bar. results come back for every lineup, zero outside rows
+    return spread_rows(
+        scores.shape[0],
+        rows,
+        *rank_entry_blocks(
+            scores,
+            rows,
+            counts,
+            prize_cumsum,
+            cutoffs,
+            num_blocks,
+            sim_weights(scores, weights),
+        )
+    )
+
+
+def rank_histogram(
+    scores, rows, counts, prize_cumsum, cutoffs, width, num_blocks, weights=None
+):
+    # rank_sims for the lineups in rows, approximated by bucketing scores width points wide
+    return spread_rows(
+        scores.shape[0],
+        rows,
+        *rank_histogram_blocks(
+            scores,
+            rows,
+            counts,
+            prize_cumsum,
+            cutoffs,
+            width,
+            num_blocks,
+            sim_weights(scores, weights),
+        )
+    )
+
+
+def spread_rows(num_lineups, rows, finishes, *totals):
+    # sums per-thread results for the lineups in rows into arrays over the whole field
+    full_finishes = np.zeros((finishes.shape[1], num_lineups))
+    full_finishes[:, rows] = finishes.sum(axis=0)
+    full_totals = []
+    for total in totals:
+        full_totals.append(np.zeros(num_lineups))
+        full_totals[-1][rows] = total.sum(axis=0)
+    return (full_finishes, *full_totals)
+
+
+def histogram_rank_error(scores, rows, counts, width):
+    # how far the histogram ranking puts the lineups in rows from their exact places, as the
+    # mean and largest number of entries that beat a lineup but share its bucket (and so are
+    # counted as tied with it), over the sims in scores
+    errors = []
+    for column in scores.T:
+        order = np.argsort(column)
+        entries = np.cumsum(counts[order].astype(np.int64))
+        above = (
+            entries[-1]
+            - entries[np.searchsorted(column[order], column[rows], "right") - 1]
+        )
+        # same arithmetic as the kernel, so lineups land in the same buckets
+        buckets = ((column - column.min()).astype(np.float64) * (1.0 / width)).astype(
+            np.int64
+        )
+        in_bucket = np.bincount(buckets, weights=counts)
+        bucket_above = entries[-1] - np.cumsum(in_bucket)[buckets[rows]]
+        errors.append(above - bucket_above)
+    errors = np.concatenate(errors)
+    return errors.mean(), errors.max()
+
+
+@njit(cache=True)
+def place_field(
+    column,
+    counts,
+    sorted_scores,
+    floor,
+    lineups_over,
+    entries_over,
+    lineups_at_least,
+    entries_at_least,
+):
+    # adds every lineup scoring at least floor into the place counts of rank_entry_blocks:
+    # [k] counts lineups (or entries) scoring above exactly k of our sorted scores, or at
+    # least that many. returns how many lineups scored at least floor
+    num_rows = sorted_scores.shape[0]
+    lowest = max(floor, sorted_scores[0])
+    num_at_floor = 0
+    for i in range(column.shape[0]):
+        score = column[i]
+        if score < floor:
+            continue
+        num_at_floor += 1
+        # below all of ours that matter, so it doesn't change any of their places
+        if score < lowest:
+            continue
+        lo = 0
+        hi = num_rows
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            if sorted_scores[mid] < score:
+                lo = mid + 1
+            else:
+                hi = mid
+        lineups_over[lo] += 1
+        entries_over[lo] += counts[i]
+        hi = num_rows
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            if sorted_scores[mid] <= score:
+                lo = mid + 1
+            else:
+                hi = mid
+        lineups_at_least[lo] += 1
+        entries_at_least[lo] += counts[i]
+    return num_at_floor
+
+
+@njit(parallel=True, cache=True)
+def rank_entry_blocks(scores, rows, counts, prize_cumsum, cutoffs, num_blocks, weights):
+    # for each sim only the scores of the lineups in rows are sorted, and field lineups are
+    # placed among them by binary search. suffix sums over those places give, for each of our
+    # lineups, how many lineups and entries scored higher and how many entries tied, which is
+    # all a finish or a payout needs. tied lineups split the finishes and tied entries the
+    # prizes for the places they cover, as in rank_sims.
+    # only lineups at or above the depth rank_sims would rank to can matter, so a floor for
+    # that score is guessed from a sample of the field just below the depth and
+    # everything below it skipped. the guess is good if at least depth lineups reach it,
+    # otherwise the sim is placed again without a floor
+    num_lineups, num_sims = scores.shape
+    num_paid = prize_cumsum.shape[0] - 1
+    depth = min(num_lineups, max(num_paid, cutoffs.max()))
+    block = (num_sims + num_blocks - 1) // num_blocks
+    num_rows = rows.shape[0]
+    step = max(1, num_lineups // 1024)
+    num_sampled = (num_lineups + step - 1) // step
+    # the expected place of the depth-th best in the sample, plus a margin of over four
+    # standard deviations so the floor is almost never too high
+    expected = depth * num_sampled / num_lineups
+    sample_depth = min(num_sampled, int(expected + 4 * np.sqrt(expected)) + 8)
+    finishes = np.zeros((num_blocks, cutoffs.shape[0], num_rows))
+    prize_totals = np.zeros((num_blocks, num_rows))
+    cash_totals = np.zeros((num_blocks, num_rows))
+    prize_squares = np.zeros((num_blocks, num_rows))
+    win_squares = np.zeros((num_blocks, num_rows))
+    for b in prange(num_blocks):
+        column = np.empty(num_lineups, dtype=scores.dtype)
+        sample = np.empty(num_sampled, dtype=scores.dtype)
+        ours = np.empty(num_rows, dtype=scores.dtype)
+        lineups_over = np.zeros(num_rows + 1, dtype=np.int64)
+        entries_over = np.zeros(num_rows + 1, dtype=np.int64)
+        lineups_at_least = np.zeros(num_rows + 1, dtype=np.int64)
+        entries_at_least = np.zeros(num_rows + 1, dtype=np.int64)
+        for r in range(b * block, min(num_sims, (b + 1) * block)):
+            weight = weights[r]
+            for i in range(num_lineups):
+                column[i] = scores[i, r]
+            for e in range(num_rows):
+                ours[e] = column[rows[e]]
+            order = np.argsort(ours)
+            sorted_scores = ours[order]
+            floor = -np.inf
+            if sample_depth < num_sampled:
+                for j in range(num_sampled):
+                    sample[j] = column[j * step]
+                floor = kth_largest(sample, sample_depth)
+            while True:
+                lineups_over[:] = 0
+                entries_over[:] = 0
+                lineups_at_least[:] = 0
+                entries_at_least[:] = 0
+                num_at_floor = place_field(
+                    column,
+                    counts,
+                    sorted_scores,
+                    floor,
+                    lineups_over,
+                    entries_over,
+                    lineups_at_least,
+                    entries_at_least,
+                )
+                if num_at_floor >= depth:
+                    break
+                floor = -np.inf
+            # turn the counts by place into counts above each of ours, best first
+            for k in range(num_rows - 1, -1, -1):
+                lineups_over[k] += lineups_over[k + 1]
+                entries_over[k] += entries_over[k + 1]
+                lineups_at_least[k] += lineups_at_least[k + 1]
+                entries_at_least[k] += entries_at_least[k + 1]
+            for k in range(num_rows):
+                # below the floor, so out of the finishes and the money
+                if sorted_scores[k] < floor:
+                    continue
+                e = order[k]
+                lineups_above = lineups_over[k + 1]
+                tied_lineups = lineups_at_least[k + 1] - lineups_above
+                for c in range(cutoffs.shape[0]):
+                    share = finish_share(cutoffs[c], lineups_above, tied_lineups)
+                    finishes[b, c, e] += weight * share
+                    if c == 0:
+                        win_squares[b, e] += (weight * share) ** 2
+                above = entries_over[k + 1]
+                tied = entries_at_least[k + 1] - above
+                first = min(above, num_paid)
+                last = min(above + tied, num_paid)
+                per_entry = weight * (prize_cumsum[last] - prize_cumsum[first]) / tied
+                if per_entry > 0:
+                    prize_totals[b, e] += per_entry
+                    cash_totals[b, e] += weight
+                    prize_squares[b, e] += per_entry * per_entry
+    return finishes, prize_totals, cash_totals, prize_squares, win_squares
+
+
+@njit(parallel=True, cache=True)
+def rank_histogram_blocks(
+    scores, rows, counts, prize_cumsum, cutoffs, width, num_blocks, weights
+):
+    # approximate rank_entry_blocks with no sorting at all: each sim's scores are binned into
+    # buckets width points wide, and running counts of lineups and entries over the buckets
+    # give every lineup's place in O(1). lineups sharing a bucket are treated as tied and
+    # split finishes and prizes as in rank_sims, so the place of a lineup is off by at most
+    # the other entries in its bucket
+    num_lineups, num_sims = scores.shape
+    num_paid = prize_cumsum.shape[0] - 1
+    block = (num_sims + num_blocks - 1) // num_blocks
+    num_rows = rows.shape[0]
+    finishes = np.zeros((num_blocks, cutoffs.shape[0], num_rows))
+    prize_totals = np.zeros((num_blocks, num_rows))
+    cash_totals = np.zeros((num_blocks, num_rows))
+    prize_squares = np.zeros((num_blocks, num_rows))
+    win_squares = np.zeros((num_blocks, num_rows))
+    scale = 1.0 / width
+    for b in prange(num_blocks):
+        column = np.empty(num_lineups, dtype=scores.dtype)
+        buckets = np.empty(num_lineups, dtype=np.int64)
+        for r in range(b * block, min(num_sims, (b + 1) * block)):
+            weight = weights[r]
+            for i in range(num_lineups):
+                column[i] = scores[i, r]
+            lowest = column.min()
+            num_buckets = int((column.max() - lowest) * scale) + 1
+            lineups_in = np.zeros(num_buckets, dtype=np.int64)
+            entries_in = np.zeros(num_buckets, dtype=np.int64)
+            for i in range(num_lineups):
+                k = int((column[i] - lowest) * scale)
+                buckets[i] = k
+                lineups_in[k] += 1
+                entries_in[k] += counts[i]
+            # lineups and entries in higher buckets than each one
+            lineups_above = np.empty(num_buckets, dtype=np.int64)
+            entries_above = np.empty(num_buckets, dtype=np.int64)
+            lineups_total = 0
+            entries_total = 0
+            for k in range(num_buckets - 1, -1, -1):
+                lineups_above[k] = lineups_total
+                entries_above[k] = entries_total
+                lineups_total += lineups_in[k]
+                entries_total += entries_in[k]
+            for e in range(num_rows):
+                k = buckets[rows[e]]
+                for c in range(cutoffs.shape[0]):
+                    share = finish_share(cutoffs[c], lineups_above[k], lineups_in[k])
+                    finishes[b, c, e] += weight * share
+                    if c == 0:
+                        win_squares[b, e] += (weight * share) ** 2
+                above = entries_above[k]
+                first = min(above, num_paid)
+                last = min(above + entries_in[k], num_paid)
+                per_entry = (
+                    weight * (prize_cumsum[last] - prize_cumsum[first]) / entries_in[k]
+                )
+                if per_entry > 0:
+                    prize_totals[b, e] += per_entry
+                    cash_totals[b, e] += weight
+                    prize_squares[b, e] += per_entry * per_entry
+    return finishes, prize_totals, cash_totals, prize_squares, win_squares
@@ -0,0 +1,194 @@
+import math
+
+import numpy as np
+
+# ways of drawing the standard normals behind each game's outcomes, see standard_normals
+samplers = ("mc", "antithetic", "sobol", "lhs")
+
+# factors already worked out this run, keyed by the game's stddevs and correlations
+factor_cache = {}
+
+# sims drawn from each stream when a run is sampled block by block, see sample_sims. a
+# power of two so sobol points stay balanced
+stream_sims = 1024
+
+# share of importance sampled sims drawn without a tilt. every sim's weight stays under
+# 1 / defensive_share, however badly the tilts miss what's being estimated
+defensive_share = 0.25
+
+
+def game_factor(stddevs, corr, jitter=False):
+    # returns F (players x players, float32) with F @ F.T equal to the game's covariance, with
+    # negative eigenvalues clipped to zero so an inconsistent set of correlations still gives a
+    # usable (PSD) matrix. that clipped matrix is usually singular so this is the eigen square
+    # root rather than a cholesky factor. with jitter the whole spectrum is first shifted up
+    # past the most negative eigenvalue, same as adding it to the diagonal
+    stddevs = np.asarray(stddevs, dtype=np.float64)
+    corr = np.asarray(corr, dtype=np.float64)
+    key = (stddevs.tobytes(), corr.tobytes(), jitter)
+    factor = factor_cache.get(key)
+    if factor is None:
+        # eigh only reads the lower triangle, so for one sided correlation rules each pair
+        # takes the later player's view of the earlier one
+        covariance = corr * np.outer(stddevs, stddevs)
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        if jitter and eigenvalues.min() < 0:
+            eigenvalues += abs(eigenvalues.min()) + 1e-6
+        eigenvalues[eigenvalues < 0] = 0
+        factor = (eigenvectors * np.sqrt(eigenvalues)).astype(np.float32)
+        factor_cache[key] = factor
+    return factor
+
+
+def standard_normals(rng, num_dims, num_sims, sampler="mc"):
+    # (num_dims x num_sims) float32 standard normal draws. "mc" draws them independently,
+    # "antithetic" pairs each draw with its negation, "sobol" and "lhs" map a scrambled sobol
+    # sequence or a latin hypercube through the inverse normal cdf so the sims cover each
+    # player's (and for sobol the game's joint) distribution more evenly
+    if sampler == "mc":
+        return rng.standard_normal((num_dims, num_sims), dtype=np.float32)
+    if sampler == "antithetic":
+        half = rng.standard_normal((num_dims, (num_sims + 1) // 2), dtype=np.float32)
+        return np.concatenate((half, -half), axis=1)[:, :num_sims]
+    # scipy.stats takes a while to import, only these samplers need it
+    from scipy.special import ndtri
+    from scipy.stats import qmc
+
+    if sampler == "sobol":
+        # sobol points are only balanced in powers of two, the extra ones are dropped
+        engine = qmc.Sobol(num_dims, scramble=True, seed=rng)
+        points = engine.random_base2(math.ceil(math.log2(max(num_sims, 1))))
+        points = points[:num_sims]
+    elif sampler == "lhs":
+        points = qmc.LatinHypercube(num_dims, seed=rng).random(num_sims)
+    else:
+        raise ValueError("unknown sampler {}, use one of {}".format(sampler, samplers))
+    return ndtri(points.T).astype(np.float32)
+
+
+def sample_game(out, means, factor, rng, sampler="mc", tilts=None, components=None):
+    # fills out (players x iterations) in place with correlated normal draws for one game.
+    # with tilts (one shift of the standard normals per row, see lineup_tilts) each sim is
+    # drawn shifted by the tilt its component picks, 0 being none and k tilts[k - 1], and
+    # the (tilts x sims) log likelihood ratios of every tilt are returned for
+    # mixture_weights
+    normals = standard_normals(rng, factor.shape[1], out.shape[1], sampler)
+    log_ratios = None
+    if tilts is not None:
+        tilts = np.asarray(tilts, dtype=np.float32)
+        tilted = components > 0
+        normals[:, tilted] += tilts[components[tilted] - 1].T
+        log_ratios = (tilts @ normals).astype(np.float64)
+        log_ratios -= (tilts.astype(np.float64) ** 2).sum(axis=1)[:, None] / 2
+    np.matmul(factor, normals, out=out)
+    out += np.asarray(means, dtype=np.float32)[:, None]
+    return log_ratios
+
+
+def stream_groups(first_sim, num_sims):
+    # the stream_sims groups that sims first_sim onwards fall in, as the group's number,
+    # the slice of the group they take and the slice of the block they go in
+    end = first_sim + num_sims
+    for g in range(first_sim // stream_sims, (end - 1) // stream_sims + 1):
+        start = g * stream_sims
+        lo, hi = max(first_sim, start), min(end, start + stream_sims)
+        yield g, slice(lo - start, hi - start), slice(lo - first_sim, hi - first_sim)
+
+
+def sample_sims(
+    out, means, factor, seed, first_sim, sampler="mc", tilts=None, tilt_seed=None
+):
+    # sample_game for sims first_sim onwards of a run whose length isn't known up front.
+    # they're drawn stream_sims at a time, each group from its own stream of seed, so every
+    # sim comes out the same however the run is split into blocks. with tilts, which tilt
+    # each sim takes comes from tilt_seed, the same one for every game of the slate
+    log_ratios = None if tilts is None else np.empty((len(tilts), out.shape[1]))
+    group = np.empty((out.shape[0], stream_sims), dtype=out.dtype)
+    for g, taken, block in stream_groups(first_sim, out.shape[1]):
+        rng = np.random.default_rng([seed, g])
+        components = None
+        if tilts is not None:
+            components = mixture_components(tilt_seed, g, len(tilts))
+        ratios = sample_game(group, means, factor, rng, sampler, tilts, components)
+        out[:, block] = group[:, taken]
+        if log_ratios is not None:
+            log_ratios[:, block] = ratios[:, taken]
+    return log_ratios
+
+
+def mixture_components(seed, group, num_tilts):
+    # the tilt each sim of a stream_sims group is drawn with: none for defensive_share of
+    # them, the rest spread evenly over the num_tilts tilts
+    rng = np.random.default_rng([seed, group])
+    untilted = rng.random(stream_sims) < defensive_share
+    return np.where(untilted, 0, rng.integers(1, num_tilts + 1, stream_sims))
+
+
+def lineup_tilts(factors, memberships, size):
+    # a shift of the standard normals per lineup, size standard deviations long over the
+    # whole slate in the direction that raises that lineup's score the most. since it goes
+    # through the factors, correlated players (stacks) move up together. memberships holds
+    # each game's (players x lineups) counts of its players in the lineups, and the tilts
+    # come back per game as (lineups x dims), zero for lineups with nobody in the game
+    directions = [f.T.astype(np.float64) @ m for f, m in zip(factors, memberships)]
+    norms = np.sqrt(sum((d**2).sum(axis=0) for d in directions))
+    norms[norms == 0] = 1
+    return [(size * d / norms).T for d in directions]
+
+
+def mixture_weights(game_log_ratios):
+    # likelihood ratio of each sim of the untilted distribution to the mixture it was drawn
+    # from (defensive_share untilted, the rest split evenly between the tilts), from the
+    # log likelihood ratios sample_sims returned for every game of the slate. weighting by
+    # the whole mixture rather than the one tilt a sim took keeps the weights bounded
+    game_log_ratios = [r for r in game_log_ratios if r is not None]
+    if not game_log_ratios:
+        return None
+    log_ratios = np.sum(game_log_ratios, axis=0)
+    tilted = np.log((1 - defensive_share) / len(log_ratios))
+    mixture = np.logaddexp(
+        np.log(defensive_share), tilted + np.logaddexp.reduce(log_ratios, axis=0)
+    )
+    return np.exp(-mixture)
+
+
+def sampler_speedup(means, factor, sampler, num_sims=1000, repeats=64, seed=None):
+    # equivalent-iterations speedup of sampler over plain monte carlo for one game: how many
+    # times as many "mc" sims it would take to pin down the 99th percentile of the game's
+    # total score (roughly what a top 1% stack of it has to beat) as closely. worked out
+    # from the variance of that estimate over repeated runs of num_sims sims each
+    rng = np.random.default_rng(seed)
+    out = np.empty((len(means), num_sims), dtype=np.float32)
+    variances = []
+    for name in ("mc", sampler):
+        estimates = []
+        for _ in range(repeats):
+            sample_game(out, means, factor, rng, name)
+            estimates.append(np.quantile(out.sum(axis=0), 0.99))
+        variances.append(np.var(estimates))
+    return variances[0] / variances[1]
+
+
+def correlation_rows(players, positions):
+    # compiles each player's Correlations dict into a numeric row: column p is the correlation
+    # with a teammate playing positions[p] and column len(positions) + p with an opponent there.
+    # positions a player has no entry for are uncorrelated
+    rows = np.zeros((len(players), 2 * len(positions)))
+    for i, player in enumerate(players):
+        for p, pos in enumerate(positions):
+            rows[i, p] = player["Correlations"].get(pos, 0)
+            rows[i, len(positions) + p] = player["Correlations"].get("Opp " + pos, 0)
+    return rows
+
+
+def game_correlation(rows, teams, positions):
+    # correlation matrix for a game from its players' correlation_rows and integer team and
+    # primary position codes. entry i, j is player i's correlation with player j's position,
+    # except teammates at the same position who are always -0.25
+    num_positions = rows.shape[1] // 2
+    same_team = teams[:, None] == teams[None, :]
+    cols = np.where(same_team, 0, num_positions) + positions[None, :]
+    corr = np.take_along_axis(rows, cols, axis=1)
+    corr[same_team & (positions[:, None] == positions[None, :])] = -0.25
+    np.fill_diagonal(corr, 1)
+    return corr
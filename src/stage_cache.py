@@ -0,0 +1,77 @@
+import hashlib
+import os
+import pickle
+
+from outcome_store import hash_inputs
+
+
+def file_digest(path):
+    # content hash of an input file, so touching a file without changing it still hits
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+class StageCache:
+    """Results of simulator stages pickled to disk, keyed by a hash of each stage's inputs.
+
+    A stage whose inputs (file contents, config, CLI arguments and the keys of the stages
+    it builds on) hash the same as a previous run is loaded instead of recomputed. The
+    directory is kept under `max_bytes` by evicting the least recently used files, which
+    includes any outcome store kept inside it."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, stage, inputs):
+        return "{}_{}".format(stage, hash_inputs(stage, inputs)[:24])
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".pkl")
+
+    def get(self, key):
+        try:
+            with open(self.path(key), "rb") as f:
+                value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        # last use is tracked by modification time
+        os.utime(self.path(key))
+        return value
+
+    def put(self, key, value):
+        # write to a temporary file first so an interrupted run can't leave half a pickle
+        temp_path = self.path(key) + ".tmp"
+        with open(temp_path, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.path(key))
+        self.evict(keep=self.path(key))
+
+    def evict(self, keep=None):
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
@@ -0,0 +1,20 @@
+import math
+
+# a task should take at least this long so pickling and dispatch stay a rounding error
+min_block_seconds = 0.05
+# how many blocks each worker is handed per pass over the remaining work
+blocks_per_worker = 2
+
+
+def plan_blocks(start, stop, seconds_per_item, num_workers):
+    # splits range(start, stop) into contiguous (start, stop) blocks for a pool using guided
+    # self scheduling: blocks start large and shrink as the work runs out, so the last tasks
+    # to finish are short and no core sits idle behind a straggler. seconds_per_item is the
+    # measured cost of one item and sets the smallest block worth sending
+    min_block = max(1, math.ceil(min_block_seconds / max(seconds_per_item, 1e-9)))
+    blocks = []
+    while start < stop:
+        size = max(min_block, (stop - start) // (blocks_per_worker * num_workers))
+        blocks.append((start, min(stop, start + size)))
+        start += size
+    return blocks
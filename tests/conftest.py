@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the modules live flat in src/ and import each other by name, the way main.py runs them
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
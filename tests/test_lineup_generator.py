@@ -0,0 +1,150 @@
+import numpy as np
+import pytest
+
+from bench.slates import slate_players
+from nfl_gpp_simulator import generate_lineup_block
+
+# the generator's roster order, FLEX last
+slots = ["DST", "QB", "RB", "RB", "WR", "WR", "WR", "TE", "FLEX"]
+salary_caps = {"dk": 50000, "fd": 60000}
+
+
+def slate_arrays(site, games=4, players=13, seed=0):
+    # the bench's made-up slate encoded the way fill_field_lineups does it
+    slate = slate_players(games, players, site=site, seed=seed)
+    team_codes = {t: i for i, t in enumerate(sorted({p["team"] for p in slate}))}
+    matchup_codes = {m: i for i, m in enumerate(sorted({p["game"] for p in slate}))}
+    pos_matrix = np.array(
+        [
+            [
+                p["position"] == slot
+                or (slot == "FLEX" and p["position"] in ("RB", "WR", "TE"))
+                for slot in slots
+            ]
+            for p in slate
+        ],
+        dtype=np.int8,
+    )
+    return {
+        "pos_matrix": pos_matrix,
+        "ownership": np.array([p["own"] for p in slate], dtype=np.float64),
+        "salaries": np.array([p["salary"] for p in slate], dtype=np.float64),
+        "projections": np.array([p["fpts"] for p in slate], dtype=np.float64),
+        "teams": np.array([team_codes[p["team"]] for p in slate], dtype=np.int64),
+        "opponents": np.array([team_codes[p["opp"]] for p in slate], dtype=np.int64),
+        "matchups": np.array([matchup_codes[p["game"]] for p in slate], dtype=np.int64),
+        "num_teams": len(team_codes),
+    }
+
+
+def field_plan(num_teams, num_lineups, seed=0):
+    # a third of the lineups unstacked, the rest stacking one or two pass catchers
+    rng = np.random.default_rng(seed)
+    stack_teams = rng.integers(0, num_teams, size=num_lineups)
+    stack_teams[rng.random(num_lineups) < 1 / 3] = -1
+    stack_lens = rng.integers(1, 3, size=num_lineups)
+    seeds = rng.integers(0, 2**32, size=num_lineups)
+    return seeds, stack_teams, stack_lens
+
+
+def limits(site, arrays, overlap_limit=0, max_attempts=100000):
+    salary_ceiling = salary_caps[site]
+    return (
+        arrays["num_teams"],
+        0.9 * salary_ceiling,
+        salary_ceiling,
+        # best projection in every slot, ignoring the cap, so lineups within 40% of it
+        # are a fair share of what the slate allows
+        sum(
+            arrays["projections"][arrays["pos_matrix"][:, slot] > 0].max()
+            for slot in range(len(slots))
+        ),
+        0.4,
+        overlap_limit,
+        4 if site == "fd" else 0,
+        max_attempts,
+    )
+
+
+def generate(site, arrays, seeds, stack_teams, stack_lens, **options):
+    return generate_lineup_block(
+        seeds,
+        stack_teams,
+        stack_lens,
+        arrays["pos_matrix"],
+        arrays["ownership"],
+        arrays["salaries"],
+        arrays["projections"],
+        arrays["teams"],
+        arrays["opponents"],
+        arrays["matchups"],
+        *limits(site, arrays, **options)
+    )
+
+
+@pytest.mark.parametrize("site", ["dk", "fd"])
+@pytest.mark.parametrize("overlap_limit", [0, 1])
+def test_lineups_follow_the_rules(site, overlap_limit):
+    arrays = slate_arrays(site)
+    seeds, stack_teams, stack_lens = field_plan(arrays["num_teams"], 200)
+    lineups, failed = generate(
+        site, arrays, seeds, stack_teams, stack_lens, overlap_limit=overlap_limit
+    )
+    assert failed == -1
+    (
+        _,
+        salary_floor,
+        salary_ceiling,
+        optimal_score,
+        max_pct_off_optimal,
+        _,
+        max_players_per_team,
+        _,
+    ) = limits(site, arrays)
+    pos_matrix, teams = arrays["pos_matrix"], arrays["teams"]
+    for lineup, stack_team, stack_len in zip(lineups, stack_teams, stack_lens):
+        assert len(set(lineup)) == len(slots)
+        assert all(pos_matrix[p, slot] for slot, p in enumerate(lineup))
+        salary = arrays["salaries"][lineup].sum()
+        assert salary_floor <= salary <= salary_ceiling
+        projection = arrays["projections"][lineup].sum()
+        off_optimal = max_pct_off_optimal * (1.25 if stack_team >= 0 else 1)
+        assert projection >= optimal_score * (1 - off_optimal)
+        if max_players_per_team:
+            assert np.bincount(teams[lineup]).max() <= max_players_per_team
+        assert len(set(arrays["matchups"][lineup])) > 1
+        dst, players = lineup[0], lineup[1:]
+        assert (teams[players] == arrays["opponents"][dst]).sum() <= overlap_limit
+        if stack_team >= 0:
+            assert teams[lineup[1]] == stack_team
+            assert arrays["opponents"][dst] != stack_team
+            pass_catchers = pos_matrix[players, 4:8].sum(axis=1) > 0
+            assert (pass_catchers & (teams[players] == stack_team)).sum() >= stack_len
+
+
+@pytest.mark.parametrize("block", [1, 7, 64])
+def test_lineups_ignore_block_size(block):
+    arrays = slate_arrays("dk")
+    seeds, stack_teams, stack_lens = field_plan(arrays["num_teams"], 150, seed=1)
+    whole, failed = generate("dk", arrays, seeds, stack_teams, stack_lens)
+    assert failed == -1
+    for start in range(0, len(seeds), block):
+        part = slice(start, start + block)
+        lineups, failed = generate(
+            "dk", arrays, seeds[part], stack_teams[part], stack_lens[part]
+        )
+        assert failed == -1
+        np.testing.assert_array_equal(lineups, whole[part])
+
+
+def test_gives_up_after_max_attempts():
+    arrays = slate_arrays("dk")
+    seeds, stack_teams, stack_lens = field_plan(arrays["num_teams"], 10, seed=2)
+    # a team that isn't on the slate has no qb to stack
+    stack_teams[6] = arrays["num_teams"]
+    lineups, failed = generate(
+        "dk", arrays, seeds, stack_teams, stack_lens, max_attempts=50
+    )
+    assert failed == 6
+    whole, _ = generate("dk", arrays, seeds[:6], stack_teams[:6], stack_lens[:6])
+    np.testing.assert_array_equal(lineups[:6], whole)
@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+
+from sim_kernels import histogram_rank_error, rank_entries, rank_histogram, rank_sims
+
+num_blocks = 4
+
+
+def tie_heavy_field(num_lineups, num_sims, seed=0):
+    # whole-point scores out of a few values, so most places are shared by several lineups
+    rng = np.random.default_rng(seed)
+    scores = rng.integers(0, 12, size=(num_lineups, num_sims)).astype(np.float32)
+    counts = rng.integers(1, 4, size=num_lineups).astype(np.uint32)
+    prizes = np.array([100.0, 50, 25, 10, 10, 5, 5, 5, 5, 5, 2, 2, 2, 2, 2])
+    prize_cumsum = np.concatenate(([0.0], np.cumsum(prizes)))
+    cutoffs = np.array([1, 10, max(1, num_lineups // 100)])
+    return scores, counts, prize_cumsum, cutoffs
+
+
+def reference_ranking(scores, counts, prize_cumsum, cutoffs, weights=None):
+    # full argsort of every sim, walked one group of tied lineups at a time: they split the
+    # places they cover inside each finish cutoff and the prizes of the entries they take
+    num_lineups, num_sims = scores.shape
+    num_paid = prize_cumsum.shape[0] - 1
+    if weights is None:
+        weights = np.ones(num_sims)
+    finishes = np.zeros((cutoffs.shape[0], num_lineups))
+    prizes = np.zeros(num_lineups)
+    cashes = np.zeros(num_lineups)
+    squares = np.zeros(num_lineups)
+    win_squares = np.zeros(num_lineups)
+    for r in range(num_sims):
+        column = scores[:, r]
+        order = np.argsort(-column, kind="stable")
+        above = place = 0
+        while above < num_lineups:
+            tied = order[column[order] == column[order[above]]]
+            entries = int(counts[tied].sum())
+            for c, cutoff in enumerate(cutoffs):
+                share = min(max(cutoff - above, 0), len(tied)) / len(tied)
+                finishes[c, tied] += weights[r] * share
+                if c == 0:
+                    win_squares[tied] += (weights[r] * share) ** 2
+            first, last = min(place, num_paid), min(place + entries, num_paid)
+            prize = weights[r] * (prize_cumsum[last] - prize_cumsum[first]) / entries
+            if prize > 0:
+                prizes[tied] += prize
+                cashes[tied] += weights[r]
+                squares[tied] += prize**2
+            above += len(tied)
+            place += entries
+    return finishes, prizes, cashes, squares, win_squares
+
+
+def assert_same(results, expected, rows=None):
+    for result, wanted in zip(results, expected):
+        if rows is not None:
+            result, wanted = result[..., rows], wanted[..., rows]
+        np.testing.assert_allclose(result, wanted, rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize("num_lineups", [40, 300])
+def test_rank_sims_matches_argsort_on_ties(num_lineups):
+    scores, counts, prize_cumsum, cutoffs = tie_heavy_field(num_lineups, 60)
+    expected = reference_ranking(scores, counts, prize_cumsum, cutoffs)
+    assert_same(rank_sims(scores, counts, prize_cumsum, cutoffs, num_blocks), expected)
+
+
+def test_tied_lineups_split_a_win():
+    scores = np.array([[5.0], [5.0], [3.0], [5.0]], dtype=np.float32)
+    counts = np.ones(4, dtype=np.uint32)
+    finishes = rank_sims(scores, counts, np.zeros(1), np.array([1, 2]), 1)[0]
+    np.testing.assert_allclose(finishes[0], [1 / 3, 1 / 3, 0, 1 / 3])
+    np.testing.assert_allclose(finishes[1], [2 / 3, 2 / 3, 0, 2 / 3])
+
+
+def test_rank_sims_weights():
+    scores, counts, prize_cumsum, cutoffs = tie_heavy_field(50, 30, seed=1)
+    weights = np.random.default_rng(2).uniform(0.1, 3, size=30)
+    expected = reference_ranking(scores, counts, prize_cumsum, cutoffs, weights)
+    assert_same(
+        rank_sims(scores, counts, prize_cumsum, cutoffs, num_blocks, weights), expected
+    )
+
+
+@pytest.mark.parametrize("num_lineups", [40, 3000])
+def test_entries_only_matches_full_ranking(num_lineups):
+    # with 3000 lineups the floor from the field sample is used, and must not change a thing
+    scores, counts, prize_cumsum, cutoffs = tie_heavy_field(num_lineups, 40, seed=3)
+    rows = np.sort(np.random.default_rng(4).choice(num_lineups, size=25, replace=False))
+    full = rank_sims(scores, counts, prize_cumsum, cutoffs, num_blocks)
+    entries = rank_entries(scores, rows, counts, prize_cumsum, cutoffs, num_blocks)
+    assert_same(entries, full, rows)
+    others = np.setdiff1d(np.arange(num_lineups), rows)
+    for result in entries:
+        assert not result[..., others].any()
+
+
+@pytest.mark.parametrize("whole_points", [True, False])
+def test_fine_histogram_matches_exact_ranking(whole_points):
+    # buckets narrower than the gap between any two different scores rank exactly
+    scores, counts, prize_cumsum, cutoffs = tie_heavy_field(300, 40, seed=5)
+    if not whole_points:
+        scores += (
+            np.random.default_rng(6).uniform(0, 1, scores.shape).astype(np.float32)
+        )
+    rows = np.arange(0, 300, 7)
+    exact = rank_entries(scores, rows, counts, prize_cumsum, cutoffs, num_blocks)
+    histogram = rank_histogram(
+        scores, rows, counts, prize_cumsum, cutoffs, 1e-5, num_blocks
+    )
+    assert histogram_rank_error(scores, rows, counts, 1e-5)[1] == 0
+    assert_same(histogram, exact, rows)
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from sim_kernels import rank_sims
+from sim_sampling import (
+    defensive_share,
+    game_factor,
+    lineup_tilts,
+    mixture_weights,
+    sample_sims,
+    stream_sims,
+)
+
+
+def small_game(num_players=6, seed=0):
+    rng = np.random.default_rng(seed)
+    corr = np.full((num_players, num_players), 0.2)
+    np.fill_diagonal(corr, 1)
+    return rng.uniform(5, 20, num_players), game_factor(
+        rng.uniform(2, 8, num_players), corr
+    )
+
+
+@pytest.mark.parametrize("sampler", ["mc", "antithetic", "sobol"])
+@pytest.mark.parametrize("block", [700, stream_sims, 2500])
+def test_sample_sims_ignores_block_size(sampler, block):
+    means, factor = small_game()
+    tilts = np.linspace(0.1, 0.3, 2 * factor.shape[1]).reshape(2, -1)
+    num_sims = 3000
+    whole = np.empty((len(means), num_sims), dtype=np.float32)
+    whole_ratios = sample_sims(whole, means, factor, 7, 0, sampler, tilts, 8)
+    for first in range(0, num_sims, block):
+        out = np.empty((len(means), min(block, num_sims - first)), dtype=np.float32)
+        ratios = sample_sims(out, means, factor, 7, first, sampler, tilts, 8)
+        np.testing.assert_array_equal(out, whole[:, first : first + out.shape[1]])
+        np.testing.assert_array_equal(
+            ratios, whole_ratios[:, first : first + out.shape[1]]
+        )
+
+
+def small_slate(num_games=3, players_per_game=10, num_lineups=100):
+    # a few games and a field of random six player lineups over them, sorted by projection
+    games = [small_game(players_per_game, seed) for seed in range(num_games)]
+    rng = np.random.default_rng(num_games)
+    num_players = num_games * players_per_game
+    field = np.array(
+        [rng.choice(num_players, 6, replace=False) for _ in range(num_lineups)]
+    )
+    means = np.concatenate([game[0] for game in games])
+    return games, field[np.argsort(-means[field].sum(axis=1))]
+
+
+def win_rates(games, field, tracked, size, seed, num_sims=2000):
+    # win rates of the tracked lineups over num_sims sims, importance sampled towards each
+    # of them beating the average lineup unless size is None
+    tilts = [None] * len(games)
+    if size is not None:
+        memberships = np.zeros((field.max() + 1, len(tracked)))
+        np.add.at(memberships, (field[tracked].T, np.arange(len(tracked))), 1)
+        memberships -= np.bincount(field.ravel())[:, None] / len(field)
+        tilts = lineup_tilts(
+            [factor for _, factor in games],
+            np.split(memberships, len(games)),
+            size,
+        )
+    outcomes = []
+    log_ratios = []
+    for g, ((means, factor), tilt) in enumerate(zip(games, tilts)):
+        out = np.empty((len(means), num_sims), dtype=np.float32)
+        log_ratios.append(
+            sample_sims(out, means, factor, [seed, g], 0, "mc", tilt, [seed, 99])
+        )
+        outcomes.append(out)
+    scores = np.concatenate(outcomes)[field].sum(axis=1)
+    counts = np.ones(len(field), dtype=np.uint32)
+    weights = mixture_weights(log_ratios)
+    finishes = rank_sims(scores, counts, np.zeros(1), np.array([1]), 4, weights)[0]
+    return finishes[0, tracked] / num_sims, weights
+
+
+def test_importance_sampling_lowers_variance():
+    # a lineup that wins about 1 sim in 300, over repeated runs: the importance sampled
+    # win rate agrees with plain sims' and varies far less from run to run
+    games, field = small_slate()
+    tracked = [40]
+    plain = [win_rates(games, field, tracked, None, seed)[0] for seed in range(30)]
+    tilted = [win_rates(games, field, tracked, 1.5, seed)[0] for seed in range(30)]
+    plain, tilted = np.concatenate(plain), np.concatenate(tilted)
+    error = np.sqrt(plain.var() / len(plain) + tilted.var() / len(tilted))
+    assert abs(plain.mean() - tilted.mean()) < 4 * error
+    assert tilted.var() < plain.var() / 4
+
+
+def test_mixture_weights_are_bounded():
+    # many tilts at once can't blow the weights up, and they still average one
+    games, field = small_slate()
+    _, weights = win_rates(games, field, np.arange(0, 100, 4), 3, seed=0)
+    assert weights.max() <= 1 / defensive_share
+    assert abs(weights.mean() - 1) < 0.05